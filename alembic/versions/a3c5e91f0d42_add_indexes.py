@@ -0,0 +1,67 @@
+"""add_indexes
+
+Revision ID: a3c5e91f0d42
+Revises: 75f6120146e5
+Create Date: 2026-10-17 10:12:41.204519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c5e91f0d42'
+down_revision: Union[str, None] = '75f6120146e5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Duplicated likes would break the unique index below
+    op.execute('DELETE FROM likes a USING likes b '
+               'WHERE a.id > b.id AND a."user_UUID" = b."user_UUID" AND a.post_id = b.post_id')
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        # Feed: ORDER BY likes DESC, created_at DESC, id DESC
+        op.create_index('ix_posts_likes_created_at_id', 'posts',
+                        [sa.text('likes DESC'), sa.text('created_at DESC'), sa.text('id DESC')],
+                        postgresql_concurrently=True)
+        # My posts: WHERE owner_UUID = ... ORDER BY likes DESC, created_at DESC, id DESC
+        op.create_index('ix_posts_owner_UUID_likes_created_at_id', 'posts',
+                        ['owner_UUID', sa.text('likes DESC'), sa.text('created_at DESC'), sa.text('id DESC')],
+                        postgresql_concurrently=True)
+        # Author posts: WHERE owner_username = ... ORDER BY likes DESC, created_at DESC, id DESC
+        op.create_index('ix_posts_owner_username_likes_created_at_id', 'posts',
+                        ['owner_username', sa.text('likes DESC'), sa.text('created_at DESC'), sa.text('id DESC')],
+                        postgresql_concurrently=True)
+        # Like toggling: WHERE user_UUID = ... AND post_id = ...
+        op.create_index('uq_likes_user_UUID_post_id', 'likes', ['user_UUID', 'post_id'],
+                        unique=True, postgresql_concurrently=True)
+        # Post deletion: WHERE post_id = ...
+        op.create_index('ix_likes_post_id', 'likes', ['post_id'],
+                        postgresql_concurrently=True)
+        # Moderators/admins listing: WHERE role = ... ORDER BY likes DESC
+        op.create_index('ix_users_role_likes', 'users', ['role', sa.text('likes DESC')],
+                        postgresql_concurrently=True)
+        # Authors listing: ORDER BY likes DESC
+        op.create_index('ix_users_likes', 'users', [sa.text('likes DESC')],
+                        postgresql_concurrently=True)
+
+    op.execute('ALTER TABLE likes ADD CONSTRAINT "uq_likes_user_UUID_post_id" '
+               'UNIQUE USING INDEX "uq_likes_user_UUID_post_id"')
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_likes_user_UUID_post_id', 'likes', type_='unique')
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_likes', table_name='users', postgresql_concurrently=True)
+        op.drop_index('ix_users_role_likes', table_name='users', postgresql_concurrently=True)
+        op.drop_index('ix_likes_post_id', table_name='likes', postgresql_concurrently=True)
+        op.drop_index('ix_posts_owner_username_likes_created_at_id', table_name='posts',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_posts_owner_UUID_likes_created_at_id', table_name='posts',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_posts_likes_created_at_id', table_name='posts', postgresql_concurrently=True)
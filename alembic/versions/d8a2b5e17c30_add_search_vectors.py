@@ -0,0 +1,54 @@
+"""add_search_vectors
+
+Revision ID: d8a2b5e17c30
+Revises: c4f1a7d29e6b
+Create Date: 2026-10-17 16:21:09.731842
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8a2b5e17c30'
+down_revision: Union[str, None] = 'c4f1a7d29e6b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    # Stored generated columns (rewrites both tables once)
+    op.add_column('posts', sa.Column('search_vector', postgresql.TSVECTOR(),
+                                     sa.Computed("to_tsvector('simple', title)", persisted=True)))
+    op.add_column('users', sa.Column('search_vector', postgresql.TSVECTOR(),
+                                     sa.Computed("to_tsvector('simple', username)", persisted=True)))
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        # Search: WHERE search_vector @@ to_tsquery('simple', 'word:* & ...')
+        op.create_index('ix_posts_search_vector', 'posts', ['search_vector'],
+                        postgresql_using='gin', postgresql_concurrently=True)
+        op.create_index('ix_users_search_vector', 'users', ['search_vector'],
+                        postgresql_using='gin', postgresql_concurrently=True)
+        # Search: WHERE title/username ILIKE '%...%'
+        op.create_index('ix_posts_title_trgm', 'posts', ['title'],
+                        postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'},
+                        postgresql_concurrently=True)
+        op.create_index('ix_users_username_trgm', 'users', ['username'],
+                        postgresql_using='gin', postgresql_ops={'username': 'gin_trgm_ops'},
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_username_trgm', table_name='users', postgresql_concurrently=True)
+        op.drop_index('ix_posts_title_trgm', table_name='posts', postgresql_concurrently=True)
+        op.drop_index('ix_users_search_vector', table_name='users', postgresql_concurrently=True)
+        op.drop_index('ix_posts_search_vector', table_name='posts', postgresql_concurrently=True)
+    op.drop_column('users', 'search_vector')
+    op.drop_column('posts', 'search_vector')
@@ -19,16 +19,35 @@ class Config:
     #############################
 
     postgres_url =\
-        f'postgresql+asyncpg://{__db_user}:{__db_pass}@{__db_host}:{__db_port}/{__db_name}?async_fallback=True'
+        f'postgresql+asyncpg://{__db_user}:{__db_pass}@{__db_host}:{__db_port}/{__db_name}'
+
+    # Connection pool of every process
+    db_pool_size = int(getenv('DB_POOL_SIZE'))
+    db_max_overflow = int(getenv('DB_MAX_OVERFLOW'))
+    db_pool_timeout_seconds = int(getenv('DB_POOL_TIMEOUT_SECONDS'))
+    db_pool_pre_ping = bool(int(getenv('DB_POOL_PRE_PING')))
+    db_pool_recycle_seconds = int(getenv('DB_POOL_RECYCLE_SECONDS'))
+    db_statement_cache_size = int(getenv('DB_STATEMENT_CACHE_SIZE'))
 
     jwt_secret = getenv('JWT_SECRET')
     jwt_algorithm = getenv('JWT_ALGORITHM')
+    # jose|pyjwt
+    jwt_backend = getenv('JWT_BACKEND')
+    # Verified tokens kept per process until their exp, 0 - verify every request
+    jwt_cache_size = int(getenv('JWT_CACHE_SIZE'))
     mail_token_expire_seconds = int(getenv('MAIL_TOKEN_EXPIRE_SECONDS'))
     access_token_expire_minutes = int(getenv('ACCESS_TOKEN_EXPIRE_MINUTES'))
     refresh_token_expire_days = int(getenv('REFRESH_TOKEN_EXPIRE_DAYS'))
 
     master_key = getenv('MASTER_KEY')
 
+    # bcrypt|argon2, rounds: bcrypt log2 rounds or argon2 time cost, target ms > 0 calibrates rounds at startup
+    password_hash_scheme = getenv('PASSWORD_HASH_SCHEME')
+    password_hash_rounds = int(getenv('PASSWORD_HASH_ROUNDS'))
+    password_hash_target_ms = int(getenv('PASSWORD_HASH_TARGET_MS'))
+    password_hash_workers = int(getenv('PASSWORD_HASH_WORKERS'))
+    password_hash_queue_timeout_ms = int(getenv('PASSWORD_HASH_QUEUE_TIMEOUT_MS'))
+
     retention_time_days = getenv('RETENTION_TIME_DAYS')
     rotation_size = getenv('ROTATION_SIZE')
 
@@ -42,7 +61,33 @@ class Config:
         MAIL_SSL_TLS=bool(int(getenv('SMTP_SSL')))
     )
 
+    email_batch_size = int(getenv('EMAIL_BATCH_SIZE'))
+    email_max_attempts = int(getenv('EMAIL_MAX_ATTEMPTS'))
+    email_retry_backoff_seconds = int(getenv('EMAIL_RETRY_BACKOFF_SECONDS'))
+
     redis_host = getenv('REDIS_HOST')
     redis_port = int(getenv('REDIS_PORT'))
 
+    feed_cache_ttl_seconds = int(getenv('FEED_CACHE_TTL_SECONDS'))
+    post_cache_ttl_seconds = int(getenv('POST_CACHE_TTL_SECONDS'))
+    suggest_cache_ttl_seconds = int(getenv('SUGGEST_CACHE_TTL_SECONDS'))
+    search_cache_ttl_seconds = int(getenv('SEARCH_CACHE_TTL_SECONDS'))
+
+    user_cache_ttl_seconds = int(getenv('USER_CACHE_TTL_SECONDS'))
+    user_cache_local_ttl_seconds = int(getenv('USER_CACHE_LOCAL_TTL_SECONDS'))
+    user_cache_size = int(getenv('USER_CACHE_SIZE'))
+
+    likes_write_behind = bool(int(getenv('LIKES_WRITE_BEHIND')))
+    likes_flush_interval_ms = int(getenv('LIKES_FLUSH_INTERVAL_MS'))
+
+    search_indexer_batch_size = int(getenv('SEARCH_INDEXER_BATCH_SIZE'))
+    search_indexer_interval_ms = int(getenv('SEARCH_INDEXER_INTERVAL_MS'))
+
+    # elasticsearch|postgres|memory, with postgres or memory elasticsearch is not used at all
+    search_backend = getenv('SEARCH_BACKEND')
+    search_failover = bool(int(getenv('SEARCH_FAILOVER')))
+    elasticsearch_enabled = search_backend == 'elasticsearch'
+    # Changes are queued in the search outbox for elasticsearch or the in-memory indexes of every process
+    search_outbox_enabled = search_backend in ('elasticsearch', 'memory')
+
     elasticsearch_url = f'http://{__es_host}:{__es_port}'
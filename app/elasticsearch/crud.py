@@ -0,0 +1,103 @@
+from elasticsearch import NotFoundError
+from fastapi import HTTPException
+from starlette.status import HTTP_400_BAD_REQUEST
+
+from app.elasticsearch.url import elastic
+
+# index.max_result_window: from + size can not go deeper than this
+MAX_RESULT_WINDOW = 10000
+PIT_KEEP_ALIVE = '1m'
+
+
+async def search_page(index: str,
+                      query: dict,
+                      offset: int,
+                      limit: int):
+    """ Shallow page of hits in relevance order with from/size """
+    if offset + limit > MAX_RESULT_WINDOW:
+        raise HTTPException(
+            status_code=HTTP_400_BAD_REQUEST,
+            detail='Page is too deep, use cursor pagination'
+        )
+    response = await elastic.search(index=index, query=query, from_=offset, size=limit)
+    return response['hits']['hits']
+
+
+async def search_page_after(index: str,
+                            query: dict,
+                            limit: int,
+                            cursor: list):
+    """ Deep page of hits in relevance order with search_after over a point in time.
+    cursor is [] for the first page, else [pit_id, sort values of the last hit].
+    Returns hits and the cursor of the next page (None after the last page) """
+    if cursor:
+        if len(cursor) != 2 or not isinstance(cursor[0], str) or not isinstance(cursor[1], list):
+            raise HTTPException(
+                status_code=HTTP_400_BAD_REQUEST,
+                detail='Invalid cursor'
+            )
+        pit_id, search_after = cursor
+    else:
+        pit = await elastic.open_point_in_time(index=index, keep_alive=PIT_KEEP_ALIVE)
+        pit_id, search_after = pit['id'], None
+
+    try:
+        response = await elastic.search(query=query,
+                                        size=limit,
+                                        pit={'id': pit_id, 'keep_alive': PIT_KEEP_ALIVE},
+                                        sort=[{'_score': 'desc'}],
+                                        search_after=search_after)
+    except NotFoundError:
+        raise HTTPException(
+            status_code=HTTP_400_BAD_REQUEST,
+            detail='Cursor has expired'
+        )
+    hits = response['hits']['hits']
+
+    if len(hits) < limit:
+        await elastic.close_point_in_time(id=response['pit_id'])
+        return hits, None
+    return hits, [response['pit_id'], hits[-1]['sort']]
+
+
+async def suggest(index: str,
+                  field: str,
+                  prefix: str,
+                  limit: int):
+    """ Type-ahead hits whose field starts with prefix, only field is returned from _source """
+    response = await elastic.search(
+        index=index,
+        query={
+            "multi_match": {
+                "query": prefix,
+                "type": "bool_prefix",
+                "fields": [f'{field}.suggest', f'{field}.suggest._2gram', f'{field}.suggest._3gram']
+            }
+        },
+        size=limit,
+        source_includes=[field]
+    )
+    return response['hits']['hits']
+
+
+async def bulk(actions: list[tuple[str, str, str, dict | None]],
+               refresh: str | None = None):
+    """ Apply actions (action, index, document id, body) in order with one _bulk request.
+    action is 'index' (body: document), 'update' (body: fields) or 'delete' (no body).
+    Updates and deletes of missing documents are skipped """
+    operations = []
+    for action, index, document_id, body in actions:
+        operations.append({action: {"_index": index, "_id": document_id}})
+        if action == 'index':
+            operations.append(body)
+        elif action == 'update':
+            operations.append({"doc": body})
+    if not operations:
+        return
+
+    response = await elastic.bulk(operations=operations, refresh=refresh)
+    if response['errors']:
+        for item in response['items']:
+            (action, result), = item.items()
+            if 'error' in result and not (action != 'index' and result['status'] == 404):
+                raise RuntimeError(f'Bulk {action} of {result["_index"]}/{result["_id"]} failed: {result["error"]}')
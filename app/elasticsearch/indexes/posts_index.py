@@ -6,13 +6,19 @@ posts_index = {
                   "type": "custom",
                   "tokenizer": "standard",
                   "filter": ["lowercase", "edge_ngram_filter"]
+                },
+                "search_analyzer": {
+                  "type": "custom",
+                  "tokenizer": "standard",
+                  "filter": ["lowercase"]
                 }
               },
               "filter": {
                 "edge_ngram_filter": {
                   "type": "edge_ngram",
                   "min_gram": 2,
-                  "max_gram": 10
+                  "max_gram": 10,
+                  "preserve_original": True
                 }
               }
             }
@@ -30,11 +36,27 @@ posts_index = {
                 "title": {
                     "type": "text",
                     "analyzer": "custom_analyzer",
+                    "search_analyzer": "search_analyzer",
                     "fields": {
                         "keyword": {
                             "type": "keyword"
+                        },
+                        "suggest": {
+                            "type": "search_as_you_type"
                         }
                     }
+                },
+                "owner_UUID": {
+                    "type": "keyword"
+                },
+                "owner_username": {
+                    "type": "keyword"
+                },
+                "created_at": {
+                    "type": "date"
+                },
+                "likes": {
+                    "type": "integer"
                 }
             }
         }
@@ -6,13 +6,19 @@ users_index = {
                   "type": "custom",
                   "tokenizer": "standard",
                   "filter": ["lowercase", "edge_ngram_filter"]
+                },
+                "search_analyzer": {
+                  "type": "custom",
+                  "tokenizer": "standard",
+                  "filter": ["lowercase"]
                 }
               },
               "filter": {
                 "edge_ngram_filter": {
                   "type": "edge_ngram",
                   "min_gram": 2,
-                  "max_gram": 10
+                  "max_gram": 10,
+                  "preserve_original": True
                 }
               }
             }
@@ -22,11 +28,22 @@ users_index = {
                 "username": {
                     "type": "text",
                     "analyzer": "custom_analyzer",
+                    "search_analyzer": "search_analyzer",
                     "fields": {
                         "keyword": {
                             "type": "keyword"
+                        },
+                        "suggest": {
+                            "type": "search_as_you_type"
                         }
                     }
+                },
+                "about_me": {
+                    "type": "text",
+                    "index": False
+                },
+                "likes": {
+                    "type": "integer"
                 }
             }
         }
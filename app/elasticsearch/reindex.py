@@ -0,0 +1,177 @@
+import asyncio
+from argparse import ArgumentParser
+from time import perf_counter
+
+from fastapi.encoders import jsonable_encoder
+from loguru import logger
+from sqlalchemy import select, func
+
+from app.elasticsearch.crud import bulk
+from app.elasticsearch.indexes.posts_index import posts_index
+from app.elasticsearch.indexes.users_index import users_index
+from app.elasticsearch.url import elastic
+from app.postgres.crud import SEARCH_OUTBOX_LOCK
+from app.postgres.engine import async_engine, async_session
+from app.postgres.tables import Post, User
+from app.redis.cache import bump_search_generation
+from app.redis.engine import create_redis
+from app.schemas import posts, users
+
+
+def post_document(post: Post) -> dict:
+    return posts.ElasticPost(id=post.id, owner_UUID=post.owner_UUID, owner_username=post.owner_username,
+                             title=post.title, created_at=post.created_at, likes=post.likes).dict()
+
+
+def user_document(user: User) -> dict:
+    return users.ElasticUser(username=user.username, about_me=user.about_me, likes=user.likes).dict()
+
+
+# Alias -> (index body, table, key used as document id, document of a row)
+INDEXES = {
+    'posts': (posts_index, Post, 'id', post_document),
+    'users': (users_index, User, 'UUID', user_document),
+}
+
+
+async def next_version(alias: str) -> str:
+    """ Name of the next versioned index behind alias: posts -> posts_v1, posts_v2, ... """
+    existing = await elastic.indices.get(index=f'{alias}_v*', allow_no_indices=True, expand_wildcards='all')
+    versions = [int(name.rsplit('_v', 1)[1]) for name in existing if name.rsplit('_v', 1)[1].isdigit()]
+    return f'{alias}_v{max(versions, default=0) + 1}'
+
+
+async def swap_alias(alias: str,
+                     index: str) -> list[str]:
+    """ Point alias to index in one atomic request, returns the indexes it pointed to before.
+    A concrete index named like the alias (created before aliases were used) is dropped in the same request """
+    actions = [{"add": {"index": index, "alias": alias}}]
+    previous = []
+    if await elastic.indices.exists_alias(name=alias):
+        previous = list(await elastic.indices.get_alias(name=alias))
+        actions += [{"remove": {"index": old, "alias": alias}} for old in previous]
+    elif await elastic.indices.exists(index=alias):
+        actions.append({"remove_index": {"index": alias}})
+    await elastic.indices.update_aliases(actions=actions)
+
+    # Dropping cached search pages of the old index in redis
+    redis = create_redis()
+    try:
+        await bump_search_generation(redis=redis, indexes={alias})
+    finally:
+        await redis.aclose()
+    return previous
+
+
+async def index_exists(alias: str) -> bool:
+    """ Alias or a concrete index with its name exists """
+    return bool(await elastic.indices.exists(index=alias))
+
+
+async def create_index(alias: str) -> str:
+    """ Create an empty versioned index and point alias to it """
+    body, *_ = INDEXES[alias]
+    index = await next_version(alias)
+    await elastic.indices.create(index=index, **body)
+    await swap_alias(alias=alias, index=index)
+    return index
+
+
+async def produce(queue: asyncio.Queue,
+                  index: str,
+                  table,
+                  key: str,
+                  to_document,
+                  batch_size: int,
+                  workers: int):
+    """ Stream rows with a server side cursor and put batches of bulk actions to the queue """
+    db = async_session()
+    try:
+        rows = await db.stream_scalars(select(table).execution_options(yield_per=batch_size))
+        async for batch in rows.partitions():
+            await queue.put([('index', index, str(getattr(row, key)), jsonable_encoder(to_document(row)))
+                             for row in batch])
+    finally:
+        await db.close()
+    # End of rows for every worker
+    for _ in range(workers):
+        await queue.put(None)
+
+
+async def consume(queue: asyncio.Queue,
+                  progress: list[int]):
+    while (actions := await queue.get()) is not None:
+        await bulk(actions=actions)
+        progress[0] += len(actions)
+
+
+async def reindex(alias: str,
+                  workers: int = 4,
+                  batch_size: int = 1000) -> dict:
+    """ Build a new version of the index from postgres with concurrent bulk workers and swap the alias to it.
+    The search indexer is paused by its advisory lock meanwhile and applies changes made during the run
+    to the new index after the swap """
+    # Without workers the new index would stay empty and still replace the old one
+    if workers < 1 or batch_size < 1:
+        raise ValueError('workers and batch_size must be at least 1')
+    body, table, key, to_document = INDEXES[alias]
+    started = perf_counter()
+    progress = [0]
+
+    async with async_engine.connect() as connection:
+        await connection.execute(select(func.pg_advisory_lock(SEARCH_OUTBOX_LOCK)))
+        try:
+            index = await next_version(alias)
+            await elastic.indices.create(index=index, **body)
+            # No refreshes while loading
+            await elastic.indices.put_settings(index=index, settings={"index": {"refresh_interval": "-1"}})
+            try:
+                queue = asyncio.Queue(maxsize=workers * 2)
+                # A failed worker cancels the others
+                async with asyncio.TaskGroup() as group:
+                    group.create_task(produce(queue=queue, index=index, table=table, key=key,
+                                              to_document=to_document, batch_size=batch_size, workers=workers))
+                    for _ in range(workers):
+                        group.create_task(consume(queue=queue, progress=progress))
+            except BaseException:
+                await elastic.indices.delete(index=index)
+                raise
+            await elastic.indices.put_settings(index=index, settings={"index": {"refresh_interval": None}})
+            await elastic.indices.refresh(index=index)
+
+            previous = await swap_alias(alias=alias, index=index)
+            for old in previous:
+                await elastic.indices.delete(index=old)
+        finally:
+            await connection.execute(select(func.pg_advisory_unlock(SEARCH_OUTBOX_LOCK)))
+
+    seconds = perf_counter() - started
+    stats = {'index': index, 'documents': progress[0], 'seconds': round(seconds, 2),
+             'documents_per_second': round(progress[0] / seconds) if seconds else 0}
+    logger.info(f'Reindexed {alias}: {stats}')
+    return stats
+
+
+async def main():
+    parser = ArgumentParser(description='Rebuild elasticsearch indexes from postgres without downtime')
+    parser.add_argument('aliases', nargs='*', help=f'any of {", ".join(INDEXES)} (default: all)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+    if unknown := set(args.aliases) - set(INDEXES):
+        parser.error(f'unknown indexes: {", ".join(unknown)}')
+    if args.workers < 1 or args.batch_size < 1:
+        parser.error('--workers and --batch-size must be at least 1')
+
+    try:
+        for alias in args.aliases or INDEXES:
+            stats = await reindex(alias=alias, workers=args.workers, batch_size=args.batch_size)
+            print(f'{alias} -> {stats["index"]}: {stats["documents"]} documents in {stats["seconds"]}s'
+                  f' ({stats["documents_per_second"]} docs/sec)')
+    finally:
+        await elastic.close()
+
+
+if __name__ == '__main__':
+    # python -m app.elasticsearch.reindex [posts] [users] [--workers 4] [--batch-size 1000]
+    asyncio.run(main())
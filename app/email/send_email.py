@@ -1,29 +1,22 @@
-from fastapi_mail import MessageSchema, MessageType, FastMail
-
-from app.config import Config
+from app.redis.emails import enqueue_email
+from app.redis.engine import redis
 from app.schemas import users
 
+# Emails are queued in redis and sent by app.workers.email_sender, so requests do not wait for smtp
+
 
 async def send_email_code(mail: users.EmailSchema,
                           email_code: int,
                           body: str):
-    message = MessageSchema(
-        subject="NAMELESS PROJECT",
-        recipients=mail.dict().get("email"),
-        body=body + str(email_code),
-        subtype=MessageType.html)
-
-    fm = FastMail(Config.mail_conf)
-    await fm.send_message(message)
+    await enqueue_email(redis=redis,
+                        recipients=mail.dict().get("email"),
+                        subject="NAMELESS PROJECT",
+                        body=body + str(email_code))
 
 
 async def send_email_info(mail: users.EmailSchema,
                           body: str):
-    message = MessageSchema(
-        subject="NAMELESS PROJECT",
-        recipients=mail.dict().get("email"),
-        body=body,
-        subtype=MessageType.html)
-
-    fm = FastMail(Config.mail_conf)
-    await fm.send_message(message)
\ No newline at end of file
+    await enqueue_email(redis=redis,
+                        recipients=mail.dict().get("email"),
+                        subject="NAMELESS PROJECT",
+                        body=body)
@@ -1,14 +1,43 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
+from app.config import Config
 from app.routers.auth import router as auth_router
 from app.routers.account import router as account_router
 from app.routers.posts import router as posts_router
 from app.routers.authors import router as authors_router
 from app.routers.moderator import router as moderator_router
 from app.routers.admin import router as admin_router
+from app.routers.search import router as search_router
+from app.search.engine import search_backend
+from app.security.password import configure_password_hashing
+from app.security.user_cache import run_user_cache_invalidation
+from app.workers.email_sender import run_email_sender
+from app.workers.likes_flusher import run_likes_flusher
+from app.workers.search_indexer import run_search_indexer
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Cost of password hashes, calibrated to PASSWORD_HASH_TARGET_MS if set
+    await configure_password_hashing()
+    # Background workers of this process
+    workers = [asyncio.create_task(run_likes_flusher()),
+               asyncio.create_task(run_email_sender()),
+               asyncio.create_task(run_user_cache_invalidation())]
+    if Config.search_outbox_enabled:
+        workers.append(asyncio.create_task(run_search_indexer()))
+    await search_backend.start()
+    yield
+    await search_backend.stop()
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 
 app.include_router(
@@ -46,3 +75,9 @@ app.include_router(
     prefix='/admin',
     tags=["Admin"]
 )
+
+app.include_router(
+    router=search_router,
+    prefix='/search',
+    tags=["Search"]
+)
@@ -1,8 +1,14 @@
-from sqlalchemy import select, or_, desc
+from datetime import datetime
+
+from sqlalchemy import select, or_, desc, tuple_, delete, update, exists, literal, func, true, values, column, Integer
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.encoders import jsonable_encoder
 from pydantic import UUID4
 
+from app.config import Config
 from app.postgres.engine import async_session
-from app.postgres.tables import User, Post
+from app.postgres.tables import User, Post, Like, LikeDelta, SearchOutbox
 
 
 async def get_user_by_email_or_username(email_or_username: str):
@@ -24,15 +30,39 @@ async def get_user_by_id(user_id: UUID4):
         await db.close()
 
 
+async def update_password_hash(user_id: UUID4,
+                               old_hash: str,
+                               new_hash: str):
+    """ Replace a stale password hash, unless the password was changed meanwhile """
+    db = async_session()
+    try:
+        await db.execute(update(User)
+                         .where(User.UUID == user_id, User.hashed_password == old_hash)
+                         .values(hashed_password=new_hash))
+        await db.commit()
+    finally:
+        await db.close()
+
+
+def posts_page(query,
+               offset: int,
+               limit: int,
+               after: tuple[int, datetime, int] | None = None):
+    """ Order posts for a feed page: by offset, or by keyset when the (likes, created_at, id) of the
+    previous page's last post is given, so deep pages cost the same as the first one """
+    query = query.order_by(desc(Post.likes), desc(Post.created_at), desc(Post.id))
+    if after is not None:
+        return query.where(tuple_(Post.likes, Post.created_at, Post.id) < after).limit(limit)
+    return query.offset(offset).limit(limit)
+
+
 async def get_posts_without_search_query(offset: int,
-                                         limit: int):
+                                         limit: int,
+                                         after: tuple[int, datetime, int] | None = None):
     db = async_session()
     try:
         result = await db.execute(
-            select(Post)
-            .order_by(desc(Post.likes), desc(Post.created_at))
-            .offset(offset * 10)
-            .limit(limit)
+            posts_page(select(Post), offset=offset * 10, limit=limit, after=after)
         )
         return result
     finally:
@@ -41,34 +71,25 @@ async def get_posts_without_search_query(offset: int,
 
 async def get_posts_user(user_id: UUID4,
                          offset: int,
-                         limit: int):
+                         limit: int,
+                         after: tuple[int, datetime, int] | None = None):
     db = async_session()
     try:
         result = await db.execute(
-            select(Post)
-            .where(Post.owner_UUID == user_id)
-            .order_by(desc(Post.likes), desc(Post.created_at))
-            .offset(offset * 10)
-            .limit(limit)
+            posts_page(select(Post).where(Post.owner_UUID == user_id), offset=offset * 10, limit=limit, after=after)
         )
         return result
     finally:
         await db.close()
 
 
-async def get_posts_by_ids(ids: list,
-                           offset: int,
-                           limit: int):
+async def get_posts_by_ids(ids: list):
+    """ Posts in the order of ids (e.g. redis ranking order) """
     db = async_session()
     try:
-        result = await db.execute(
-            select(Post)
-            .where(Post.id.in_(ids))
-            .order_by(desc(Post.likes), desc(Post.created_at))
-            .offset(offset)
-            .limit(limit)
-        )
-        return result
+        result = await db.scalars(select(Post).where(Post.id.in_(ids)))
+        posts = {post.id: post for post in result.all()}
+        return [posts[post_id] for post_id in ids if post_id in posts]
     finally:
         await db.close()
 
@@ -84,32 +105,13 @@ async def get_posts_by_user_id(user_UUID: UUID4):
 
 async def get_posts_by_username(username: str,
                                 offset: int,
-                                limit: int):
+                                limit: int,
+                                after: tuple[int, datetime, int] | None = None):
     db = async_session()
     try:
         result = await db.execute(
-            select(Post)
-            .where(Post.owner_username == username)
-            .order_by(desc(Post.likes))
-            .offset(offset)
-            .limit(limit)
-        )
-        return result
-    finally:
-        await db.close()
-
-
-async def get_users_by_usernames(usernames: list,
-                                 offset: int,
-                                 limit: int):
-    db = async_session()
-    try:
-        result = await db.execute(
-            select(User)
-            .where(User.username.in_(usernames))
-            .order_by(desc(User.likes))
-            .offset(offset)
-            .limit(limit)
+            posts_page(select(Post).where(Post.owner_username == username), offset=offset * 10, limit=limit,
+                       after=after)
         )
         return result
     finally:
@@ -139,9 +141,235 @@ async def get_users_by_role(role: str,
         result = await db.execute(
             select(User)
             .where(User.role == role)
+            .order_by(desc(User.likes))
             .offset(offset * 10)
             .limit(limit)
         )
         return result.scalars().all()
     finally:
         await db.close()
+
+
+def like_delta(user_id: UUID4,
+               post_id: int):
+    """ Delete the like row if it exists, else insert it (ON CONFLICT DO NOTHING, so concurrent
+    requests of the same user never count twice). Returns the resulting delta (+1, -1 or 0) as a scalar
+    subquery over data-modifying CTEs, so it runs inside whatever statement uses it """
+    deleted = (
+        delete(Like)
+        .where(Like.user_UUID == user_id, Like.post_id == post_id)
+        .returning(Like.id)
+        .cte('deleted')
+    )
+    inserted = (
+        insert(Like)
+        .from_select(['user_UUID', 'post_id'],
+                     select(literal(user_id, Like.user_UUID.type), literal(post_id, Like.post_id.type))
+                     .where(~exists(select(deleted.c.id)), exists(select(Post.id).where(Post.id == post_id))))
+        .on_conflict_do_nothing(constraint='uq_likes_user_UUID_post_id')
+        .returning(Like.id)
+        .cte('inserted')
+    )
+    return (
+        select(func.count()).select_from(inserted).scalar_subquery()
+        - select(func.count()).select_from(deleted).scalar_subquery()
+    )
+
+
+async def toggle_like(db: AsyncSession,
+                      user_id: UUID4,
+                      post_id: int):
+    """ Like or unlike post and add the delta to post and owner likes in one statement (one round trip),
+    the caller commits. Returns post columns with delta and owner_likes, or None if there is no post """
+    delta = like_delta(user_id=user_id, post_id=post_id)
+    post = (
+        update(Post)
+        .where(Post.id == post_id)
+        .values(likes=func.coalesce(Post.likes, 0) + delta)
+        .returning(Post.id, Post.owner_UUID, Post.owner_username, Post.title, Post.content,
+                   Post.created_at, Post.likes)
+        .cte('post')
+    )
+    owner = (
+        update(User)
+        .where(User.UUID == post.c.owner_UUID)
+        .values(likes=func.coalesce(User.likes, 0) + delta)
+        .returning(User.likes)
+        .cte('owner')
+    )
+    result = await db.execute(
+        select(post, delta.label('delta'), owner.c.likes.label('owner_likes'))
+        .outerjoin(owner, true())
+    )
+    return result.one_or_none()
+
+
+async def toggle_like_row(db: AsyncSession,
+                          user_id: UUID4,
+                          post_id: int):
+    """ Like or unlike post without touching the counters (write-behind mode), the caller commits.
+    The delta is recorded in like_deltas by the same statement, so it is committed with the like row.
+    Returns post columns with delta and pending (deltas of the post not flushed yet), or None if there is no post """
+    delta = like_delta(user_id=user_id, post_id=post_id)
+    post = (
+        select(Post.id, Post.owner_UUID, Post.owner_username, Post.title, Post.content,
+               Post.created_at, Post.likes, delta.label('delta'))
+        .where(Post.id == post_id)
+        .cte('post')
+    )
+    recorded = (
+        insert(LikeDelta)
+        .from_select(['post_id', 'owner_UUID', 'delta'],
+                     select(post.c.id, post.c.owner_UUID, post.c.delta).where(post.c.delta != 0))
+        .returning(LikeDelta.delta)
+        .cte('recorded')
+    )
+    # The statement does not see the rows inserted by its own CTE, so they are added separately
+    pending = (
+        select(func.coalesce(func.sum(LikeDelta.delta), 0)).where(LikeDelta.post_id == post_id).scalar_subquery()
+        + select(func.coalesce(func.sum(recorded.c.delta), 0)).scalar_subquery()
+    )
+    result = await db.execute(select(post, pending.label('pending')))
+    return result.one_or_none()
+
+
+async def apply_like_deltas(limit: int):
+    """ Take up to limit oldest like deltas (write-behind mode) and add them, aggregated, to posts and users
+    in one transaction (with their search outbox rows). Returns new likes of posts ({post id: likes})
+    and the number of deltas taken, or None if another flusher is applying deltas """
+    db = async_session()
+    try:
+        if not await db.scalar(select(func.pg_try_advisory_xact_lock(LIKE_DELTAS_LOCK))):
+            return None
+
+        taken = (await db.execute(
+            delete(LikeDelta)
+            .where(LikeDelta.id.in_(select(LikeDelta.id).order_by(LikeDelta.id).limit(limit)))
+            .returning(LikeDelta.post_id, LikeDelta.owner_UUID, LikeDelta.delta)
+        )).all()
+        post_deltas, user_deltas = {}, {}
+        for post_id, owner_uuid, delta in taken:
+            post_deltas[post_id] = post_deltas.get(post_id, 0) + delta
+            if owner_uuid is not None:
+                user_deltas[owner_uuid] = user_deltas.get(owner_uuid, 0) + delta
+
+        post_likes = {}
+        if post_deltas:
+            deltas = values(column('id', Integer), column('delta', Integer), name='deltas').data(
+                list(post_deltas.items())
+            )
+            result = await db.execute(
+                update(Post)
+                .where(Post.id == deltas.c.id)
+                .values(likes=func.coalesce(Post.likes, 0) + deltas.c.delta)
+                .returning(Post.id, Post.likes)
+                .execution_options(synchronize_session=False)
+            )
+            post_likes = dict(result.all())
+            for post_id, likes in post_likes.items():
+                enqueue_update(db=db, index='posts', document_ids=[post_id], fields={'likes': likes})
+        user_deltas = {owner_uuid: delta for owner_uuid, delta in user_deltas.items() if delta}
+        if user_deltas:
+            deltas = values(column('UUID', User.UUID.type), column('delta', Integer), name='deltas').data(
+                list(user_deltas.items())
+            )
+            result = await db.execute(
+                update(User)
+                .where(User.UUID == deltas.c.UUID)
+                .values(likes=func.coalesce(User.likes, 0) + deltas.c.delta)
+                .returning(User.UUID, User.likes)
+                .execution_options(synchronize_session=False)
+            )
+            for user_id, likes in result.all():
+                enqueue_update(db=db, index='users', document_ids=[user_id], fields={'likes': likes})
+
+        await db.commit()
+        return post_likes, len(taken)
+    finally:
+        await db.close()
+
+
+async def get_pending_like_posts(db: AsyncSession) -> list[int]:
+    """ Ids of posts with like deltas not flushed yet (write-behind mode) """
+    result = await db.scalars(select(LikeDelta.post_id).distinct())
+    return result.all()
+
+
+def likes_with_pending():
+    """ Likes of posts including their deltas not flushed yet (write-behind mode), a column expression
+    with a subquery correlated to Post """
+    return (
+        func.coalesce(Post.likes, 0)
+        + select(func.coalesce(func.sum(LikeDelta.delta), 0)).where(LikeDelta.post_id == Post.id).scalar_subquery()
+    )
+
+
+# Key of the advisory lock held by a likes flusher while it applies like deltas
+LIKE_DELTAS_LOCK = 7_301_002
+
+
+# Key of the advisory lock held by the search indexer while it applies the outbox
+SEARCH_OUTBOX_LOCK = 7_301_001
+
+
+def enqueue_index(db: AsyncSession,
+                  index: str,
+                  document_id,
+                  document: dict):
+    """ Queue indexing of a full document, the caller commits """
+    if not Config.search_outbox_enabled:
+        return
+    db.add(SearchOutbox(index_name=index, action='index',
+                        payload=jsonable_encoder({'id': str(document_id), 'document': document})))
+
+
+def enqueue_update(db: AsyncSession,
+                   index: str,
+                   document_ids: list,
+                   fields: dict):
+    """ Queue setting fields on documents by id, the caller commits """
+    if not Config.search_outbox_enabled:
+        return
+    db.add(SearchOutbox(index_name=index, action='update',
+                        payload=jsonable_encoder({'ids': [str(document_id) for document_id in document_ids],
+                                                  'fields': fields})))
+
+
+def enqueue_delete(db: AsyncSession,
+                   index: str,
+                   document_ids: list):
+    """ Queue deleting documents by id, the caller commits """
+    if not Config.search_outbox_enabled:
+        return
+    db.add(SearchOutbox(index_name=index, action='delete',
+                        payload={'ids': [str(document_id) for document_id in document_ids]}))
+
+
+async def lock_search_outbox(db: AsyncSession) -> bool:
+    """ Try to take the indexer lock until the end of the transaction, so only one indexer applies the outbox """
+    return await db.scalar(select(func.pg_try_advisory_xact_lock(SEARCH_OUTBOX_LOCK)))
+
+
+async def get_search_outbox(db: AsyncSession,
+                            limit: int):
+    result = await db.scalars(select(SearchOutbox).order_by(SearchOutbox.id).limit(limit))
+    return result.all()
+
+
+async def delete_search_outbox(db: AsyncSession,
+                               ids: list[int]):
+    """ Delete applied rows by id, a range would also drop rows of transactions that committed meanwhile """
+    await db.execute(delete(SearchOutbox).where(SearchOutbox.id.in_(ids)))
+
+
+async def get_search_outbox_lag() -> dict:
+    """ Pending outbox rows and the age in seconds of the oldest one """
+    db = async_session()
+    try:
+        pending, oldest = (await db.execute(
+            select(func.count(), func.min(SearchOutbox.created_at))
+        )).one()
+        lag = (datetime.utcnow() - oldest).total_seconds() if oldest else 0
+        return {'pending': pending, 'lag_seconds': lag}
+    finally:
+        await db.close()
@@ -1,11 +1,50 @@
+from time import perf_counter
 from typing import Generator
 
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.config import Config
 
 
-async_engine = create_async_engine(url=Config.postgres_url)
+class MeasuredPool(AsyncAdaptedQueuePool):
+    """ Queue pool counting checkouts and the time spent waiting for them (including connecting
+    and pre-ping), so pools can be sized per worker from data """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def connect(self):
+        started = perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            wait = perf_counter() - started
+            self.checkouts += 1
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+
+async_engine = create_async_engine(url=Config.postgres_url,
+                                   poolclass=MeasuredPool,
+                                   pool_size=Config.db_pool_size,
+                                   max_overflow=Config.db_max_overflow,
+                                   pool_timeout=Config.db_pool_timeout_seconds,
+                                   pool_pre_ping=Config.db_pool_pre_ping,
+                                   pool_recycle=Config.db_pool_recycle_seconds,
+                                   connect_args={
+                                       # asyncpg and sqlalchemy prepared statement caches, 0 behind pgbouncer
+                                       'statement_cache_size': Config.db_statement_cache_size,
+                                       'prepared_statement_cache_size': Config.db_statement_cache_size,
+                                   })
 
 async_session = async_sessionmaker(bind=async_engine,
                                    expire_on_commit=False,
@@ -18,3 +57,17 @@ async def get_db() -> Generator:
         yield db
     finally:
         await db.close()
+
+
+def get_pool_metrics() -> dict:
+    """ Connection pool of this process """
+    pool: MeasuredPool = async_engine.pool
+    return {'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': Config.db_max_overflow,
+            'checkouts': pool.checkouts,
+            'timeouts': pool.timeouts,
+            'avg_wait_ms': round(pool.wait_seconds / pool.checkouts * 1000, 2) if pool.checkouts else 0,
+            'max_wait_ms': round(pool.max_wait_seconds * 1000, 2)}
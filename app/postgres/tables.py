@@ -1,8 +1,10 @@
 from datetime import datetime
 from uuid import uuid4
 
-from sqlalchemy import Column, UUID, String, Integer, ForeignKey, DateTime
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import (Column, UUID, String, Integer, SmallInteger, BigInteger, ForeignKey, DateTime, Index,
+                        UniqueConstraint, Computed)
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import declarative_base, relationship, deferred
 
 Base = declarative_base()
 
@@ -17,6 +19,8 @@ class User(Base):
     about_me = Column(String, nullable=True)
     likes = Column(Integer, default=0)
     role = Column(String, default='user')
+    # Full-text search without elasticsearch (SEARCH_BACKEND=postgres), not loaded with the row
+    search_vector = deferred(Column(TSVECTOR, Computed("to_tsvector('simple', username)", persisted=True)))
 
     posts = relationship('Post', back_populates='owner')
 
@@ -31,6 +35,8 @@ class Post(Base):
     content = Column(String, unique=True, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     likes = Column(Integer, default=0)
+    # Full-text search without elasticsearch (SEARCH_BACKEND=postgres), not loaded with the row
+    search_vector = deferred(Column(TSVECTOR, Computed("to_tsvector('simple', title)", persisted=True)))
 
     owner = relationship('User', back_populates='posts')
     like = relationship('Like', back_populates='post')
@@ -38,6 +44,9 @@ class Post(Base):
 
 class Like(Base):
     __tablename__ = 'likes'
+    __table_args__ = (
+        UniqueConstraint('user_UUID', 'post_id', name='uq_likes_user_UUID_post_id'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_UUID = Column(UUID(as_uuid=True), ForeignKey('users.UUID'))
@@ -45,3 +54,44 @@ class Like(Base):
 
     user = relationship('User')
     post = relationship('Post', back_populates='like')
+
+
+class LikeDelta(Base):
+    """ Likes/unlikes of the write-behind mode, written in the same transaction as the like row
+    and added to the post and owner likes by the flusher """
+    __tablename__ = 'like_deltas'
+
+    id = Column(BigInteger, primary_key=True)
+    post_id = Column(Integer, nullable=False)
+    owner_UUID = Column(UUID(as_uuid=True))
+    delta = Column(SmallInteger, nullable=False)
+
+
+class SearchOutbox(Base):
+    """ Elasticsearch operations written in the same transaction as the data change,
+    applied in id order by the search indexer """
+    __tablename__ = 'search_outbox'
+
+    id = Column(BigInteger, primary_key=True)
+    index_name = Column(String, nullable=False)
+    action = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Indexes for feeds and listings (see alembic revision a3c5e91f0d42)
+Index('ix_posts_likes_created_at_id', Post.likes.desc(), Post.created_at.desc(), Post.id.desc())
+Index('ix_posts_owner_UUID_likes_created_at_id',
+      Post.owner_UUID, Post.likes.desc(), Post.created_at.desc(), Post.id.desc())
+Index('ix_posts_owner_username_likes_created_at_id',
+      Post.owner_username, Post.likes.desc(), Post.created_at.desc(), Post.id.desc())
+Index('ix_likes_post_id', Like.post_id)
+Index('ix_users_role_likes', User.role, User.likes.desc())
+Index('ix_users_likes', User.likes.desc())
+# Pending likes of a post in the write-behind mode (see alembic revision e6d3a9b1c452)
+Index('ix_like_deltas_post_id', LikeDelta.post_id)
+# Indexes for search in postgres (see alembic revision d8a2b5e17c30)
+Index('ix_posts_search_vector', Post.search_vector, postgresql_using='gin')
+Index('ix_posts_title_trgm', Post.title, postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'})
+Index('ix_users_search_vector', User.search_vector, postgresql_using='gin')
+Index('ix_users_username_trgm', User.username, postgresql_using='gin', postgresql_ops={'username': 'gin_trgm_ops'})
@@ -0,0 +1,200 @@
+from hashlib import sha256
+from json import dumps
+
+from redis.asyncio import StrictRedis
+
+# Set of all cached feed page keys, so every page can be dropped at once
+FEED_KEYS = 'cache:feed:keys'
+
+# Reads the generation of an index and the search page cached under it in one round trip
+GET_SEARCH_PAGE = """
+local generation = redis.call('GET', KEYS[1]) or '0'
+local name = ARGV[1] .. generation .. ARGV[2]
+return {name, redis.call('GET', name)}
+"""
+
+
+def feed_key(offset: int,
+             limit: int,
+             cursor: str | None) -> str:
+    return f'cache:feed:{offset}:{limit}:{cursor}'
+
+
+async def get_feed_page(redis: StrictRedis,
+                        name: str) -> str | None:
+    return await redis.get(name=name)
+
+
+async def set_feed_page(redis: StrictRedis,
+                        name: str,
+                        page: str,
+                        time: int):
+    """ Save serialized feed page for time seconds """
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.set(name=name, value=page, ex=time)
+        pipe.sadd(FEED_KEYS, name)
+        pipe.expire(name=FEED_KEYS, time=time)
+        await pipe.execute()
+
+
+async def invalidate_feed(redis: StrictRedis):
+    """ Drop every cached feed page, called after any change of posts order or content """
+    names = await redis.smembers(name=FEED_KEYS)
+    await redis.delete(FEED_KEYS, *names)
+
+
+def search_generation_key(index: str) -> str:
+    return f'cache:search:{index}:generation'
+
+
+def normalize_query(query: str) -> str:
+    return ' '.join(query.lower().split())
+
+
+async def get_search_page(redis: StrictRedis,
+                          index: str,
+                          query: str,
+                          offset: int,
+                          limit: int) -> tuple[str, str | None]:
+    """ Key of a search page under the current generation of the index and the page cached there, if any """
+    digest = sha256(normalize_query(query).encode()).hexdigest()[:32]
+    name, page = await redis.eval(GET_SEARCH_PAGE, 1, search_generation_key(index),
+                                  f'cache:search:{index}:', f':{digest}:{offset}:{limit}')
+    return name, page or None
+
+
+async def set_search_page(redis: StrictRedis,
+                          name: str,
+                          page: str,
+                          time: int):
+    await redis.set(name=name, value=page, ex=time)
+
+
+async def bump_search_generation(redis: StrictRedis,
+                                 indexes: set[str]):
+    """ Called after every write to the indexes: pages cached under the previous generation are never read again
+    and expire by themselves """
+    async with redis.pipeline(transaction=False) as pipe:
+        for index in indexes:
+            pipe.incr(name=search_generation_key(index))
+        await pipe.execute()
+
+
+def suggest_key(prefix: str,
+                limit: int) -> str:
+    return f'cache:suggest:{limit}:{prefix}'
+
+
+async def get_suggestions(redis: StrictRedis,
+                          prefix: str,
+                          limit: int) -> str | None:
+    return await redis.get(name=suggest_key(prefix, limit))
+
+
+async def set_suggestions(redis: StrictRedis,
+                          prefix: str,
+                          limit: int,
+                          suggestions: str,
+                          time: int):
+    """ Save serialized suggestions for time seconds, they are not invalidated on writes """
+    await redis.set(name=suggest_key(prefix, limit), value=suggestions, ex=time)
+
+
+# Marker of a just invalidated post, blocks refilling it from reads that started before the change
+POST_TOMBSTONE = {'tombstone': '1'}
+POST_TOMBSTONE_SECONDS = 10
+
+# Caches a full post unless it is cached already or was invalidated in the last seconds
+SET_POST_PAGE = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'content', ARGV[1], 'etag', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+def post_key(post_id: int) -> str:
+    return f'cache:post:{post_id}'
+
+
+def make_etag(content: str) -> str:
+    """ Strong ETag of a serialized payload """
+    return '"' + sha256(content.encode()).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str | None,
+                 etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(','))
+
+
+async def get_post_page(redis: StrictRedis,
+                        post_id: int) -> dict:
+    """ {'content': serialized full post, 'etag': its ETag} or empty dict """
+    page = await redis.hgetall(name=post_key(post_id))
+    return page if 'content' in page else {}
+
+
+async def set_post_page(redis: StrictRedis,
+                        post_id: int,
+                        content: str,
+                        etag: str,
+                        time: int):
+    """ Save serialized full post for time seconds, unless it was invalidated in the last seconds """
+    await redis.eval(SET_POST_PAGE, 1, post_key(post_id), content, etag, time)
+
+
+async def invalidate_posts(redis: StrictRedis,
+                           post_ids: list[int]):
+    """ Drop cached full posts, called after commit of any change of post content, likes or owner username """
+    if not post_ids:
+        return
+    async with redis.pipeline(transaction=True) as pipe:
+        for post_id in post_ids:
+            pipe.delete(post_key(post_id))
+            pipe.hset(name=post_key(post_id), mapping=POST_TOMBSTONE)
+            pipe.expire(name=post_key(post_id), time=POST_TOMBSTONE_SECONDS)
+        await pipe.execute()
+
+
+# Channel of changed users: every process drops them from its local identity cache
+USER_INVALIDATIONS = 'cache:users:invalidations'
+# Marker of a just invalidated identity, blocks refilling it from reads that started before the change
+USER_TOMBSTONE = ''
+USER_TOMBSTONE_SECONDS = 10
+
+
+def user_key(user_uuid) -> str:
+    return f'cache:user:{user_uuid}'
+
+
+async def get_user_identity(redis: StrictRedis,
+                            user_uuid) -> str | None:
+    """ Serialized identity (UUID, username, role) of user or None """
+    return await redis.get(name=user_key(user_uuid)) or None
+
+
+async def set_user_identity(redis: StrictRedis,
+                            user_uuid,
+                            identity: str,
+                            time: int):
+    """ Save serialized identity for time seconds, unless it was invalidated in the last seconds """
+    await redis.set(name=user_key(user_uuid), value=identity, ex=time, nx=True)
+
+
+async def invalidate_users(redis: StrictRedis,
+                           user_uuids: list):
+    """ Drop cached identities in redis and in every process, called after commit of any change of
+    username or role and after deleting users """
+    if not user_uuids:
+        return
+    async with redis.pipeline(transaction=False) as pipe:
+        for user_uuid in user_uuids:
+            pipe.set(name=user_key(user_uuid), value=USER_TOMBSTONE, ex=USER_TOMBSTONE_SECONDS)
+        pipe.publish(channel=USER_INVALIDATIONS, message=dumps([str(user_uuid) for user_uuid in user_uuids]))
+        await pipe.execute()
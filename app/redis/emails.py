@@ -0,0 +1,109 @@
+from json import dumps, loads
+from time import time
+
+from redis.asyncio import StrictRedis
+from redis.exceptions import ResponseError
+
+# Outbox of emails waiting to be sent, read by the email workers through a consumer group
+OUTBOX = 'emails:outbox'
+GROUP = 'email-senders'
+# Failed emails waiting for the next attempt: ZSET of json messages scored by the time of the attempt
+RETRIES = 'emails:retries'
+# Emails that failed every attempt
+DEAD = 'emails:dead'
+
+# Atomically moves due retries back into the outbox
+REQUEUE_DUE = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, message in ipairs(due) do
+    redis.call('ZREM', KEYS[1], message)
+    redis.call('XADD', KEYS[2], '*', 'message', message)
+end
+return #due
+"""
+
+
+async def enqueue_email(redis: StrictRedis,
+                        recipients: list[str],
+                        subject: str,
+                        body: str):
+    message = {'recipients': recipients, 'subject': subject, 'body': body, 'attempts': 0}
+    await redis.xadd(name=OUTBOX, fields={'message': dumps(message)})
+
+
+async def create_group(redis: StrictRedis):
+    try:
+        await redis.xgroup_create(name=OUTBOX, groupname=GROUP, id='0', mkstream=True)
+    except ResponseError as error:
+        # BUSYGROUP - the group was created by another worker
+        if 'BUSYGROUP' not in str(error):
+            raise
+
+
+async def read_emails(redis: StrictRedis,
+                      consumer: str,
+                      count: int,
+                      block_ms: int,
+                      claim_idle_ms: int) -> list[tuple[str, dict]]:
+    """ Batch of (stream id, message): emails left unacknowledged by a crashed worker first, then new ones """
+    _, claimed, *_ = await redis.xautoclaim(name=OUTBOX, groupname=GROUP, consumername=consumer,
+                                            min_idle_time=claim_idle_ms, count=count)
+    entries = claimed
+    if not entries:
+        response = await redis.xreadgroup(groupname=GROUP, consumername=consumer, streams={OUTBOX: '>'},
+                                          count=count, block=block_ms)
+        # RESP3 returns a mapping of stream name -> entries, RESP2 a list of [stream name, entries]
+        if isinstance(response, dict):
+            entries = next(iter(response.values()), [[]])[0]
+        elif response:
+            entries = response[0][1]
+    return [(entry_id, loads(fields['message'])) for entry_id, fields in entries if fields]
+
+
+async def ack_emails(redis: StrictRedis,
+                     entry_ids: list[str]):
+    """ Remove sent (or rescheduled) emails from the outbox """
+    if entry_ids:
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.xack(OUTBOX, GROUP, *entry_ids)
+            pipe.xdel(OUTBOX, *entry_ids)
+            await pipe.execute()
+
+
+async def retry_email(redis: StrictRedis,
+                      entry_id: str,
+                      message: dict,
+                      delay_seconds: float):
+    # The outbox entry id keeps identical emails apart, they would be a single member of the ZSET otherwise
+    message = {**message, 'attempts': message['attempts'] + 1, 'entry_id': entry_id}
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.zadd(name=RETRIES, mapping={dumps(message): time() + delay_seconds})
+        pipe.xack(OUTBOX, GROUP, entry_id)
+        pipe.xdel(OUTBOX, entry_id)
+        await pipe.execute()
+
+
+async def dead_letter_email(redis: StrictRedis,
+                            entry_id: str,
+                            message: dict,
+                            error: str):
+    message = {**message, 'attempts': message['attempts'] + 1}
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.xadd(name=DEAD, fields={'message': dumps(message), 'error': error})
+        pipe.xack(OUTBOX, GROUP, entry_id)
+        pipe.xdel(OUTBOX, entry_id)
+        await pipe.execute()
+
+
+async def requeue_due_emails(redis: StrictRedis,
+                             count: int) -> int:
+    return await redis.eval(REQUEUE_DUE, 2, RETRIES, OUTBOX, time(), count)
+
+
+async def get_email_queue_depth(redis: StrictRedis) -> dict[str, int]:
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.xlen(OUTBOX)
+        pipe.zcard(RETRIES)
+        pipe.xlen(DEAD)
+        outbox, retries, dead = await pipe.execute()
+    return {'outbox': outbox, 'retries': retries, 'dead': dead}
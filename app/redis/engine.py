@@ -2,11 +2,18 @@ from redis.asyncio import StrictRedis
 
 from app.config import Config
 
-redis = StrictRedis(host=Config.redis_host,
-                    port=Config.redis_port,
-                    decode_responses=True,
-                    protocol=3,
-                    db=0)
+
+def create_redis() -> StrictRedis:
+    return StrictRedis(host=Config.redis_host,
+                       port=Config.redis_port,
+                       decode_responses=True,
+                       protocol=3,
+                       db=0)
+
+
+# Shared client of request handlers (closed by get_redis after each request),
+# background workers create their own with create_redis
+redis = create_redis()
 
 
 async def get_redis():
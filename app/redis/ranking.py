@@ -0,0 +1,215 @@
+import asyncio
+from calendar import timegm
+from datetime import datetime
+from time import perf_counter
+from uuid import uuid4
+
+from redis.asyncio import StrictRedis
+from sqlalchemy import select
+
+from app.postgres.crud import get_pending_like_posts, likes_with_pending
+from app.postgres.engine import async_session
+from app.postgres.tables import Post
+from app.redis.engine import redis as redis_client
+
+# ZSET of posts scored by likes. Members are '<created_at in microseconds>:<id>' zero-padded, so posts with
+# equal likes are ordered by created_at, then id - the same order as the feed query in postgres
+RANKING = 'ranking:posts'
+# While rebuild_ranking runs: its marker, ids of posts changed meanwhile and members of posts deleted meanwhile
+REBUILDING = 'ranking:posts:rebuilding'
+TOUCHED = 'ranking:posts:touched'
+REMOVED = 'ranking:posts:removed'
+# The marker is extended after every batch, so it only expires once its rebuild died
+REBUILD_TTL_SECONDS = 300
+
+# Writes only update an existing ranking (a missing one is built by rebuild_ranking, the feed falls back
+# to postgres meanwhile) and are remembered for a running rebuild
+ADD_POST = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('SADD', KEYS[3], ARGV[3])
+end
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    local args = {KEYS[1]}
+    for i = 4, #ARGV do
+        table.insert(args, ARGV[i])
+    end
+    table.insert(args, ARGV[2])
+    table.insert(args, ARGV[1])
+    redis.call('ZADD', unpack(args))
+end
+"""
+
+REMOVE_POSTS = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('SADD', KEYS[3], unpack(ARGV))
+end
+redis.call('ZREM', KEYS[1], unpack(ARGV))
+"""
+
+TOUCH_POSTS = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('SADD', KEYS[2], unpack(ARGV))
+end
+"""
+
+# Extends the marker of a running rebuild while it still belongs to it
+REFRESH_REBUILD = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+return redis.call('EXPIRE', KEYS[1], ARGV[2])
+"""
+
+# Swaps the rebuilt ranking in once every post changed during the rebuild has been re-read
+SWAP_RANKING = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return -1
+end
+if redis.call('SCARD', KEYS[3]) > 0 then
+    return 0
+end
+local removed = redis.call('SMEMBERS', KEYS[4])
+if #removed > 0 and redis.call('EXISTS', KEYS[5]) == 1 then
+    redis.call('ZREM', KEYS[5], unpack(removed))
+end
+if redis.call('EXISTS', KEYS[5]) == 1 then
+    redis.call('RENAME', KEYS[5], KEYS[1])
+else
+    redis.call('DEL', KEYS[1])
+end
+redis.call('DEL', KEYS[2], KEYS[3], KEYS[4])
+return 1
+"""
+
+
+def ranking_member(post_id: int,
+                   created_at: datetime) -> str:
+    microseconds = timegm(created_at.utctimetuple()) * 1_000_000 + created_at.microsecond
+    return f'{microseconds:017d}:{post_id:010d}'
+
+
+def ranking_post_id(member: str) -> int:
+    return int(member.rsplit(':', 1)[1])
+
+
+async def add_post(redis: StrictRedis,
+                   post_id: int,
+                   created_at: datetime,
+                   likes: int = 0):
+    await redis.eval(ADD_POST, 3, RANKING, REBUILDING, TOUCHED,
+                     ranking_member(post_id, created_at), likes, post_id)
+
+
+async def incr_post_likes(redis: StrictRedis,
+                          post_id: int,
+                          created_at: datetime,
+                          amount: int):
+    """ Only posts already ranked are updated, so a missing ranking is never filled with partial scores """
+    await redis.eval(ADD_POST, 3, RANKING, REBUILDING, TOUCHED,
+                     ranking_member(post_id, created_at), amount, post_id, 'XX', 'INCR')
+
+
+async def remove_posts(redis: StrictRedis,
+                       posts: list[tuple[int, datetime]]):
+    """ posts: (id, created_at) of deleted posts """
+    if posts:
+        await redis.eval(REMOVE_POSTS, 3, RANKING, REBUILDING, REMOVED,
+                         *[ranking_member(post_id, created_at) for post_id, created_at in posts])
+
+
+async def touch_posts(redis: StrictRedis,
+                      post_ids: list[int]):
+    """ Called after likes of posts change in postgres without a ranking write (flushed write-behind deltas),
+    so a running rebuild re-reads them """
+    if post_ids:
+        await redis.eval(TOUCH_POSTS, 2, REBUILDING, TOUCHED, *post_ids)
+
+
+async def get_ranked_post_ids(redis: StrictRedis,
+                              offset: int,
+                              limit: int) -> list[int] | None:
+    """ Ids of a feed page, or None if the ranking has not been built """
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.exists(RANKING)
+        pipe.zrevrange(name=RANKING, start=offset, end=offset + limit - 1)
+        exists, members = await pipe.execute()
+    if not exists:
+        return None
+    return [ranking_post_id(member) for member in members]
+
+
+async def rank_posts(redis: StrictRedis,
+                     name: str,
+                     rows) -> int:
+    """ Set scores of posts (id, created_at, likes from postgres) """
+    if not rows:
+        return 0
+    await redis.zadd(name=name,
+                     mapping={ranking_member(post_id, created_at): likes or 0 for post_id, created_at, likes in rows})
+    return len(rows)
+
+
+async def refresh_rebuild(redis: StrictRedis,
+                          rebuild_id: str):
+    """ Extend the marker of a rebuild, raises if it expired or another rebuild took over meanwhile """
+    if not await redis.eval(REFRESH_REBUILD, 1, REBUILDING, rebuild_id, REBUILD_TTL_SECONDS):
+        raise RuntimeError('Ranking rebuild expired')
+
+
+async def rebuild_ranking(redis: StrictRedis,
+                          batch_size: int = 10000) -> int:
+    """ Repopulate the ranking from postgres into a temporary key and swap it in with RENAME.
+    Posts changed while it runs are re-read from postgres before the swap, so no write is lost """
+    rebuild_id = uuid4().hex
+    temporary = f'{RANKING}:rebuild:{rebuild_id}'
+    if not await redis.set(name=REBUILDING, value=rebuild_id, ex=REBUILD_TTL_SECONDS, nx=True):
+        raise RuntimeError('Ranking rebuild is already running')
+
+    count = 0
+    db = async_session()
+    try:
+        # Posts with likes not flushed yet (write-behind) are re-read with them at the end
+        await touch_posts(redis=redis, post_ids=await get_pending_like_posts(db=db))
+
+        rows = await db.stream(
+            select(Post.id, Post.created_at, Post.likes).execution_options(yield_per=batch_size)
+        )
+        async for batch in rows.partitions():
+            count += await rank_posts(redis=redis, name=temporary, rows=batch)
+            await refresh_rebuild(redis=redis, rebuild_id=rebuild_id)
+
+        while True:
+            # Re-reading posts changed during the rebuild
+            while post_ids := await redis.spop(name=TOUCHED, count=batch_size):
+                # Likes not flushed yet are in the live ranking too (write-behind), so they are read with the posts
+                rows = (await db.execute(
+                    select(Post.id, Post.created_at, likes_with_pending())
+                    .where(Post.id.in_([int(i) for i in post_ids]))
+                )).all()
+                await rank_posts(redis=redis, name=temporary, rows=rows)
+                await refresh_rebuild(redis=redis, rebuild_id=rebuild_id)
+
+            swapped = await redis.eval(SWAP_RANKING, 5, RANKING, REBUILDING, TOUCHED, REMOVED, temporary, rebuild_id)
+            if swapped == -1:
+                raise RuntimeError('Ranking rebuild expired')
+            if swapped == 1:
+                return count
+    except BaseException:
+        await redis.delete(temporary)
+        if await redis.get(name=REBUILDING) == rebuild_id:
+            await redis.delete(REBUILDING, TOUCHED, REMOVED)
+        raise
+    finally:
+        await db.close()
+
+
+async def main():
+    started = perf_counter()
+    count = await rebuild_ranking(redis=redis_client)
+    print(f'Ranking rebuilt: {count} posts in {perf_counter() - started:.2f}s')
+    await redis_client.aclose()
+
+
+if __name__ == '__main__':
+    # python -m app.redis.ranking
+    asyncio.run(main())
@@ -0,0 +1,12 @@
+from json import dumps
+
+from redis.asyncio import StrictRedis
+
+# Channel of search index changes for in-memory search engines of every process (SEARCH_BACKEND=memory)
+SEARCH_ACTIONS = 'search:actions'
+
+
+async def publish_search_actions(redis: StrictRedis,
+                                 actions: list[tuple[str, str, str, dict | None]]):
+    """ Publish bulk actions (action, index, document id, body) applied by the search indexer """
+    await redis.publish(channel=SEARCH_ACTIONS, message=dumps(actions))
@@ -7,13 +7,15 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.status import HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND, HTTP_401_UNAUTHORIZED
 
 from app.config import Config
-from app.elasticsearch.url import elastic
 from app.email.bodies import EmailCode, EmailInfo
 from app.email.send_email import send_email_code, send_email_info
+from app.postgres.crud import enqueue_update
 from app.postgres.engine import get_db
-from app.postgres.tables import User, Post, Like
+from app.postgres.tables import User, Post
+from app.redis.cache import invalidate_feed, invalidate_posts, invalidate_users
 from app.redis.crud import hsetex
 from app.redis.engine import get_redis
+from app.services import deletion
 from app.schemas import users
 from app.security.JWT import create_mail_token
 from app.security.authz import get_current_user, auth_email
@@ -38,6 +40,9 @@ async def update_about_me(about_me: users.AboutMe,
                             detail="User not found")
 
     user.about_me = about_me.description
+
+    # Updating description in index users in elasticsearch (applied by the search indexer)
+    enqueue_update(db=db, index='users', document_ids=[user.UUID], fields={'about_me': user.about_me})
     await db.commit()
 
     return users.ReturnFullUser(UUID=current_user.UUID, username=current_user.username, about_me=user.about_me,
@@ -113,40 +118,8 @@ async def verify_delete_account(input_email_code: int,
             detail="Invalid email code"
         )
 
-    # Deleting likes user in postgres
-    likes = await db.scalars(select(Like).where(Like.user_UUID == user.UUID))
-    for like in likes:
-        await db.delete(like)
-
-    posts = await db.scalars(select(Post).where(Post.owner_UUID == user.UUID))
-    for post in posts.all():
-        # Deleting posts current user from postgres
-        await db.delete(post)
-        # Deleting posts current user from elasticsearch
-        await elastic.delete_by_query(
-            index='posts',
-            body={
-                "query": {
-                    "match": {
-                        "id": post.id
-                    }
-                }
-            }
-        )
-    # Deleting current user from postgres
-    await db.delete(user)
-    await db.commit()
-    # Deleting current user from elasticsearch
-    await elastic.delete_by_query(
-        index='users',
-        body={
-            "query": {
-                "match": {
-                    "username": user.username
-                }
-            }
-        }
-    )
+    # Deleting user with his posts and likes in postgres, elasticsearch and redis
+    await deletion.delete_user(db=db, redis=redis, user=user)
 
     # Sending email with information about delete account to user mail
     await send_email_info(mail=users.EmailSchema(email=[user.email]), body=EmailInfo.delete_account_info)
@@ -207,6 +180,7 @@ async def resend_delete_account(response: Response,
 @router.put('/change-username')
 async def change_username(form: users.ChangeUsername,
                           db: AsyncSession = Depends(get_db),
+                          redis: StrictRedis = Depends(get_redis),
                           current_user: users.ReturnUser = Depends(get_current_user)):
 
     user = await db.scalar(select(User).where(User.UUID == current_user.UUID))
@@ -223,8 +197,8 @@ async def change_username(form: users.ChangeUsername,
             detail='Username already taken'
         )
 
-    if not verify_password(plain_password=form.password,
-                           hashed_password=user.hashed_password):
+    if not await verify_password(plain_password=form.password,
+                                 hashed_password=user.hashed_password):
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED,
             detail='Wrong password'
@@ -232,33 +206,26 @@ async def change_username(form: users.ChangeUsername,
 
     # Updating username in table User
     user.username = form.new_username
-    await db.commit()
 
     # Updating username in posts user in table Post
-    await db.execute(
+    renamed_post_ids = (await db.scalars(
         update(Post)
         .where(Post.owner_UUID == current_user.UUID)
         .values(owner_username=form.new_username)
-    )
+        .returning(Post.id)
+    )).all()
+
+    # Updating username in indexes users and posts in elasticsearch (applied by the search indexer)
+    enqueue_update(db=db, index='users', document_ids=[current_user.UUID], fields={'username': form.new_username})
+    enqueue_update(db=db, index='posts', document_ids=renamed_post_ids, fields={'owner_username': form.new_username})
     await db.commit()
 
-    # Updating username in index users in elasticsearch
-    await elastic.update_by_query(
-        index='users',
-        body={
-            "script": {
-                "source": "ctx._source.username = params.new_username",
-                "params": {
-                    "new_username": form.new_username
-                }
-            },
-            "query": {
-                "match": {
-                    "username": current_user.username
-                }
-            }
-        }
-    )
+    # Dropping cached identity and posts user in redis and in every process
+    await invalidate_users(redis=redis, user_uuids=[current_user.UUID])
+    await invalidate_posts(redis=redis, post_ids=renamed_post_ids)
+
+    # Dropping cached feed pages in redis
+    await invalidate_feed(redis=redis)
 
     # Sending email with information about changed username to user mail
     await send_email_info(mail=users.EmailSchema(email=[user.email]), body=EmailInfo.change_username_info)
@@ -298,8 +265,8 @@ async def change_email(form: users.ChangeEmail,
         )
 
     user = await db.scalar(select(User).where(User.username == current_user.username))
-    if not verify_password(plain_password=form.password,
-                           hashed_password=user.hashed_password):
+    if not await verify_password(plain_password=form.password,
+                                 hashed_password=user.hashed_password):
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED,
             detail='Wrong password'
@@ -487,7 +454,7 @@ async def verify_change_password(input_email_code: int,
         )
 
     # Updating password in table User
-    user.hashed_password = hash_password(redis_email_code['new_password'])
+    user.hashed_password = await hash_password(redis_email_code['new_password'])
     await db.commit()
 
     # Sending email with information about change password to user mail
@@ -1,19 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 from loguru import logger
 from pydantic import UUID4
+from redis.asyncio import StrictRedis
 from sqlalchemy import select, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.status import HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
 
 from app.config import Config
-from app.elasticsearch.indexes.posts_index import posts_index
-from app.elasticsearch.indexes.users_index import users_index
-from app.elasticsearch.url import elastic
+from app.elasticsearch.reindex import INDEXES, create_index, index_exists, reindex
 from app.email.bodies import EmailInfoAdmin
 from app.email.send_email import send_email_info
-from app.postgres.crud import get_users_by_role
-from app.postgres.engine import get_db
-from app.postgres.tables import User, Like, Post
+from app.postgres.crud import get_users_by_role, get_search_outbox_lag, enqueue_index
+from app.postgres.engine import get_db, get_pool_metrics
+from app.postgres.tables import User
+from app.redis.cache import invalidate_users
+from app.redis.emails import get_email_queue_depth
+from app.redis.engine import get_redis
+from app.services import deletion
 from app.schemas import users, admin
 from app.security.authz import get_current_admin
 from app.security.password import hash_password
@@ -120,13 +123,15 @@ async def create_user(user_data: admin.AdminCreateUser,
     # Creating user in postgres
     user = User(username=user_data.username,
                 email=user_data.email,
-                hashed_password=hash_password(user_data.password),
+                hashed_password=await hash_password(user_data.password),
                 role=user_data.role)
     db.add(user)
-    await db.commit()
+    await db.flush()
 
-    # Creating user in elasticsearch
-    await elastic.index(index='users', document=users.ElasticUser(username=user.username).dict())
+    # Creating user in elasticsearch (applied by the search indexer)
+    enqueue_index(db=db, index='users', document_id=user.UUID,
+                  document=users.ElasticUser(username=user.username, about_me=user.about_me, likes=user.likes).dict())
+    await db.commit()
 
     # Writing a log to file
     logger.info(f'[adm] Admin [ {current_admin.UUID} ] created user [ user:{user.UUID} ][ role:{user.role} ]')
@@ -147,6 +152,7 @@ async def create_user(user_data: admin.AdminCreateUser,
 async def change_role(user_uuid: UUID4,
                       new_role: str,
                       db: AsyncSession = Depends(get_db),
+                      redis: StrictRedis = Depends(get_redis),
                       current_admin: users.ReturnUser = Depends(get_current_admin)):
     """ Admin can change users role with role """
 
@@ -162,6 +168,9 @@ async def change_role(user_uuid: UUID4,
     user.role = new_role
     await db.commit()
 
+    # Dropping cached identity user in redis and in every process
+    await invalidate_users(redis=redis, user_uuids=[user.UUID])
+
     # Writing a log to file
     logger.info(f'[adm] Admin [ {current_admin.UUID} ] changed user role [ user:{user.UUID} ]: {old_role} -> {new_role}')
 
@@ -180,6 +189,7 @@ async def change_role(user_uuid: UUID4,
 @router.delete('/{user_uuid}/delete')
 async def delete_any_user(user_uuid: UUID4,
                       db: AsyncSession = Depends(get_db),
+                      redis: StrictRedis = Depends(get_redis),
                       current_admin: users.ReturnUser = Depends(get_current_admin)):
     """ Admin can delete user with any role """
 
@@ -191,40 +201,8 @@ async def delete_any_user(user_uuid: UUID4,
             detail='User does not exist'
         )
 
-    # Deleting likes user in postgres
-    likes = await db.scalars(select(Like).where(Like.user_UUID == user.UUID))
-    for like in likes:
-        await db.delete(like)
-
-    posts = await db.scalars(select(Post).where(Post.owner_UUID == user.UUID))
-    for post in posts.all():
-        # Deleting posts current user from postgres
-        await db.delete(post)
-        # Deleting posts current user from elasticsearch
-        await elastic.delete_by_query(
-            index='posts',
-            body={
-                "query": {
-                    "match": {
-                        "id": post.id
-                    }
-                }
-            }
-        )
-    # Deleting current user from postgres
-    await db.delete(user)
-    await db.commit()
-    # Deleting current user from elasticsearch
-    await elastic.delete_by_query(
-        index='users',
-        body={
-            "query": {
-                "match": {
-                    "username": user.username
-                }
-            }
-        }
-    )
+    # Deleting user with his posts and likes in postgres, elasticsearch and redis
+    await deletion.delete_user(db=db, redis=redis, user=user)
 
     # Sending email with information about delete account to user mail
     await send_email_info(mail=users.EmailSchema(email=[user.email]), body=EmailInfoAdmin.delete_user)
@@ -239,6 +217,20 @@ async def delete_any_user(user_uuid: UUID4,
             }}
 
 
+# ================================================================
+# Metrics of background workers for admin
+# ================================================================
+
+
+@router.get('/metrics')
+async def get_metrics(current_admin: users.ReturnUser = Depends(get_current_admin),
+                      redis: StrictRedis = Depends(get_redis)):
+
+    return {'emails': await get_email_queue_depth(redis=redis),
+            'search_outbox': await get_search_outbox_lag(),
+            'postgres_pool': get_pool_metrics()}
+
+
 # ================================================================
 # Creating indexes in elasticsearch (required: master_key)
 # ================================================================
@@ -252,7 +244,35 @@ async def create_es_indexes(master_key: str):
             detail='Bad key'
         )
 
-    await elastic.indices.create(index='posts', body=posts_index)
-    await elastic.indices.create(index='users', body=users_index)
+    # Creating posts_v1/users_v1 behind aliases posts/users, existing indexes are kept (rebuilt by /reindex)
+    created = []
+    for alias in INDEXES:
+        if not await index_exists(alias=alias):
+            created.append(await create_index(alias=alias))
+
+    return {'detail': 'Indexes has been successfully created', 'created': created, 'status': 200}
 
-    return {'detail': 'Indexes has been successfully created', 'status': 200}
+
+# ================================================================
+# Rebuilding indexes in elasticsearch from postgres for admin
+# ================================================================
+
+
+@router.post('/reindex')
+async def reindex_es_indexes(background_tasks: BackgroundTasks,
+                             workers: int = Query(default=4, ge=1),
+                             batch_size: int = Query(default=1000, ge=1),
+                             current_admin: users.ReturnUser = Depends(get_current_admin)):
+    """ Admin can rebuild indexes without downtime, progress is written to the log """
+
+    for alias in INDEXES:
+        background_tasks.add_task(reindex, alias=alias, workers=workers, batch_size=batch_size)
+
+    # Writing a log to file
+    logger.info(f'[adm] Admin [ {current_admin.UUID} ] started reindexing')
+
+    return {'UUID': str(current_admin.UUID),
+            'response': {
+                'detail': 'Reindexing has been started',
+                'status': 202
+            }}
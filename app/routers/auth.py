@@ -1,6 +1,6 @@
 from random import randint
 
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response
 from fastapi.security import OAuth2PasswordRequestForm
 from redis.asyncio import StrictRedis
 from sqlalchemy import or_, select
@@ -8,16 +8,15 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.status import HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED, HTTP_404_NOT_FOUND
 
 from app.config import Config
-from app.elasticsearch.url import elastic
 from app.email.send_email import send_email_code, send_email_info
-from app.postgres.crud import get_user_by_email_or_username
+from app.postgres.crud import get_user_by_email_or_username, enqueue_index, update_password_hash
 from app.postgres.engine import get_db
 from app.postgres.tables import User
 from app.redis.crud import hsetex
 from app.redis.engine import get_redis
 from app.schemas import users
 from app.security.JWT import create_access_token, create_refresh_token, create_mail_token
-from app.security.password import hash_password, verify_password
+from app.security.password import hash_password, verify_and_update_password
 from app.security.authz import get_current_user, auth_email
 from app.email.bodies import EmailCode, EmailInfo
 
@@ -108,12 +107,14 @@ async def verify_registration(input_email_code: int,
     # Creating user in postgres
     user = User(username=data_username['username'],
                 email=data_username['email'],
-                hashed_password=hash_password(data_username['password']))
+                hashed_password=await hash_password(data_username['password']))
     db.add(user)
-    await db.commit()
+    await db.flush()
 
-    # Creating user in elasticsearch
-    await elastic.index(index='users', document=users.ElasticUser(username=user.username).dict())
+    # Creating user in elasticsearch (applied by the search indexer)
+    enqueue_index(db=db, index='users', document_id=user.UUID,
+                  document=users.ElasticUser(username=user.username, about_me=user.about_me, likes=user.likes).dict())
+    await db.commit()
 
     # Sending email with information about registration account to user mail
     await send_email_info(mail=users.EmailSchema(email=[user.email]), body=EmailInfo.registration_account_info)
@@ -166,6 +167,7 @@ async def resend_registration(response: Response,
 
 @router.post("/login", response_model=users.ReturnUser, status_code=200)
 async def login(response: Response,
+                background_tasks: BackgroundTasks,
                 form_data: OAuth2PasswordRequestForm = Depends()):
 
     user = await get_user_by_email_or_username(form_data.username)
@@ -176,13 +178,19 @@ async def login(response: Response,
             detail='User with this email or username not exist!'
         )
 
-    if not verify_password(plain_password=form_data.password,
-                           hashed_password=user.hashed_password):
+    verified, new_hash = await verify_and_update_password(plain_password=form_data.password,
+                                                          hashed_password=user.hashed_password)
+    if not verified:
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED,
             detail='Wrong password!'
         )
 
+    # Replacing a hash made with an old scheme or cost after the response
+    if new_hash is not None:
+        background_tasks.add_task(update_password_hash, user_id=user.UUID, old_hash=user.hashed_password,
+                                  new_hash=new_hash)
+
     access_token = await create_access_token(user_uuid=user.UUID)
     refresh_token = await create_refresh_token(user_uuid=user.UUID)
 
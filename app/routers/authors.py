@@ -1,14 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
+from json import dumps
+
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from redis.asyncio import StrictRedis
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from starlette.status import HTTP_404_NOT_FOUND
+from starlette.status import HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
 
-from app.elasticsearch.url import elastic
-from app.postgres.crud import get_users_by_usernames, get_users_without_search_query, get_posts_by_username
+from app.config import Config
+from app.postgres.crud import get_users_without_search_query, get_posts_by_username
 from app.postgres.engine import get_db
 from app.postgres.tables import User
+from app.redis.cache import get_search_page, set_search_page
+from app.redis.engine import get_redis
+from app.search.engine import search_backend
 from app.schemas import users
 from app.schemas import posts
+from app.schemas.pagination import encode_cursor, decode_cursor, encode_post_cursor, decode_post_cursor
 
 
 router = APIRouter()
@@ -19,37 +27,58 @@ router = APIRouter()
 # ================================================================
 
 
-@router.get('/', response_model=list[users.ReturnUserSearch], status_code=200)
+@router.get('/', response_model=list[users.ReturnUserSearch] | users.UsersPage, status_code=200)
 async def get_users_with_search(query: str = None,
                                 offset: int = 0,
-                                limit: int = 10):
-    """ Get a list of users (WITHOUT CONTENT) from db with search query / without search query """
+                                limit: int = 10,
+                                cursor: str = None,
+                                redis: StrictRedis = Depends(get_redis)):
+    """ Get a list of users (WITHOUT CONTENT) from db with search query / without search query.
+    Pass cursor (empty for the first page) with search query to page by next_cursor instead of offset """
+    next_cursor = None
     # If user has entered a search query
     if query:
-        response = await elastic.search(index='users', body={
-            "query": {
-                "match": {
-                    "username": {
-                        "query": query,
-                        "analyzer": "custom_analyzer",
-                    }
-                }
-            }
-        })
-        usernames = [user['_source']['username'] for user in response['hits']['hits']]
-        users_from_db = await get_users_by_usernames(usernames=usernames, offset=offset * 10, limit=limit)
+        cache_key = None
+        if cursor is not None:
+            found, after = await search_backend.search_after(index='users', query=query, limit=limit,
+                                                             cursor=decode_cursor(cursor) if cursor else [])
+            next_cursor = encode_cursor(after) if after is not None else None
+        else:
+            # Offset pages of a query are served from redis until the index changes
+            if search_backend.cached:
+                cache_key, cached_page = await get_search_page(redis=redis, index='users', query=query,
+                                                               offset=offset, limit=limit)
+                if cached_page is not None:
+                    return Response(content=cached_page, media_type='application/json')
+            found = await search_backend.search(index='users', query=query, offset=offset * 10, limit=limit)
+        # List fields are stored in the search index, so results are returned without a postgres round trip
+        result = [users.ReturnUserSearch(**user) for user in found]
 
     # Else, if user has not entered a search query
     else:
-        users_from_db = await get_users_without_search_query(offset=offset * 10, limit=limit)
+        if cursor is not None:
+            raise HTTPException(
+                status_code=HTTP_400_BAD_REQUEST,
+                detail='Cursor pagination requires search query'
+            )
+        users_from_db = await get_users_without_search_query(offset=offset, limit=limit)
+        result = users_from_db.scalars().all()
 
     # Checking existence for users
-    result = users_from_db.scalars().all()
     if not result:
         raise HTTPException(
             status_code=HTTP_404_NOT_FOUND,
             detail='Users not found'
         )
+    if cursor is not None:
+        return users.UsersPage(users=result, next_cursor=next_cursor)
+    if query:
+        # Caching ready-to-send page in redis
+        content = dumps(jsonable_encoder(result))
+        # Not when the page came from a fallback backend (search_backend.cached is per request)
+        if cache_key is not None and search_backend.cached:
+            await set_search_page(redis=redis, name=cache_key, page=content, time=Config.search_cache_ttl_seconds)
+        return Response(content=content, media_type='application/json')
     return result
 
 
@@ -76,13 +105,16 @@ async def open_profile_user(username: str,
 # ================================================================
 
 
-@router.get('/{username}/posts', response_model=list[posts.ReturnPostWithoutContent], status_code=200)
+@router.get('/{username}/posts', response_model=list[posts.ReturnPostWithoutContent] | posts.PostsPage,
+            status_code=200)
 async def get_user_posts(username: str,
                          offset: int = 0,
-                         limit: int = 10):
+                         limit: int = 10,
+                         cursor: str = None):
     """ Get a list of posts on page user profile (WITHOUT CONTENT) from db """
 
-    posts_from_db = await get_posts_by_username(username=username, offset=offset * 10, limit=limit)
+    posts_from_db = await get_posts_by_username(username=username, offset=offset, limit=limit,
+                                                after=decode_post_cursor(cursor) if cursor else None)
 
     result = posts_from_db.scalars().all()
     if not result:
@@ -90,4 +122,7 @@ async def get_user_posts(username: str,
             status_code=HTTP_404_NOT_FOUND,
             detail='Posts not found'
         )
+    if cursor is not None:
+        return posts.PostsPage(posts=result,
+                               next_cursor=encode_post_cursor(result[-1]) if len(result) == limit else None)
     return result
@@ -1,16 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import UUID4
+from redis.asyncio import StrictRedis
 from sqlalchemy import select, and_, update, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.status import HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND, HTTP_403_FORBIDDEN
 from loguru import logger
 
 from app.config import Config
-from app.elasticsearch.url import elastic
 from app.email.bodies import EmailInfoModerator
 from app.email.send_email import send_email_info
+from app.postgres.crud import enqueue_update
 from app.postgres.engine import get_db
-from app.postgres.tables import User, Post, Like
+from app.postgres.tables import User, Post
+from app.redis.cache import invalidate_feed, invalidate_posts, invalidate_users
+from app.redis.engine import get_redis
+from app.services import deletion
 from app.schemas import users, posts
 from app.security.authz import get_current_moderator
 
@@ -42,6 +46,7 @@ logger.add('app/logs/moderator/mdr.log',
 async def rename_user(user_uuid: UUID4,
                       new_username: str,
                       db: AsyncSession = Depends(get_db),
+                      redis: StrictRedis = Depends(get_redis),
                       current_moderator: users.ReturnUser = Depends(get_current_moderator)):
     """ Moderator can change users username (except 'admin' role) """
 
@@ -71,33 +76,26 @@ async def rename_user(user_uuid: UUID4,
     # Updating username in table User
     old_username = user.username
     user.username = new_username
-    await db.commit()
 
     # Updating username in posts user in table Post
-    await db.execute(
+    renamed_post_ids = (await db.scalars(
         update(Post)
         .where(Post.owner_UUID == user.UUID)
         .values(owner_username=new_username)
-    )
+        .returning(Post.id)
+    )).all()
+
+    # Updating username in indexes users and posts in elasticsearch (applied by the search indexer)
+    enqueue_update(db=db, index='users', document_ids=[user.UUID], fields={'username': new_username})
+    enqueue_update(db=db, index='posts', document_ids=renamed_post_ids, fields={'owner_username': new_username})
     await db.commit()
 
-    # Updating username in index users in elasticsearch
-    await elastic.update_by_query(
-        index='users',
-        body={
-            "script": {
-                "source": "ctx._source.username = params.new_username",
-                "params": {
-                    "new_username": new_username
-                }
-            },
-            "query": {
-                "match": {
-                    "username": user.username
-                }
-            }
-        }
-    )
+    # Dropping cached identity and posts user in redis and in every process
+    await invalidate_users(redis=redis, user_uuids=[user.UUID])
+    await invalidate_posts(redis=redis, post_ids=renamed_post_ids)
+
+    # Dropping cached feed pages in redis
+    await invalidate_feed(redis=redis)
 
     # Sending email with information about changed username to user mail
     await send_email_info(mail=users.EmailSchema(email=[user.email]), body=EmailInfoModerator.rename_user)
@@ -121,6 +119,7 @@ async def rename_user(user_uuid: UUID4,
 @router.delete('/{user_uuid}/delete')
 async def delete_user(user_uuid: UUID4,
                       db: AsyncSession = Depends(get_db),
+                      redis: StrictRedis = Depends(get_redis),
                       current_moderator: users.ReturnUser = Depends(get_current_moderator)):
     """ Moderator can delete user with role "user" """
 
@@ -138,40 +137,8 @@ async def delete_user(user_uuid: UUID4,
             detail='User has a role above "user"'
         )
 
-    # Deleting likes user in postgres
-    likes = await db.scalars(select(Like).where(Like.user_UUID == user.UUID))
-    for like in likes:
-        await db.delete(like)
-
-    posts = await db.scalars(select(Post).where(Post.owner_UUID == user.UUID))
-    for post in posts.all():
-        # Deleting posts current user from postgres
-        await db.delete(post)
-        # Deleting posts current user from elasticsearch
-        await elastic.delete_by_query(
-            index='posts',
-            body={
-                "query": {
-                    "match": {
-                        "id": post.id
-                    }
-                }
-            }
-        )
-    # Deleting current user from postgres
-    await db.delete(user)
-    await db.commit()
-    # Deleting current user from elasticsearch
-    await elastic.delete_by_query(
-        index='users',
-        body={
-            "query": {
-                "match": {
-                    "username": user.username
-                }
-            }
-        }
-    )
+    # Deleting user with his posts and likes in postgres, elasticsearch and redis
+    await deletion.delete_user(db=db, redis=redis, user=user)
 
     # Sending email with information about delete account to user mail
     await send_email_info(mail=users.EmailSchema(email=[user.email]), body=EmailInfoModerator.delete_user)
@@ -195,6 +162,7 @@ async def delete_user(user_uuid: UUID4,
 async def update_post(post_id: int,
                       input_post: posts.CreatePost,
                       db: AsyncSession = Depends(get_db),
+                      redis: StrictRedis = Depends(get_redis),
                       current_moderator: users.ReturnUser = Depends(get_current_moderator)):
     """ Moderator can update users post """
 
@@ -211,25 +179,16 @@ async def update_post(post_id: int,
         .where(Post.id == post_id)
         .values(title=input_post.title, content=input_post.content)
     )
+
+    # Updating post in elasticsearch (applied by the search indexer)
+    enqueue_update(db=db, index='posts', document_ids=[post_id], fields={'title': input_post.title})
     await db.commit()
 
-    # Updating post in elasticsearch
-    await elastic.update_by_query(
-        index='posts',
-        body={
-            "script": {
-                "source": "ctx._source.title = params.title",
-                "params": {
-                    "title": input_post.title
-                }
-            },
-            "query": {
-                "match": {
-                    "id": post_id
-                }
-            }
-        }
-    )
+    # Dropping cached post in redis
+    await invalidate_posts(redis=redis, post_ids=[post.id])
+
+    # Dropping cached feed pages in redis
+    await invalidate_feed(redis=redis)
 
     user = await db.scalar(select(User).where(User.UUID == post.owner_UUID))
 
@@ -259,6 +218,7 @@ async def update_post(post_id: int,
 @router.delete('/posts/{post_id}')
 async def delete_post(post_id: int,
                       db: AsyncSession = Depends(get_db),
+                      redis: StrictRedis = Depends(get_redis),
                       current_moderator: users.ReturnUser = Depends(get_current_moderator)):
     """ Moderator can delete users post """
 
@@ -272,25 +232,8 @@ async def delete_post(post_id: int,
 
     user = await db.scalar(select(User).where(User.UUID == post.owner_UUID))
 
-    # Deleting likes post in postgres
-    likes = await db.scalars(select(Like).where(Like.post_id == post.id))
-    for like in likes:
-        await db.delete(like)
-
-    await db.delete(post)
-    await db.commit()
-
-    # Deleting post in elasticsearch
-    await elastic.delete_by_query(
-        index='posts',
-        body={
-            "query": {
-                "match": {
-                    "id": post.id
-                }
-            }
-        }
-    )
+    # Deleting post with its likes in postgres, elasticsearch and redis
+    await deletion.delete_post(db=db, redis=redis, post=post)
 
     # Sending email with information about delete users post to mail
     await send_email_info(mail=users.EmailSchema(email=[user.email]), body=EmailInfoModerator.delete_post)
@@ -1,14 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException
+from json import dumps
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from redis.asyncio import StrictRedis
 from sqlalchemy import select, and_, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from starlette.status import HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
+from starlette.status import HTTP_304_NOT_MODIFIED, HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
 
-from app.elasticsearch.url import elastic
-from app.postgres.crud import get_posts_by_ids, get_posts_without_search_query, get_posts_user
+from app.config import Config
+from app.postgres.crud import (get_posts_by_ids, get_posts_without_search_query, get_posts_user, toggle_like,
+                               toggle_like_row, enqueue_index, enqueue_update)
 from app.postgres.engine import get_db
-from app.postgres.tables import Post, Like, User
+from app.postgres.tables import Post
+from app.redis.cache import (feed_key, get_feed_page, set_feed_page, invalidate_feed, make_etag, etag_matches,
+                             get_post_page, set_post_page, invalidate_posts, get_search_page, set_search_page)
+from app.redis.engine import get_redis
+from app.redis.ranking import get_ranked_post_ids, add_post, incr_post_likes
+from app.services import deletion
+from app.search.engine import search_backend
 from app.schemas import users
 from app.schemas import posts
+from app.schemas.pagination import encode_cursor, decode_cursor, encode_post_cursor, decode_post_cursor
 from app.security.authz import get_current_user
 
 
@@ -20,38 +32,84 @@ router = APIRouter()
 # ================================================================
 
 
-@router.get('/', response_model=list[posts.ReturnPostWithoutContent], status_code=200)
+@router.get('/', response_model=list[posts.ReturnPostWithoutContent] | posts.PostsPage, status_code=200)
 async def get_posts_with_search(query: str = None,
                                 offset: int = 0,
-                                limit: int = 10):
-    """ Get a list of posts (WITHOUT CONTENT) from db with search query / without search query """
+                                limit: int = 10,
+                                cursor: str = None,
+                                redis: StrictRedis = Depends(get_redis)):
+    """ Get a list of posts (WITHOUT CONTENT) from db with search query / without search query.
+    Pass cursor (empty for the first page) to page by next_cursor instead of offset """
+    next_cursor = None
     # If user has entered a search query
     if query:
-        response = await elastic.search(index='posts', body={
-            "query": {
-                "match": {
-                    "title": {
-                        "query": query,
-                        "analyzer": "custom_analyzer",
-                    }
-                }
-            }
-        })
-        ids_posts = [post['_source']['id'] for post in response['hits']['hits']]
-        posts_from_db = await get_posts_by_ids(ids=ids_posts, offset=offset * 10, limit=limit)
-
-    # Else, if user has not entered a search query
+        cache_key = None
+        if cursor is not None:
+            found, after = await search_backend.search_after(index='posts', query=query, limit=limit,
+                                                             cursor=decode_cursor(cursor) if cursor else [])
+            next_cursor = encode_cursor(after) if after is not None else None
+        else:
+            # Offset pages of a query are served from redis until the index changes
+            if search_backend.cached:
+                cache_key, cached_page = await get_search_page(redis=redis, index='posts', query=query,
+                                                               offset=offset, limit=limit)
+                if cached_page is not None:
+                    return Response(content=cached_page, media_type='application/json')
+            found = await search_backend.search(index='posts', query=query, offset=offset * 10, limit=limit)
+        # List fields are stored in the search index, so results are returned without a postgres round trip
+        result = [posts.ReturnPostWithoutContent(**post) for post in found]
+
+        # Checking existence for posts
+        if not result:
+            raise HTTPException(
+                status_code=HTTP_404_NOT_FOUND,
+                detail='Posts not found'
+            )
+        if cursor is not None:
+            return posts.PostsPage(posts=result, next_cursor=next_cursor)
+
+        # Caching ready-to-send page in redis
+        content = dumps(jsonable_encoder(result))
+        # Not when the page came from a fallback backend (search_backend.cached is per request)
+        if cache_key is not None and search_backend.cached:
+            await set_search_page(redis=redis, name=cache_key, page=content, time=Config.search_cache_ttl_seconds)
+        return Response(content=content, media_type='application/json')
+
+    # Else, if user has not entered a search query, the page is served from redis when cached
+    cache_key = feed_key(offset=offset, limit=limit, cursor=cursor)
+    cached_page = await get_feed_page(redis=redis, name=cache_key)
+    if cached_page is not None:
+        return Response(content=cached_page, media_type='application/json')
+
+    # Offset pages are taken from the redis ranking and hydrated by primary key,
+    # cursor pages (and a ranking that has not been built yet) use the keyset query in postgres
+    ranked_ids = None
+    if cursor is None:
+        ranked_ids = await get_ranked_post_ids(redis=redis, offset=offset * 10, limit=limit)
+    if ranked_ids is not None:
+        posts_from_db = await get_posts_by_ids(ids=ranked_ids)
     else:
-        posts_from_db = await get_posts_without_search_query(offset=offset * 10, limit=limit)
+        posts_from_db = (await get_posts_without_search_query(
+            offset=offset, limit=limit, after=decode_post_cursor(cursor) if cursor else None
+        )).scalars().all()
+    result = [posts.ReturnPostWithoutContent.model_validate(post, from_attributes=True) for post in posts_from_db]
 
     # Checking existence for posts
-    result = posts_from_db.scalars().all()
     if not result:
         raise HTTPException(
             status_code=HTTP_404_NOT_FOUND,
             detail='Posts not found'
         )
-    return result
+    if cursor is not None:
+        next_cursor = encode_post_cursor(result[-1]) if len(result) == limit else None
+        page = posts.PostsPage(posts=result, next_cursor=next_cursor)
+    else:
+        page = result
+
+    # Caching ready-to-send page in redis
+    content = dumps(jsonable_encoder(page))
+    await set_feed_page(redis=redis, name=cache_key, page=content, time=Config.feed_cache_ttl_seconds)
+    return Response(content=content, media_type='application/json')
 
 
 # ================================================================
@@ -59,14 +117,16 @@ async def get_posts_with_search(query: str = None,
 # ================================================================
 
 
-@router.get('/my-posts', response_model=list[posts.ReturnPostWithoutContent], status_code=200)
+@router.get('/my-posts', response_model=list[posts.ReturnPostWithoutContent] | posts.PostsPage, status_code=200)
 async def get_my_posts(offset: int = 0,
                        limit: int = 10,
+                       cursor: str = None,
                        current_user: users.ReturnUser = Depends(get_current_user)):
     """ Get a list of posts AUTHX USER (WITHOUT CONTENT) from db """
     posts_from_db = await get_posts_user(user_id=current_user.UUID,
-                                         offset=offset * 10,
-                                         limit=limit)
+                                         offset=offset,
+                                         limit=limit,
+                                         after=decode_post_cursor(cursor) if cursor else None)
 
     result = posts_from_db.scalars().all()
     if not result:
@@ -74,6 +134,9 @@ async def get_my_posts(offset: int = 0,
             status_code=HTTP_404_NOT_FOUND,
             detail='Posts not found'
         )
+    if cursor is not None:
+        return posts.PostsPage(posts=result,
+                               next_cursor=encode_post_cursor(result[-1]) if len(result) == limit else None)
     return result
 
 
@@ -84,15 +147,29 @@ async def get_my_posts(offset: int = 0,
 
 @router.get('/{post_id}', response_model=posts.ReturnFullPost, status_code=200)
 async def open_post(post_id: int,
-                    db: AsyncSession = Depends(get_db)):
-    """ Return full post (WITH CONTENT) from postgres """
-    post = await db.scalar(select(Post).where(Post.id == post_id))
-    if not post:
-        raise HTTPException(
-            status_code=HTTP_404_NOT_FOUND,
-            detail='Posts not found'
-        )
-    return post
+                    request: Request,
+                    db: AsyncSession = Depends(get_db),
+                    redis: StrictRedis = Depends(get_redis)):
+    """ Return full post (WITH CONTENT) from redis / postgres, or 304 if the client has its ETag """
+    cached_post = await get_post_page(redis=redis, post_id=post_id)
+    if cached_post:
+        content, etag = cached_post['content'], cached_post['etag']
+    else:
+        post = await db.scalar(select(Post).where(Post.id == post_id))
+        if not post:
+            raise HTTPException(
+                status_code=HTTP_404_NOT_FOUND,
+                detail='Posts not found'
+            )
+        # Caching ready-to-send post in redis
+        content = dumps(jsonable_encoder(posts.ReturnFullPost.model_validate(post, from_attributes=True)))
+        etag = make_etag(content)
+        await set_post_page(redis=redis, post_id=post_id, content=content, etag=etag,
+                            time=Config.post_cache_ttl_seconds)
+
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return Response(status_code=HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return Response(content=content, media_type='application/json', headers={'ETag': etag})
 
 
 # ================================================================
@@ -103,6 +180,7 @@ async def open_post(post_id: int,
 @router.post('/', response_model=posts.ReturnFullPost, status_code=201)
 async def create_post(input_post: posts.CreatePost,
                       db: AsyncSession = Depends(get_db),
+                      redis: StrictRedis = Depends(get_redis),
                       current_user: users.ReturnUser = Depends(get_current_user)):
     """ User can create a new post """
 
@@ -113,16 +191,26 @@ async def create_post(input_post: posts.CreatePost,
                 content=input_post.content)
     try:
         db.add(post)
-        await db.commit()
+        await db.flush()
     except:
         raise HTTPException(
             status_code=HTTP_400_BAD_REQUEST,
             detail='You already have a post with this title or content'
         )
 
-    # Creating post in elasticsearch
-    await elastic.index(index='posts', document=posts.ElasticPost(id=post.id,
-                                                                  title=post.title).dict())
+    # Creating post in elasticsearch (applied by the search indexer)
+    enqueue_index(db=db, index='posts', document_id=post.id,
+                  document=posts.ElasticPost(id=post.id, owner_UUID=post.owner_UUID,
+                                             owner_username=post.owner_username, title=post.title,
+                                             created_at=post.created_at, likes=post.likes).dict())
+    await db.commit()
+
+    # Adding post to ranking in redis
+    await add_post(redis=redis, post_id=post.id, created_at=post.created_at)
+
+    # Dropping cached feed pages in redis
+    await invalidate_feed(redis=redis)
+
     return posts.ReturnFullPost(id=post.id, owner_UUID=current_user.UUID, owner_username=current_user.username,
                                 title=post.title, content=post.content, created_at=post.created_at, likes=post.likes)
 
@@ -130,6 +218,7 @@ async def create_post(input_post: posts.CreatePost,
 @router.delete('/{post_id}', status_code=200)
 async def delete_post(post_id: int,
                       db: AsyncSession = Depends(get_db),
+                      redis: StrictRedis = Depends(get_redis),
                       current_user: users.ReturnUser = Depends(get_current_user)):
     """ User can delete his post """
 
@@ -141,25 +230,9 @@ async def delete_post(post_id: int,
             detail='Post not found'
         )
 
-    # Deleting likes post in postgres
-    likes = await db.scalars(select(Like).where(Like.post_id == post.id))
-    for like in likes:
-        await db.delete(like)
-
-    await db.delete(post)
-    await db.commit()
+    # Deleting post with its likes in postgres, elasticsearch and redis
+    await deletion.delete_post(db=db, redis=redis, post=post)
 
-    # Deleting post in elasticsearch
-    await elastic.delete_by_query(
-        index='posts',
-        body={
-            "query": {
-                "match": {
-                    "id": post.id
-                }
-            }
-        }
-    )
     return {'detail': 'Post have been successfully deleted'}
 
 
@@ -167,6 +240,7 @@ async def delete_post(post_id: int,
 async def update_post(post_id: int,
                       input_post: posts.CreatePost,
                       db: AsyncSession = Depends(get_db),
+                      redis: StrictRedis = Depends(get_redis),
                       current_user: users.ReturnUser = Depends(get_current_user)):
     """ User can update his post """
 
@@ -182,25 +256,17 @@ async def update_post(post_id: int,
         .where(and_(Post.id == post_id, Post.owner_UUID == current_user.UUID))
         .values(title=input_post.title, content=input_post.content)
     )
+
+    # Updating post in elasticsearch (applied by the search indexer)
+    enqueue_update(db=db, index='posts', document_ids=[post_id], fields={'title': input_post.title})
     await db.commit()
 
-    # Updating post in elasticsearch
-    await elastic.update_by_query(
-        index='posts',
-        body={
-            "script": {
-                "source": "ctx._source.title = params.title",
-                "params": {
-                    "title": input_post.title
-                }
-            },
-            "query": {
-                "match": {
-                    "id": post_id
-                }
-            }
-        }
-    )
+    # Dropping cached post in redis
+    await invalidate_posts(redis=redis, post_ids=[post.id])
+
+    # Dropping cached feed pages in redis
+    await invalidate_feed(redis=redis)
+
     return posts.ReturnFullPost(id=post.id, owner_UUID=current_user.UUID, owner_username=current_user.username,
                                 title=post.title, content=post.content, created_at=post.created_at, likes=post.likes)
 
@@ -213,9 +279,22 @@ async def update_post(post_id: int,
 @router.put("/{post_id}/like", response_model=posts.ReturnFullPost, status_code=201)
 async def like_or_unlike_post(post_id: int,
                               current_user: users.ReturnUser = Depends(get_current_user),
-                              db: AsyncSession = Depends(get_db)):
+                              db: AsyncSession = Depends(get_db),
+                              redis: StrictRedis = Depends(get_redis)):
 
-    post = await db.scalar(select(Post).where(Post.id == post_id))
+    if Config.likes_write_behind:
+        # Toggling like and recording its delta in postgres, likes of post and owner are updated by the flusher
+        post = await toggle_like_row(db=db, user_id=current_user.UUID, post_id=post_id)
+    else:
+        # Toggling like and updating likes of post and owner in postgres
+        post = await toggle_like(db=db, user_id=current_user.UUID, post_id=post_id)
+        if post is not None and post.delta:
+            # Updating likes of post and owner in elasticsearch (applied by the search indexer)
+            enqueue_update(db=db, index='posts', document_ids=[post.id], fields={'likes': post.likes})
+            if post.owner_likes is not None:
+                enqueue_update(db=db, index='users', document_ids=[post.owner_UUID],
+                               fields={'likes': post.owner_likes})
+    await db.commit()
 
     if post is None:
         raise HTTPException(
@@ -223,28 +302,20 @@ async def like_or_unlike_post(post_id: int,
             detail='Post not found'
         )
 
-    owner = await db.scalar(select(User).where(User.UUID == post.owner_UUID))
+    likes = post.likes
+    if Config.likes_write_behind:
+        # Likes of post with the deltas not flushed yet
+        likes = (post.likes or 0) + post.pending
+    if post.delta:
+        if not Config.likes_write_behind:
+            # Dropping cached post in redis
+            await invalidate_posts(redis=redis, post_ids=[post.id])
 
-    if owner is None:
-        raise HTTPException(
-            status_code=HTTP_404_NOT_FOUND,
-            detail='User not found'
-        )
+        # Updating post score in ranking in redis
+        await incr_post_likes(redis=redis, post_id=post.id, created_at=post.created_at, amount=post.delta)
 
-    existing_like = await db.scalar(select(Like).where(Like.user_UUID == current_user.UUID,
-                                                       Like.post_id == post_id))
-    if existing_like:
-        await db.delete(existing_like)
-        post.likes -= 1
-        owner.likes -= 1
-    else:
-        like = Like(user_UUID=current_user.UUID,
-                    post_id=post_id)
-        db.add(like)
-        post.likes += 1
-        owner.likes += 1
-
-    await db.commit()
+        # Dropping cached feed pages in redis
+        await invalidate_feed(redis=redis)
 
     return posts.ReturnFullPost(id=post.id, owner_UUID=post.owner_UUID, owner_username=post.owner_username,
-                                title=post.title, content=post.content, created_at=post.created_at, likes=post.likes)
+                                title=post.title, content=post.content, created_at=post.created_at, likes=likes)
@@ -0,0 +1,59 @@
+import asyncio
+from json import dumps
+
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from redis.asyncio import StrictRedis
+from starlette.status import HTTP_400_BAD_REQUEST
+
+from app.config import Config
+from app.redis.cache import get_suggestions, set_suggestions
+from app.redis.engine import get_redis
+from app.search.engine import search_backend
+from app.schemas import search
+
+
+router = APIRouter()
+
+MAX_SUGGESTIONS = 10
+
+
+# ================================================================
+# Type-ahead suggestions for post titles and usernames
+# ================================================================
+
+
+@router.get('/suggest', response_model=search.Suggestions, status_code=200)
+async def get_suggestions_by_prefix(prefix: str,
+                                    limit: int = 5,
+                                    redis: StrictRedis = Depends(get_redis)):
+    """ Post titles and usernames starting with prefix: only ids and display strings, for every keystroke """
+    if not 0 < limit <= MAX_SUGGESTIONS:
+        raise HTTPException(
+            status_code=HTTP_400_BAD_REQUEST,
+            detail=f'Limit must be from 1 to {MAX_SUGGESTIONS}'
+        )
+    prefix = ' '.join(prefix.lower().split())
+    if not prefix:
+        return search.Suggestions(posts=[], users=[])
+
+    # Checking suggestions for this prefix in redis
+    cached = await get_suggestions(redis=redis, prefix=prefix, limit=limit)
+    if cached is not None:
+        return Response(content=cached, media_type='application/json')
+
+    # Searching titles and usernames
+    post_suggestions, user_suggestions = await asyncio.gather(
+        search_backend.suggest(index='posts', prefix=prefix, limit=limit),
+        search_backend.suggest(index='users', prefix=prefix, limit=limit)
+    )
+    suggestions = search.Suggestions(
+        posts=[search.Suggestion(id=suggestion_id, text=text) for suggestion_id, text in post_suggestions],
+        users=[search.Suggestion(id=suggestion_id, text=text) for suggestion_id, text in user_suggestions]
+    )
+
+    # Caching suggestions in redis
+    await set_suggestions(redis=redis, prefix=prefix, limit=limit, suggestions=dumps(jsonable_encoder(suggestions)),
+                          time=Config.suggest_cache_ttl_seconds)
+
+    return suggestions
@@ -0,0 +1,46 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import datetime
+from json import dumps, loads
+
+from fastapi import HTTPException
+from starlette.status import HTTP_400_BAD_REQUEST
+
+
+def encode_cursor(values: list) -> str:
+    """ Pack the sort key of the last row on a page into an opaque url-safe string """
+    return urlsafe_b64encode(dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> list:
+    """ Unpack a cursor created by encode_cursor """
+    try:
+        values = loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (BinasciiError, UnicodeDecodeError, ValueError):
+        raise HTTPException(
+            status_code=HTTP_400_BAD_REQUEST,
+            detail='Invalid cursor'
+        )
+    if not isinstance(values, list):
+        raise HTTPException(
+            status_code=HTTP_400_BAD_REQUEST,
+            detail='Invalid cursor'
+        )
+    return values
+
+
+def encode_post_cursor(post) -> str:
+    """ Cursor for the posts feed ordering: (likes, created_at, id) of the last post on a page """
+    return encode_cursor([post.likes, post.created_at.isoformat(), post.id])
+
+
+def decode_post_cursor(cursor: str) -> tuple[int, datetime, int]:
+    values = decode_cursor(cursor)
+    try:
+        likes, created_at, post_id = values
+        return int(likes), datetime.fromisoformat(created_at), int(post_id)
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=HTTP_400_BAD_REQUEST,
+            detail='Invalid cursor'
+        )
@@ -35,7 +35,11 @@ class CreatePost(BaseModel):
 
 class ElasticPost(BaseModel):
     id: int
+    owner_UUID: UUID4
+    owner_username: str
     title: str
+    created_at: datetime
+    likes: int
 
 
 class ReturnPostWithoutContent(BaseModel):
@@ -55,3 +59,8 @@ class ReturnFullPost(BaseModel):
     content: str
     created_at: datetime
     likes: int
+
+
+class PostsPage(BaseModel):
+    posts: list[ReturnPostWithoutContent]
+    next_cursor: str | None
@@ -0,0 +1,11 @@
+from pydantic import BaseModel
+
+
+class Suggestion(BaseModel):
+    id: str
+    text: str
+
+
+class Suggestions(BaseModel):
+    posts: list[Suggestion]
+    users: list[Suggestion]
@@ -75,6 +75,8 @@ class Username(BaseModel):
 
 class ElasticUser(BaseModel):
     username: str
+    about_me: str | None = None
+    likes: int = 0
 
 
 class EmailSchema(BaseModel):
@@ -112,3 +114,14 @@ class ReturnFullUser(BaseModel):
     about_me: str | None
     likes: int
     role: str
+
+
+class UsersPage(BaseModel):
+    users: list[ReturnUserSearch]
+    next_cursor: str | None
+
+
+class UserIdentity(BaseModel):
+    UUID: UUID4
+    username: str
+    role: str
@@ -0,0 +1,36 @@
+class SearchBackend:
+    """ Full-text search over indexes 'posts' and 'users'.
+    Results are the list fields of the index: ReturnPostWithoutContent / ReturnUserSearch as dicts """
+
+    # Pages may be cached until the search indexer bumps the generation of the index (app.redis.cache)
+    cached = False
+
+    async def start(self):
+        """ Prepare the backend at application startup """
+
+    async def stop(self):
+        """ Release the backend at application shutdown """
+
+    async def search(self,
+                     index: str,
+                     query: str,
+                     offset: int,
+                     limit: int) -> list[dict]:
+        """ Page of results in relevance order by offset """
+        raise NotImplementedError
+
+    async def search_after(self,
+                           index: str,
+                           query: str,
+                           limit: int,
+                           cursor: list) -> tuple[list[dict], list | None]:
+        """ Page of results in relevance order after cursor ([] for the first page).
+        Returns results and the cursor of the next page (None after the last page) """
+        raise NotImplementedError
+
+    async def suggest(self,
+                      index: str,
+                      prefix: str,
+                      limit: int) -> list[tuple[str, str]]:
+        """ (id, display text) of titles/usernames starting with prefix """
+        raise NotImplementedError
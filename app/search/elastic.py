@@ -0,0 +1,48 @@
+from fastapi import HTTPException
+from starlette.status import HTTP_400_BAD_REQUEST
+
+from app.elasticsearch.crud import search_page, search_page_after, suggest
+from app.search.base import SearchBackend
+
+# Searched field and display field of each index
+FIELDS = {
+    'posts': 'title',
+    'users': 'username',
+}
+
+
+class ElasticSearchBackend(SearchBackend):
+    """ Search in elasticsearch, kept in sync by the search indexer """
+
+    name = 'elasticsearch'
+    cached = True
+
+    async def search(self, index, query, offset, limit):
+        hits = await search_page(index=index, query=self.match(index, query), offset=offset, limit=limit)
+        return [hit['_source'] for hit in hits]
+
+    async def search_after(self, index, query, limit, cursor):
+        if cursor and cursor[0] != self.name:
+            raise HTTPException(
+                status_code=HTTP_400_BAD_REQUEST,
+                detail='Cursor has expired'
+            )
+        hits, after = await search_page_after(index=index, query=self.match(index, query), limit=limit,
+                                              cursor=cursor[1:])
+        return [hit['_source'] for hit in hits], [self.name, *after] if after is not None else None
+
+    async def suggest(self, index, prefix, limit):
+        field = FIELDS[index]
+        hits = await suggest(index=index, field=field, prefix=prefix, limit=limit)
+        return [(hit['_id'], hit['_source'][field]) for hit in hits]
+
+    @staticmethod
+    def match(index: str,
+              query: str) -> dict:
+        return {
+            "match": {
+                FIELDS[index]: {
+                    "query": query
+                }
+            }
+        }
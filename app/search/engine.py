@@ -0,0 +1,20 @@
+from app.config import Config
+from app.search.base import SearchBackend
+from app.search.elastic import ElasticSearchBackend
+from app.search.failover import FailoverSearchBackend
+from app.search.memory import MemorySearchBackend
+from app.search.postgres import PostgresSearchBackend
+
+
+def create_search_backend() -> SearchBackend:
+    """ SEARCH_BACKEND=elasticsearch|postgres|memory, with SEARCH_FAILOVER=1 elasticsearch falls back to postgres """
+    if Config.search_backend == 'postgres':
+        return PostgresSearchBackend()
+    if Config.search_backend == 'memory':
+        return MemorySearchBackend()
+    if Config.search_failover:
+        return FailoverSearchBackend(primary=ElasticSearchBackend(), fallback=PostgresSearchBackend())
+    return ElasticSearchBackend()
+
+
+search_backend = create_search_backend()
@@ -0,0 +1,69 @@
+from contextvars import ContextVar
+
+from elasticsearch import ApiError, TransportError
+from fastapi import HTTPException
+from loguru import logger
+from starlette.status import HTTP_400_BAD_REQUEST
+
+from app.search.base import SearchBackend
+
+
+def is_unavailable(error: Exception) -> bool:
+    """ Connection errors, timeouts and 5xx replies, not errors of the request itself """
+    return isinstance(error, TransportError) or (isinstance(error, ApiError) and error.status_code >= 500)
+
+
+class FailoverSearchBackend(SearchBackend):
+    """ Search in primary, in fallback while primary is unavailable """
+
+    def __init__(self,
+                 primary: SearchBackend,
+                 fallback: SearchBackend):
+        self.primary = primary
+        self.fallback = fallback
+        # Set by the last search of the current request (task) when fallback served it
+        self.served_by_fallback = ContextVar('served_by_fallback', default=False)
+
+    @property
+    def cached(self) -> bool:
+        """ Pages of fallback are not cached: they would be served under the generation of primary
+        after primary recovers """
+        return self.primary.cached and not self.served_by_fallback.get()
+
+    async def search(self, index, query, offset, limit):
+        self.served_by_fallback.set(False)
+        try:
+            return await self.primary.search(index=index, query=query, offset=offset, limit=limit)
+        except (ApiError, TransportError) as error:
+            if not is_unavailable(error):
+                raise
+            logger.warning(f'Search failed over to {self.fallback.name}: {error}')
+            self.served_by_fallback.set(True)
+            return await self.fallback.search(index=index, query=query, offset=offset, limit=limit)
+
+    async def search_after(self, index, query, limit, cursor):
+        # Pages started in fallback are continued there
+        if cursor and cursor[0] == self.fallback.name:
+            return await self.fallback.search_after(index=index, query=query, limit=limit, cursor=cursor)
+        try:
+            return await self.primary.search_after(index=index, query=query, limit=limit, cursor=cursor)
+        except (ApiError, TransportError) as error:
+            if not is_unavailable(error):
+                raise
+            logger.warning(f'Search failed over to {self.fallback.name}: {error}')
+            if cursor:
+                # A cursor of primary can not be continued in fallback, the client starts over like after expiry
+                raise HTTPException(
+                    status_code=HTTP_400_BAD_REQUEST,
+                    detail='Cursor has expired'
+                )
+            return await self.fallback.search_after(index=index, query=query, limit=limit, cursor=cursor)
+
+    async def suggest(self, index, prefix, limit):
+        try:
+            return await self.primary.suggest(index=index, prefix=prefix, limit=limit)
+        except (ApiError, TransportError) as error:
+            if not is_unavailable(error):
+                raise
+            logger.warning(f'Suggest failed over to {self.fallback.name}: {error}')
+            return await self.fallback.suggest(index=index, prefix=prefix, limit=limit)
@@ -0,0 +1,304 @@
+import asyncio
+from array import array
+from collections import Counter
+from heapq import nlargest
+from json import loads
+from math import log
+from re import findall
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from loguru import logger
+from sqlalchemy import select
+from starlette.status import HTTP_400_BAD_REQUEST
+
+from app.postgres.engine import async_session
+from app.postgres.tables import Post, User
+from app.redis.engine import create_redis
+from app.redis.search import SEARCH_ACTIONS
+from app.search.base import SearchBackend
+
+# custom_analyzer of the elasticsearch indexes: standard tokenizer, lowercase, edge n-grams 2-10 + original token
+MIN_GRAM = 2
+MAX_GRAM = 10
+# BM25 parameters of elasticsearch
+K1 = 1.2
+B = 0.75
+# Longest wait before resubscribing to the search actions
+MAX_BACKOFF_SECONDS = 30
+
+
+def tokenize(text: str) -> list[str]:
+    return findall(r'\w+', text.lower())
+
+
+def analyze(text: str) -> list[str]:
+    """ Index-time terms of text """
+    terms = []
+    for token in tokenize(text):
+        terms.extend(token[:size] for size in range(MIN_GRAM, min(len(token), MAX_GRAM) + 1))
+        if len(token) > MAX_GRAM or len(token) < MIN_GRAM:
+            terms.append(token)
+    return terms
+
+
+class Trie:
+    """ Prefix tree of lowercased words -> document numbers """
+
+    __slots__ = ('children', 'documents')
+
+    def __init__(self):
+        self.children = {}
+        self.documents = set()
+
+    def insert(self, word: str, document: int):
+        node = self
+        for char in word:
+            node = node.children.setdefault(char, Trie())
+        node.documents.add(document)
+
+    def remove(self, word: str, document: int):
+        node = self
+        for char in word:
+            node = node.children.get(char)
+            if node is None:
+                return
+        node.documents.discard(document)
+
+    def prefixed(self, prefix: str, limit: int) -> list[int]:
+        """ Up to limit documents of words starting with prefix, shortest words first """
+        node = self
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        found, level = [], [node]
+        while level and len(found) < limit:
+            found.extend(document for node in level for document in sorted(node.documents))
+            level = [child for node in level for _, child in sorted(node.children.items())]
+        return found[:limit]
+
+
+class InvertedIndex:
+    """ Inverted index of one text field: term -> posting list of document numbers with term frequencies
+    (arrays, appended in document order). Changed and deleted documents are tombstoned and the index
+    is rebuilt when tombstones outnumber live documents """
+
+    def __init__(self, field: str, key: str, key_type: type, words: bool = False):
+        self.field = field
+        self.key = key
+        self.key_type = key_type
+        self.postings: dict[str, tuple[array, array]] = {}
+        self.documents: list[dict | None] = []
+        self.lengths = array('I')
+        self.numbers: dict[str, int] = {}
+        self.total_length = 0
+        # Prefix tree of whole field values for suggestions (usernames)
+        self.trie = Trie() if words else None
+
+    @property
+    def live(self) -> int:
+        return len(self.numbers)
+
+    def put(self, document_id: str, document: dict):
+        self.delete(document_id)
+        number = len(self.documents)
+        self.documents.append(document)
+        self.numbers[document_id] = number
+
+        terms = analyze(document[self.field])
+        self.lengths.append(len(terms))
+        self.total_length += len(terms)
+        for term, frequency in Counter(terms).items():
+            documents, frequencies = self.postings.setdefault(term, (array('I'), array('H')))
+            documents.append(number)
+            frequencies.append(min(frequency, 0xFFFF))
+        if self.trie is not None:
+            self.trie.insert(document[self.field].lower(), number)
+
+    def update(self, document_id: str, fields: dict):
+        number = self.numbers.get(document_id)
+        if number is None:
+            return
+        document = {**self.documents[number], **fields}
+        if self.field in fields:
+            self.put(document_id, document)
+        else:
+            self.documents[number] = document
+
+    def delete(self, document_id: str):
+        number = self.numbers.pop(document_id, None)
+        if number is None:
+            return
+        if self.trie is not None:
+            self.trie.remove(self.documents[number][self.field].lower(), number)
+        self.documents[number] = None
+        self.total_length -= self.lengths[number]
+        if len(self.documents) > 2 * self.live + 1000:
+            self.compact()
+
+    def compact(self):
+        documents = [(document_id, self.documents[number]) for document_id, number in self.numbers.items()]
+        self.__init__(field=self.field, key=self.key, key_type=self.key_type, words=self.trie is not None)
+        for document_id, document in documents:
+            self.put(document_id, document)
+
+    def scores(self, query: str) -> dict[int, float]:
+        """ BM25 scores of live documents matching any term of query (elasticsearch match query) """
+        scores = {}
+        if not self.live:
+            return scores
+        average_length = self.total_length / self.live
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            documents, frequencies = posting
+            idf = log(1 + (self.live - len(documents) + 0.5) / (len(documents) + 0.5))
+            for number, frequency in zip(documents, frequencies):
+                if self.documents[number] is None:
+                    continue
+                norm = frequency + K1 * (1 - B + B * self.lengths[number] / average_length)
+                scores[number] = scores.get(number, 0) + idf * frequency * (K1 + 1) / norm
+        return scores
+
+    def ranked(self, scores: dict[int, float], count: int) -> list[tuple[float, int]]:
+        """ Top count (score, number), ties by document key descending like the postgres backend """
+        return nlargest(count, ((score, number) for number, score in scores.items()),
+                        key=lambda item: (item[0], self.sort_key(item[1])))
+
+    def sort_key(self, number: int):
+        return self.documents[number][self.key]
+
+    def result(self, number: int) -> dict:
+        return {field: value for field, value in self.documents[number].items() if not field.startswith('_')}
+
+
+class MemorySearchBackend(SearchBackend):
+    """ Search without elasticsearch for single-node deployments: in-memory inverted indexes of every process,
+    built from postgres at startup and updated with the actions published by the search indexer """
+
+    name = 'memory'
+
+    def __init__(self):
+        self.indexes = self.empty_indexes()
+        self.loaded = asyncio.Event()
+        self.listener = None
+
+    @staticmethod
+    def empty_indexes() -> dict[str, InvertedIndex]:
+        return {
+            'posts': InvertedIndex(field='title', key='id', key_type=int),
+            'users': InvertedIndex(field='username', key='_UUID', key_type=str, words=True),
+        }
+
+    async def start(self):
+        """ Waits for the first load, so the process does not serve searches from empty indexes """
+        self.listener = asyncio.create_task(self.listen())
+        await self.loaded.wait()
+
+    async def stop(self):
+        if self.listener is not None:
+            self.listener.cancel()
+            await asyncio.gather(self.listener, return_exceptions=True)
+
+    async def load(self, batch_size: int = 10000):
+        """ Build fresh indexes from postgres and swap them in """
+        indexes = self.empty_indexes()
+        db = async_session()
+        try:
+            posts = await db.stream_scalars(select(Post).execution_options(yield_per=batch_size))
+            async for post in posts:
+                indexes['posts'].put(str(post.id), jsonable_encoder({
+                    'id': post.id, 'owner_UUID': post.owner_UUID, 'owner_username': post.owner_username,
+                    'title': post.title, 'created_at': post.created_at, 'likes': post.likes
+                }))
+            users = await db.stream_scalars(select(User).execution_options(yield_per=batch_size))
+            async for user in users:
+                indexes['users'].put(str(user.UUID), {
+                    '_UUID': str(user.UUID), 'username': user.username, 'about_me': user.about_me,
+                    'likes': user.likes
+                })
+        finally:
+            await db.close()
+        self.indexes = indexes
+        logger.info(f'Memory search loaded: {indexes["posts"].live} posts, {indexes["users"].live} users')
+
+    async def listen(self):
+        """ Background task: apply published actions. Changes published while the subscription is down are lost,
+        so the indexes are reloaded from postgres after every (re)subscription """
+        backoff = 1
+        while True:
+            redis = create_redis()
+            pubsub = redis.pubsub()
+            try:
+                # Subscribing before loading, changes made meanwhile are applied after (actions are idempotent)
+                await pubsub.subscribe(SEARCH_ACTIONS)
+                await self.load()
+                self.loaded.set()
+                backoff = 1
+                async for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self.apply(loads(message['data']))
+            except Exception:
+                logger.exception('Memory search sync failed')
+            finally:
+                await pubsub.aclose()
+                await redis.aclose()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+
+    def apply(self, actions: list):
+        for action, index, document_id, body in actions:
+            index = self.indexes[index]
+            if action == 'index':
+                if index.key == '_UUID':
+                    body = {**body, '_UUID': document_id}
+                index.put(document_id, body)
+            elif action == 'update':
+                index.update(document_id, body)
+            elif action == 'delete':
+                index.delete(document_id)
+
+    async def search(self, index, query, offset, limit):
+        index = self.indexes[index]
+        ranked = index.ranked(index.scores(query), offset + limit)
+        return [index.result(number) for _, number in ranked[offset:]]
+
+    async def search_after(self, index, query, limit, cursor):
+        index = self.indexes[index]
+        scores = index.scores(query)
+        if cursor:
+            try:
+                name, last_score, last_key = cursor
+                if name != self.name:
+                    raise ValueError
+                last = (float(last_score), index.key_type(last_key))
+            except (TypeError, ValueError):
+                raise HTTPException(
+                    status_code=HTTP_400_BAD_REQUEST,
+                    detail='Invalid cursor'
+                )
+            scores = {number: score for number, score in scores.items() if (score, index.sort_key(number)) < last}
+        ranked = index.ranked(scores, limit)
+
+        after = None
+        if len(ranked) == limit:
+            score, number = ranked[-1]
+            after = [self.name, score, index.sort_key(number)]
+        return [index.result(number) for _, number in ranked], after
+
+    async def suggest(self, index, prefix, limit):
+        inverted = self.indexes[index]
+        if inverted.trie is not None:
+            numbers = inverted.trie.prefixed(prefix.lower(), limit)
+        else:
+            # Every word of prefix must match, words are matched as prefixes up to MAX_GRAM chars
+            matching = None
+            for word in set(tokenize(prefix)):
+                documents = set(inverted.postings.get(word, (array('I'),))[0])
+                matching = documents if matching is None else matching & documents
+            scores = inverted.scores(prefix)
+            numbers = [number for _, number in inverted.ranked(
+                {number: scores[number] for number in matching or () if number in scores}, limit)]
+        return [(str(inverted.sort_key(number)), inverted.documents[number][inverted.field]) for number in numbers]
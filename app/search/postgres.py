@@ -0,0 +1,103 @@
+from re import findall
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy import select, func, or_, cast, tuple_, Float
+from starlette.status import HTTP_400_BAD_REQUEST
+
+from app.postgres.engine import async_session
+from app.postgres.tables import Post, User
+from app.search.base import SearchBackend
+
+# Index -> (key column, searched column, tsvector column, list fields)
+TABLES = {
+    'posts': (Post.id, Post.title, Post.search_vector,
+              (Post.id, Post.owner_UUID, Post.owner_username, Post.title, Post.created_at, Post.likes)),
+    'users': (User.UUID, User.username, User.search_vector,
+              (User.username, User.about_me, User.likes)),
+}
+
+
+def prefix_tsquery(text: str,
+                   operator: str):
+    """ to_tsquery matching every word of text as a prefix ('word:*'), None if there are no words """
+    words = findall(r'[^\W_]+', text.lower())
+    if not words:
+        return None
+    return func.to_tsquery('simple', f' {operator} '.join(f'{word}:*' for word in words))
+
+
+def escape_like(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class PostgresSearchBackend(SearchBackend):
+    """ Search in postgres: generated tsvector columns with GIN indexes for words and word prefixes,
+    pg_trgm GIN indexes for substrings. Ranked by ts_rank + trigram similarity """
+
+    name = 'postgres'
+
+    def statement(self,
+                  index: str,
+                  query: str):
+        key, column, vector, fields = TABLES[index]
+        tsquery = prefix_tsquery(query, '|')
+        conditions = [column.ilike(f'%{escape_like(query.strip())}%', escape='\\')]
+        rank = func.similarity(column, query)
+        if tsquery is not None:
+            conditions.append(vector.op('@@')(tsquery))
+            rank = rank + func.ts_rank(vector, tsquery)
+        # Compared as double precision in the cursor, so the value survives a json round trip
+        rank = cast(rank, Float)
+        return select(*fields, rank.label('rank'), key.label('key')).where(or_(*conditions)), rank, key
+
+    async def fetch(self,
+                    statement) -> list:
+        db = async_session()
+        try:
+            return (await db.execute(statement)).mappings().all()
+        finally:
+            await db.close()
+
+    @staticmethod
+    def result(row) -> dict:
+        return {field: value for field, value in row.items() if field not in ('rank', 'key')}
+
+    async def search(self, index, query, offset, limit):
+        statement, rank, key = self.statement(index, query)
+        rows = await self.fetch(statement.order_by(rank.desc(), key.desc()).offset(offset).limit(limit))
+        return [self.result(row) for row in rows]
+
+    async def search_after(self, index, query, limit, cursor):
+        statement, rank, key = self.statement(index, query)
+        if cursor:
+            try:
+                name, last_rank, last_key = cursor
+                if name != self.name:
+                    raise ValueError
+                last_rank, last_key = float(last_rank), UUID(last_key) if index == 'users' else int(last_key)
+            except (TypeError, ValueError):
+                raise HTTPException(
+                    status_code=HTTP_400_BAD_REQUEST,
+                    detail='Invalid cursor'
+                )
+            statement = statement.where(tuple_(rank, key) < (last_rank, last_key))
+        rows = await self.fetch(statement.order_by(rank.desc(), key.desc()).limit(limit))
+
+        after = None
+        if len(rows) == limit:
+            after = [self.name, rows[-1]['rank'], str(rows[-1]['key'])]
+        return [self.result(row) for row in rows], after
+
+    async def suggest(self, index, prefix, limit):
+        key, column, vector, _ = TABLES[index]
+        tsquery = prefix_tsquery(prefix, '&')
+        if tsquery is None:
+            return []
+        rows = await self.fetch(
+            select(key, column)
+            .where(vector.op('@@')(tsquery))
+            .order_by(func.ts_rank(vector, tsquery).desc(), key.desc())
+            .limit(limit)
+        )
+        return [(str(row[key.key]), row[column.key]) for row in rows]
@@ -1,15 +1,101 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
-
-from jose import jwt
+from hashlib import sha256
+from time import time
 
 from app.config import Config
 
 
+class InvalidToken(Exception):
+    """ Token is malformed, has a wrong signature or is expired """
+
+
+# ================================================================
+# JWT backends (JWT_BACKEND=jose|pyjwt)
+# ================================================================
+
+
+class JoseBackend:
+
+    def __init__(self):
+        from jose import jwt, JWTError
+        self.jwt = jwt
+        self.errors = JWTError
+
+    def encode(self, claims: dict) -> str:
+        return self.jwt.encode(claims, Config.jwt_secret, algorithm=Config.jwt_algorithm)
+
+    def decode(self, token: str) -> dict:
+        try:
+            return self.jwt.decode(token, Config.jwt_secret, algorithms=[Config.jwt_algorithm])
+        except self.errors:
+            raise InvalidToken
+
+
+class PyJWTBackend:
+
+    def __init__(self):
+        import jwt
+        self.jwt = jwt
+        self.errors = jwt.PyJWTError
+
+    def encode(self, claims: dict) -> str:
+        return self.jwt.encode(claims, Config.jwt_secret, algorithm=Config.jwt_algorithm)
+
+    def decode(self, token: str) -> dict:
+        try:
+            return self.jwt.decode(token, Config.jwt_secret, algorithms=[Config.jwt_algorithm])
+        except self.errors:
+            raise InvalidToken
+
+
+JWT_BACKENDS = {
+    'jose': JoseBackend,
+    'pyjwt': PyJWTBackend,
+}
+
+jwt_backend = JWT_BACKENDS[Config.jwt_backend]()
+
+
+# ================================================================
+# Verified tokens: sha256 of token -> (exp, claims), evicted at exp
+# ================================================================
+
+
+verified_tokens: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+
+
+def decode_token(token: str) -> dict:
+    """ Claims of a valid token, verified once per process while it is in the cache """
+    digest = sha256(token.encode()).digest()
+    entry = verified_tokens.get(digest)
+    if entry is not None:
+        expires, claims = entry
+        if expires <= time():
+            del verified_tokens[digest]
+            raise InvalidToken
+        verified_tokens.move_to_end(digest)
+        return claims
+
+    claims = jwt_backend.decode(token)
+    # Only tokens with exp are cached, so an entry never outlives its token
+    if isinstance(claims.get('exp'), int | float) and Config.jwt_cache_size:
+        verified_tokens[digest] = (claims['exp'], claims)
+        while len(verified_tokens) > Config.jwt_cache_size:
+            verified_tokens.popitem(last=False)
+    return claims
+
+
+# ================================================================
+# Creating tokens
+# ================================================================
+
+
 async def create_mail_token(username: str):
     to_encode = {}
     to_encode.update({"sub": str(username)})
     to_encode.update({'exp': datetime.utcnow() + timedelta(seconds=Config.mail_token_expire_seconds)})
-    mail_token = jwt.encode(to_encode, Config.jwt_secret, algorithm=Config.jwt_algorithm)
+    mail_token = jwt_backend.encode(to_encode)
     return mail_token
 
 
@@ -17,7 +103,7 @@ async def create_access_token(user_uuid):
     to_encode = {}
     to_encode.update({"sub": str(user_uuid)})
     to_encode.update({'exp': datetime.utcnow() + timedelta(minutes=Config.access_token_expire_minutes)})
-    access_token = jwt.encode(to_encode, Config.jwt_secret, algorithm=Config.jwt_algorithm)
+    access_token = jwt_backend.encode(to_encode)
     return access_token
 
 
@@ -25,5 +111,5 @@ async def create_refresh_token(user_uuid):
     to_encode = {}
     to_encode.update({"sub": str(user_uuid)})
     to_encode.update({'exp': datetime.utcnow() + timedelta(days=Config.refresh_token_expire_days)})
-    refresh_token = jwt.encode(to_encode, Config.jwt_secret, algorithm=Config.jwt_algorithm)
+    refresh_token = jwt_backend.encode(to_encode)
     return refresh_token
@@ -1,15 +1,11 @@
 from fastapi import Request, HTTPException, Depends, Response
-from jose import jwt, JWTError
-from sqlalchemy import select, and_, or_
-from sqlalchemy.ext.asyncio import AsyncSession
+from redis.asyncio import StrictRedis
 from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN
 
-from app.config import Config
-from app.postgres.crud import get_user_by_id
-from app.postgres.engine import get_db
-from app.postgres.tables import User
+from app.redis.engine import get_redis
 from app.schemas import users
-from app.security.JWT import create_access_token
+from app.security.JWT import InvalidToken, create_access_token, decode_token
+from app.security.user_cache import get_user_identity_cached
 
 
 # ================================================================
@@ -28,11 +24,11 @@ async def auth_email(request: Request):
         raise credentials_exception
 
     try:
-        payload = jwt.decode(mail_token, Config.jwt_secret, algorithms=[Config.jwt_algorithm])
+        payload = decode_token(mail_token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-    except JWTError:
+    except InvalidToken:
         raise credentials_exception
 
     return users.Username(username=username)
@@ -43,8 +39,11 @@ async def auth_email(request: Request):
 # ================================================================
 
 
-async def get_current_user(request: Request,
-                           response: Response):
+async def get_current_identity(request: Request,
+                               response: Response,
+                               redis: StrictRedis = Depends(get_redis)) -> users.UserIdentity:
+    """ UUID, username and role of the authenticated user with one cached lookup,
+    shared by all authorization dependencies of a request """
     credentials_exception = HTTPException(
         status_code=HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -55,69 +54,64 @@ async def get_current_user(request: Request,
         raise credentials_exception
 
     try:
-        payload = jwt.decode(access_token, Config.jwt_secret, algorithms=[Config.jwt_algorithm])
+        payload = decode_token(access_token)
         user_uuid: str = payload.get("sub")
         if user_uuid is None:
             raise credentials_exception
-    except JWTError:
+    except InvalidToken:
         refresh_token = request.cookies.get('Refresh')
         if refresh_token is None:
             raise credentials_exception
 
         try:
-            payload = jwt.decode(refresh_token, Config.jwt_secret, algorithms=[Config.jwt_algorithm])
+            payload = decode_token(refresh_token)
             user_uuid: str = payload.get("sub")
             if user_uuid is None:
                 raise credentials_exception
-        except JWTError:
+        except InvalidToken:
             raise credentials_exception
 
-        user = await get_user_by_id(user_id=user_uuid)
+        user = await get_user_identity_cached(redis=redis, user_uuid=user_uuid)
         if user is None:
             raise credentials_exception
 
         access_token = await create_access_token(user_uuid=user.UUID)
         response.set_cookie(key='Access', value=access_token, httponly=True)
-        return users.ReturnUser(UUID=user.UUID, username=user.username)
+        return user
 
-    user = await get_user_by_id(user_id=user_uuid)
+    # Identity from the process cache or redis, postgres only on a miss
+    user = await get_user_identity_cached(redis=redis, user_uuid=user_uuid)
     if user is None:
         raise credentials_exception
 
-    return users.ReturnUser(UUID=user.UUID, username=user.username)
+    return user
+
+
+async def get_current_user(identity: users.UserIdentity = Depends(get_current_identity)):
+    return users.ReturnUser(UUID=identity.UUID, username=identity.username)
 
 
 # ================================================================
-# Authorization function for moderator role
+# Authorization functions for roles
 # ================================================================
 
 
-async def get_current_moderator(db: AsyncSession = Depends(get_db),
-                                current_user: users.ReturnUser = Depends(get_current_user)):
-    moderator = await db.scalar(select(User).where(and_(User.UUID == current_user.UUID,
-                                                        or_(User.role == 'moderator', User.role == 'admin'))))
-    if not moderator:
-        raise HTTPException(
-            status_code=HTTP_403_FORBIDDEN,
-            detail='You dont have permission to access'
-        )
-    return users.ReturnUser(UUID=moderator.UUID,
-                            username=moderator.username)
+def require_roles(*roles: str):
+    """ Dependency allowing only users with one of roles, the role comes with the cached identity
+    (dropped from every cache on role changes) """
 
+    async def get_current_user_with_role(identity: users.UserIdentity = Depends(get_current_identity)):
+        if identity.role not in roles:
+            raise HTTPException(
+                status_code=HTTP_403_FORBIDDEN,
+                detail='You dont have permission to access'
+            )
+        return users.ReturnUser(UUID=identity.UUID,
+                                username=identity.username)
+
+    return get_current_user_with_role
 
-# ================================================================
-# Authorization function for admin role
-# ================================================================
 
+get_current_moderator = require_roles('moderator', 'admin')
 
-async def get_current_admin(db: AsyncSession = Depends(get_db),
-                            current_moderator: users.ReturnUser = Depends(get_current_moderator)):
-    admin = await db.scalar(select(User).where(and_(User.UUID == current_moderator.UUID,
-                                                    User.role == 'admin')))
-    if not admin:
-        raise HTTPException(
-            status_code=HTTP_403_FORBIDDEN,
-            detail='You dont have permission to access'
-        )
-    return users.ReturnUser(UUID=admin.UUID,
-                            username=admin.username)
+get_current_admin = require_roles('admin')
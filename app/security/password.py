@@ -1,12 +1,88 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from fastapi import HTTPException
+from loguru import logger
 from passlib.context import CryptContext
+from starlette.status import HTTP_503_SERVICE_UNAVAILABLE
+
+from app.config import Config
+
+
+# Scheme and cost of new hashes. Hashes of other schemes or with fewer rounds are still verified
+# and replaced on the next login (rounds are bcrypt log2 rounds or argon2 time cost)
+MIN_ROUNDS = {'bcrypt': 4, 'argon2': 1}
+MAX_ROUNDS = {'bcrypt': 20, 'argon2': 20}
+
+
+def password_policy(rounds: int) -> dict:
+    scheme = Config.password_hash_scheme
+    return {'schemes': list(dict.fromkeys([scheme, 'bcrypt'])),
+            'default': scheme,
+            'deprecated': 'auto',
+            f'{scheme}__default_rounds': rounds,
+            f'{scheme}__min_rounds': rounds}
+
+
+pwd_context = CryptContext(**password_policy(rounds=Config.password_hash_rounds))
+
+# bcrypt releases the GIL, hashing runs in parallel threads while the event loop keeps serving requests.
+# The semaphore admits only as many calls as there are threads, the rest wait up to the queue timeout
+hash_executor = ThreadPoolExecutor(max_workers=Config.password_hash_workers, thread_name_prefix='password-hash')
+hash_slots = asyncio.Semaphore(Config.password_hash_workers)
+
+
+async def run_hashing(func, *args):
+    """ Run func in the hashing pool, 503 when no thread is free within PASSWORD_HASH_QUEUE_TIMEOUT_MS """
+    try:
+        await asyncio.wait_for(hash_slots.acquire(), timeout=Config.password_hash_queue_timeout_ms / 1000)
+    except TimeoutError:
+        raise HTTPException(
+            status_code=HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Server is busy, try again later',
+            headers={'Retry-After': '1'}
+        )
+    try:
+        return await asyncio.get_running_loop().run_in_executor(hash_executor, func, *args)
+    finally:
+        hash_slots.release()
+
+
+async def hash_password(plain_password: str) -> str:
+    return await run_hashing(pwd_context.hash, plain_password)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await run_hashing(pwd_context.verify, plain_password, hashed_password)
 
 
-pwd_context = CryptContext(schemes=['bcrypt'])
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """ Verify password, returns also a new hash when hashed_password does not match the current policy """
+    return await run_hashing(pwd_context.verify_and_update, plain_password, hashed_password)
 
 
-def hash_password(plain_password: str) -> str:
-    return pwd_context.hash(secret=plain_password)
+def calibrate_rounds(target_ms: int) -> int:
+    """ Largest cost of the configured scheme whose hash takes at most target_ms on this machine """
+    scheme = Config.password_hash_scheme
+    rounds = MIN_ROUNDS[scheme]
+    while rounds < MAX_ROUNDS[scheme]:
+        context = CryptContext(**password_policy(rounds=rounds + 1))
+        started = perf_counter()
+        context.hash('calibration')
+        if (perf_counter() - started) * 1000 > target_ms:
+            break
+        rounds += 1
+    return rounds
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(secret=plain_password, hash=hashed_password)
+async def configure_password_hashing():
+    """ Called at startup: with PASSWORD_HASH_TARGET_MS the cost is calibrated to that budget per hash,
+    otherwise PASSWORD_HASH_ROUNDS is used """
+    if not Config.password_hash_target_ms:
+        return
+    rounds = await asyncio.get_running_loop().run_in_executor(hash_executor, calibrate_rounds,
+                                                              Config.password_hash_target_ms)
+    pwd_context.load(password_policy(rounds=rounds))
+    logger.info(f'Password hashing: {Config.password_hash_scheme} with {rounds} rounds '
+                f'(target {Config.password_hash_target_ms} ms)')
@@ -0,0 +1,106 @@
+import asyncio
+from collections import OrderedDict
+from json import dumps, loads
+from time import monotonic
+
+from fastapi.encoders import jsonable_encoder
+from loguru import logger
+from redis.asyncio import StrictRedis
+
+from app.config import Config
+from app.postgres.crud import get_user_by_id
+from app.redis.cache import USER_INVALIDATIONS, get_user_identity, set_user_identity
+from app.redis.engine import create_redis
+from app.schemas import users
+
+
+class LocalUserCache:
+    """ LRU of user identities in this process, entries live ttl seconds """
+
+    def __init__(self,
+                 size: int,
+                 ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[float, users.UserIdentity]] = OrderedDict()
+        # Incremented on every invalidation, reads that started before one do not fill the cache
+        self.generation = 0
+
+    def get(self, user_uuid: str) -> users.UserIdentity | None:
+        entry = self.entries.get(user_uuid)
+        if entry is None:
+            return None
+        expires, identity = entry
+        if expires < monotonic():
+            del self.entries[user_uuid]
+            return None
+        self.entries.move_to_end(user_uuid)
+        return identity
+
+    def set(self,
+            user_uuid: str,
+            identity: users.UserIdentity,
+            generation: int):
+        if generation != self.generation:
+            return
+        self.entries[user_uuid] = (monotonic() + self.ttl, identity)
+        self.entries.move_to_end(user_uuid)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, user_uuids: list[str]):
+        self.generation += 1
+        for user_uuid in user_uuids:
+            self.entries.pop(user_uuid, None)
+
+    def clear(self):
+        self.generation += 1
+        self.entries.clear()
+
+
+local_users = LocalUserCache(size=Config.user_cache_size, ttl=Config.user_cache_local_ttl_seconds)
+
+
+async def get_user_identity_cached(redis: StrictRedis,
+                                   user_uuid: str) -> users.UserIdentity | None:
+    """ Identity of user from the process cache, then redis, then postgres. None if user does not exist """
+    identity = local_users.get(user_uuid)
+    if identity is not None:
+        return identity
+    generation = local_users.generation
+
+    # Checking identity in redis
+    cached = await get_user_identity(redis=redis, user_uuid=user_uuid)
+    if cached is not None:
+        identity = users.UserIdentity(**loads(cached))
+    else:
+        # Getting user from postgres
+        user = await get_user_by_id(user_id=user_uuid)
+        if user is None:
+            return None
+        identity = users.UserIdentity(UUID=user.UUID, username=user.username, role=user.role)
+        await set_user_identity(redis=redis, user_uuid=user_uuid, identity=dumps(jsonable_encoder(identity)),
+                                time=Config.user_cache_ttl_seconds)
+
+    local_users.set(user_uuid=user_uuid, identity=identity, generation=generation)
+    return identity
+
+
+async def run_user_cache_invalidation():
+    """ Background task: drop identities invalidated by any process from the process cache.
+    While the subscription is down invalidations may be missed, so the process cache is cleared on reconnect """
+    while True:
+        redis = create_redis()
+        pubsub = redis.pubsub()
+        try:
+            await pubsub.subscribe(USER_INVALIDATIONS)
+            local_users.clear()
+            async for message in pubsub.listen():
+                if message['type'] == 'message':
+                    local_users.invalidate(user_uuids=loads(message['data']))
+        except Exception:
+            logger.exception('User cache invalidation failed')
+        finally:
+            await pubsub.aclose()
+            await redis.aclose()
+        await asyncio.sleep(1)
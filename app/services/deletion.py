@@ -0,0 +1,69 @@
+from redis.asyncio import StrictRedis
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.postgres.crud import enqueue_delete
+from app.postgres.tables import User, Post, Like
+from app.redis.cache import invalidate_feed, invalidate_posts, invalidate_users
+from app.redis.ranking import remove_posts
+
+
+# ================================================================
+# Deleting posts and users with set-based statements in postgres
+# and a single outbox row per index for elasticsearch
+# ================================================================
+
+
+async def delete_post(db: AsyncSession,
+                      redis: StrictRedis,
+                      post: Post):
+    """ Delete post with its likes from postgres, elasticsearch and redis """
+
+    # Deleting likes post and post in postgres
+    await db.execute(delete(Like).where(Like.post_id == post.id))
+    await db.execute(delete(Post).where(Post.id == post.id))
+
+    # Deleting post in elasticsearch (applied by the search indexer)
+    enqueue_delete(db=db, index='posts', document_ids=[post.id])
+    await db.commit()
+
+    # Removing post from ranking and caches in redis
+    await remove_posts(redis=redis, posts=[(post.id, post.created_at)])
+    await invalidate_posts(redis=redis, post_ids=[post.id])
+    await invalidate_feed(redis=redis)
+
+
+async def delete_user(db: AsyncSession,
+                      redis: StrictRedis,
+                      user: User) -> list[int]:
+    """ Delete user with all his posts, his likes and likes on his posts from postgres, elasticsearch and redis.
+    Returns ids of deleted posts """
+
+    # Deleting likes user and likes posts user in postgres (two statements: an OR of both conditions
+    # cannot be served by the likes indexes and scans the whole table)
+    await db.execute(delete(Like).where(Like.user_UUID == user.UUID))
+    await db.execute(delete(Like).where(Like.post_id == Post.id, Post.owner_UUID == user.UUID))
+    # Deleting posts user in postgres
+    deleted_posts = (await db.execute(
+        delete(Post)
+        .where(Post.owner_UUID == user.UUID)
+        .returning(Post.id, Post.created_at)
+    )).all()
+    # Deleting user in postgres
+    await db.execute(delete(User).where(User.UUID == user.UUID))
+
+    post_ids = [post_id for post_id, _ in deleted_posts]
+
+    # Deleting posts user and user in elasticsearch (applied by the search indexer)
+    if post_ids:
+        enqueue_delete(db=db, index='posts', document_ids=post_ids)
+    enqueue_delete(db=db, index='users', document_ids=[user.UUID])
+    await db.commit()
+
+    # Removing posts user from ranking and caches in redis, dropping cached identity user in every process
+    await invalidate_users(redis=redis, user_uuids=[user.UUID])
+    await remove_posts(redis=redis, posts=[(post_id, created_at) for post_id, created_at in deleted_posts])
+    await invalidate_posts(redis=redis, post_ids=post_ids)
+    await invalidate_feed(redis=redis)
+
+    return post_ids
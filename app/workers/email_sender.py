@@ -0,0 +1,134 @@
+import asyncio
+from email.message import EmailMessage
+from os import getpid
+from socket import gethostname
+
+from aiosmtplib import SMTP, SMTPException, SMTPRecipientsRefused, SMTPServerDisconnected, SMTPTimeoutError
+from loguru import logger
+from redis.asyncio import StrictRedis
+
+from app.config import Config
+from app.redis.emails import (create_group, read_emails, ack_emails, retry_email, dead_letter_email,
+                              requeue_due_emails)
+from app.redis.engine import create_redis
+
+# Emails left unacknowledged this long by a crashed worker are taken over by another one
+CLAIM_IDLE_MS = 60_000
+READ_BLOCK_MS = 1_000
+# RCPT replies rejecting the address itself: mailbox unavailable, mailbox name not allowed
+REJECTED_RECIPIENT_CODES = (550, 553)
+
+
+def create_smtp() -> SMTP:
+    conf = Config.mail_conf
+    return SMTP(hostname=conf.MAIL_SERVER,
+                port=conf.MAIL_PORT,
+                username=conf.MAIL_USERNAME,
+                password=conf.MAIL_PASSWORD.get_secret_value(),
+                start_tls=conf.MAIL_STARTTLS,
+                use_tls=conf.MAIL_SSL_TLS,
+                timeout=conf.TIMEOUT)
+
+
+def build_message(message: dict) -> EmailMessage:
+    email = EmailMessage()
+    email['From'] = str(Config.mail_conf.MAIL_FROM)
+    email['To'] = ', '.join(message['recipients'])
+    email['Subject'] = message['subject']
+    email.set_content(message['body'], subtype='html')
+    return email
+
+
+async def reschedule_email(redis: StrictRedis,
+                           entry_id: str,
+                           message: dict,
+                           error: Exception,
+                           permanent: bool = False):
+    """ Retry the email with exponential backoff, or move it to dead letters when the error is permanent
+    or its attempts are used up """
+    if permanent or message['attempts'] + 1 >= Config.email_max_attempts:
+        logger.error(f'Email to {message["recipients"]} moved to dead letters: {error}')
+        await dead_letter_email(redis=redis, entry_id=entry_id, message=message, error=str(error))
+    else:
+        delay = Config.email_retry_backoff_seconds * 2 ** message['attempts']
+        logger.warning(f'Email to {message["recipients"]} failed, retry in {delay}s: {error}')
+        await retry_email(redis=redis, entry_id=entry_id, message=message, delay_seconds=delay)
+
+
+def is_rejected(error: Exception) -> bool:
+    """ Every recipient was rejected by address (no such mailbox, bad address), such an email never succeeds.
+    Other replies, 5xx included (e.g. 554 for a blocked sender ip), may be fixed on the server side """
+    return isinstance(error, SMTPRecipientsRefused) and all(
+        recipient.code in REJECTED_RECIPIENT_CODES for recipient in error.recipients
+    )
+
+
+async def send_batch(redis: StrictRedis,
+                     smtp: SMTP,
+                     batch: list[tuple[str, dict]]):
+    """ Send a batch over one smtp connection, failed emails are rescheduled with exponential backoff """
+    sent = []
+    position, resent = 0, False
+    while position < len(batch):
+        entry_id, message = batch[position]
+        if not smtp.is_connected:
+            try:
+                await smtp.connect()
+            except (SMTPException, OSError) as error:
+                # Server unavailable or refusing the login (e.g. 535): not a fault of the emails,
+                # the rest of the batch is retried later
+                smtp.close()
+                for entry_id, message in batch[position:]:
+                    await reschedule_email(redis=redis, entry_id=entry_id, message=message, error=error)
+                break
+        try:
+            refused, _ = await smtp.send_message(build_message(message))
+        except SMTPServerDisconnected as error:
+            smtp.close()
+            # Connection dropped by the server (e.g. idle timeout between batches): reconnecting
+            # and sending again right away, without using up an attempt
+            if not resent:
+                resent = True
+                continue
+            await reschedule_email(redis=redis, entry_id=entry_id, message=message, error=error)
+        except (SMTPException, OSError) as error:
+            await reschedule_email(redis=redis, entry_id=entry_id, message=message, error=error,
+                                   permanent=is_rejected(error))
+            # Broken connection is reopened for the next email
+            if isinstance(error, (SMTPTimeoutError, OSError)):
+                smtp.close()
+        else:
+            if refused:
+                logger.warning(f'Email to {message["recipients"]} was not delivered to: {refused}')
+            sent.append(entry_id)
+        position, resent = position + 1, False
+    await ack_emails(redis=redis, entry_ids=sent)
+
+
+async def run_email_sender():
+    """ Background task: send emails queued in the redis outbox, keeping the smtp connection open between batches """
+    redis = create_redis()
+    smtp = create_smtp()
+    consumer = f'{gethostname()}-{getpid()}'
+    try:
+        await create_group(redis=redis)
+        while True:
+            try:
+                await requeue_due_emails(redis=redis, count=Config.email_batch_size)
+                batch = await read_emails(redis=redis,
+                                          consumer=consumer,
+                                          count=Config.email_batch_size,
+                                          block_ms=READ_BLOCK_MS,
+                                          claim_idle_ms=CLAIM_IDLE_MS)
+                if batch:
+                    await send_batch(redis=redis, smtp=smtp, batch=batch)
+            except Exception:
+                logger.exception('Email sending failed')
+                await asyncio.sleep(READ_BLOCK_MS / 1000)
+    finally:
+        if smtp.is_connected:
+            try:
+                await smtp.quit()
+            except SMTPException:
+                smtp.close()
+        await redis.aclose()
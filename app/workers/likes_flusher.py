@@ -0,0 +1,53 @@
+import asyncio
+
+from loguru import logger
+from redis.asyncio import StrictRedis
+
+from app.config import Config
+from app.postgres.crud import apply_like_deltas
+from app.redis.cache import invalidate_feed, invalidate_posts
+from app.redis.engine import create_redis
+from app.redis.ranking import touch_posts
+
+# Like deltas applied per transaction
+BATCH_SIZE = 10000
+
+
+async def flush(redis: StrictRedis):
+    """ Apply pending like deltas to postgres in batches (elasticsearch is synced from the search outbox),
+    then drop stale caches. Deltas are taken in the transaction that applies them, so a failure leaves them
+    pending for the next flush """
+    while True:
+        applied = await apply_like_deltas(limit=BATCH_SIZE)
+        if applied is None:
+            # Another flusher is applying deltas
+            return
+        post_likes, taken = applied
+
+        if post_likes:
+            # A running ranking rebuild re-reads posts with the flushed likes
+            await touch_posts(redis=redis, post_ids=list(post_likes))
+            await invalidate_posts(redis=redis, post_ids=list(post_likes))
+            await invalidate_feed(redis=redis)
+
+        if taken < BATCH_SIZE:
+            return
+
+
+async def run_likes_flusher():
+    """ Background task: every LIKES_FLUSH_INTERVAL_MS apply like deltas recorded in postgres to post and owner likes.
+    Runs in every worker regardless of LIKES_WRITE_BEHIND, so deltas left after switching the mode off are flushed """
+    redis = create_redis()
+    try:
+        while True:
+            await asyncio.sleep(Config.likes_flush_interval_ms / 1000)
+            try:
+                await flush(redis=redis)
+            except Exception:
+                logger.exception('Likes flush failed')
+    except asyncio.CancelledError:
+        # Last flush on shutdown
+        await flush(redis=redis)
+        raise
+    finally:
+        await redis.aclose()
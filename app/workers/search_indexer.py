@@ -0,0 +1,99 @@
+import asyncio
+from time import monotonic
+
+from loguru import logger
+from redis.asyncio import StrictRedis
+
+from app.config import Config
+from app.elasticsearch.crud import bulk
+from app.postgres.crud import lock_search_outbox, get_search_outbox, delete_search_outbox
+from app.postgres.engine import async_session
+from app.postgres.tables import SearchOutbox
+from app.redis.cache import bump_search_generation
+from app.redis.engine import create_redis
+from app.redis.search import publish_search_actions
+
+# index.refresh_interval of the elasticsearch indexes (default): writes are searchable at most this late
+REFRESH_INTERVAL_SECONDS = 1
+
+
+def outbox_actions(rows: list[SearchOutbox]) -> list[tuple[str, str, str, dict | None]]:
+    """ Bulk actions of outbox rows, in the order of the rows. Updates of a document are merged into its
+    previous index/update action (no delete in between), so every like of a post does not cost its own action """
+    actions = []
+    # (index, document id) -> position of its last index/update action
+    mergeable = {}
+    for row in rows:
+        payload = row.payload
+        if row.action == 'index':
+            items = [(payload['id'], payload['document'])]
+        else:
+            items = [(document_id, payload.get('fields')) for document_id in payload['ids']]
+        for document_id, body in items:
+            key = (row.index_name, document_id)
+            if row.action == 'update' and key in mergeable:
+                action, index, _, previous = actions[mergeable[key]]
+                actions[mergeable[key]] = (action, index, document_id, {**previous, **body})
+                continue
+            if row.action == 'delete':
+                mergeable.pop(key, None)
+            else:
+                mergeable[key] = len(actions)
+            actions.append((row.action, row.index_name, document_id, body))
+    return actions
+
+
+async def drain(redis: StrictRedis,
+                batch_size: int) -> tuple[int, set[str]]:
+    """ Apply the oldest outbox rows to elasticsearch with one _bulk request and delete them in one transaction.
+    With SEARCH_BACKEND=memory the actions are published to the in-memory indexes of every process instead.
+    If elasticsearch fails the rows stay and are applied again (at-least-once, operations are idempotent).
+    Returns the number of applied rows and the changed indexes """
+    db = async_session()
+    try:
+        if not await lock_search_outbox(db=db):
+            return 0, set()
+        rows = await get_search_outbox(db=db, limit=batch_size)
+        if rows:
+            if Config.elasticsearch_enabled:
+                # Not waiting for a refresh: the changes become searchable with the next periodic one
+                await bulk(actions=outbox_actions(rows))
+            else:
+                await publish_search_actions(redis=redis, actions=outbox_actions(rows))
+            await delete_search_outbox(db=db, ids=[row.id for row in rows])
+        await db.commit()
+        return len(rows), {row.index_name for row in rows}
+    finally:
+        await db.close()
+
+
+async def run_search_indexer():
+    """ Background task: apply the search outbox to the search backend every SEARCH_INDEXER_INTERVAL_MS,
+    without waiting while there are full batches left. Cached search pages of the changed indexes are dropped
+    once the changes are searchable (after the elasticsearch refresh interval) """
+    redis = create_redis()
+    # Index -> (monotonic time its cached pages are dropped at, time its last change is searchable)
+    pending_bumps = {}
+    try:
+        while True:
+            applied = 0
+            try:
+                applied, indexes = await drain(redis=redis, batch_size=Config.search_indexer_batch_size)
+                searchable = monotonic() + REFRESH_INTERVAL_SECONDS
+                for index in indexes:
+                    pending_bumps[index] = (pending_bumps.get(index, (searchable,))[0], searchable)
+
+                # Dropping at least every refresh interval while writes go on, again after the last one
+                due = {index for index, (at, _) in pending_bumps.items() if at <= monotonic()}
+                if due:
+                    await bump_search_generation(redis=redis, indexes=due)
+                    for index in due:
+                        _, last = pending_bumps.pop(index)
+                        if last > monotonic():
+                            pending_bumps[index] = (last, last)
+            except Exception:
+                logger.exception('Search indexing failed')
+            if applied < Config.search_indexer_batch_size:
+                await asyncio.sleep(Config.search_indexer_interval_ms / 1000)
+    finally:
+        await redis.aclose()
@@ -0,0 +1,147 @@
+import asyncio
+from argparse import ArgumentParser
+from statistics import mean, quantiles
+from time import perf_counter
+from uuid import uuid4
+
+from sqlalchemy import delete, func, select
+
+from app.config import Config
+from app.postgres.crud import toggle_like, toggle_like_row
+from app.postgres.engine import async_engine, async_session
+from app.postgres.tables import Like, Post, User
+from app.redis.engine import create_redis
+from app.workers.likes_flusher import flush
+
+
+# ================================================================
+# Likes/s on one hot post: every liker toggles its like as fast as it can, then the counters of the post
+# and its owner are checked against the like rows (they must never drift). Counters are updated with the like
+# or, with --write-behind, recorded as deltas and flushed in batches. Creates its own users and post
+# in postgres and deletes them afterwards
+# ================================================================
+
+
+async def create_data(likers: int) -> tuple[int, list]:
+    prefix = f'bench-{uuid4().hex[:8]}'
+    db = async_session()
+    try:
+        users = [User(username=f'{prefix}-{number}', email=f'{prefix}-{number}@example.com', hashed_password='-',
+                      likes=0) for number in range(likers + 1)]
+        db.add_all(users)
+        await db.flush()
+        post = Post(owner_UUID=users[0].UUID, owner_username=users[0].username, title=f'{prefix} hot post',
+                    content=f'{prefix} content', likes=0)
+        db.add(post)
+        await db.commit()
+        return post.id, [user.UUID for user in users]
+    finally:
+        await db.close()
+
+
+async def delete_data(post_id: int,
+                      user_ids: list):
+    db = async_session()
+    try:
+        await db.execute(delete(Like).where(Like.post_id == post_id))
+        await db.execute(delete(Post).where(Post.id == post_id))
+        await db.execute(delete(User).where(User.UUID.in_(user_ids)))
+        await db.commit()
+    finally:
+        await db.close()
+
+
+async def check_counters(post_id: int,
+                         owner_id) -> dict:
+    db = async_session()
+    try:
+        rows = await db.scalar(select(func.count()).select_from(Like).where(Like.post_id == post_id))
+        post_likes = await db.scalar(select(Post.likes).where(Post.id == post_id))
+        owner_likes = await db.scalar(select(User.likes).where(User.UUID == owner_id))
+    finally:
+        await db.close()
+    return {'like rows': rows, 'post likes': post_likes, 'owner likes': owner_likes,
+            'consistent': rows == post_likes == owner_likes}
+
+
+async def toggle(user_id, post_id: int):
+    """ Like path of PUT /posts/{post_id}/like without the caches """
+    db = async_session()
+    try:
+        await toggle_like(db=db, user_id=user_id, post_id=post_id)
+        await db.commit()
+    finally:
+        await db.close()
+
+
+async def toggle_write_behind(user_id, post_id: int):
+    """ Like path of PUT /posts/{post_id}/like with LIKES_WRITE_BEHIND=1, without the caches """
+    db = async_session()
+    try:
+        await toggle_like_row(db=db, user_id=user_id, post_id=post_id)
+        await db.commit()
+    finally:
+        await db.close()
+
+
+async def run_flusher(redis):
+    while True:
+        await asyncio.sleep(Config.likes_flush_interval_ms / 1000)
+        await flush(redis=redis)
+
+
+async def storm(like,
+                likers: list,
+                post_id: int,
+                seconds: float) -> list[float]:
+    latencies = []
+    deadline = perf_counter() + seconds
+
+    async def run(user_id):
+        while perf_counter() < deadline:
+            started = perf_counter()
+            await like(user_id=user_id, post_id=post_id)
+            latencies.append((perf_counter() - started) * 1000)
+
+    await asyncio.gather(*[run(user_id) for user_id in likers])
+    return latencies
+
+
+async def main():
+    parser = ArgumentParser(description='Like/unlike throughput on one hot post')
+    parser.add_argument('--likers', type=int, default=32, help='concurrent users liking the post')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-behind', action='store_true', help='record like deltas, flushed in batches')
+    args = parser.parse_args()
+    if args.likers < 1 or args.seconds <= 0:
+        parser.error('--likers must be at least 1 and --seconds positive')
+
+    redis = create_redis() if args.write_behind else None
+    post_id, user_ids = await create_data(likers=args.likers)
+    try:
+        if args.write_behind:
+            flusher = asyncio.create_task(run_flusher(redis))
+            like = toggle_write_behind
+        else:
+            like = toggle
+        latencies = await storm(like=like, likers=user_ids[1:], post_id=post_id, seconds=args.seconds)
+        if args.write_behind:
+            flusher.cancel()
+            await asyncio.gather(flusher, return_exceptions=True)
+            # Deltas recorded since the last flush
+            await flush(redis=redis)
+
+        percentiles = quantiles(latencies, n=100, method='inclusive')
+        print(f'{round(len(latencies) / args.seconds)} likes/s, mean {mean(latencies):.2f} ms, '
+              f'p50 {percentiles[49]:.2f} ms, p99 {percentiles[98]:.2f} ms')
+        print(await check_counters(post_id=post_id, owner_id=user_ids[0]))
+    finally:
+        await delete_data(post_id=post_id, user_ids=user_ids)
+        await async_engine.dispose()
+        if redis is not None:
+            await redis.aclose()
+
+
+if __name__ == '__main__':
+    # python -m benchmarks.hot_post_likes [--likers 32] [--seconds 10] [--write-behind]
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from time import perf_counter
+from uuid import uuid4
+
+from app.config import Config
+from app.security import JWT
+from app.security.JWT import JWT_BACKENDS, decode_token
+
+
+# ================================================================
+# Throughput of the JWT backends: encoding (login, refresh), verification of every request
+# without the cache, and verification of a token found in the cache of verified tokens
+# ================================================================
+
+
+def throughput(func, arguments: list) -> int:
+    """ Calls per second of func over arguments """
+    started = perf_counter()
+    for argument in arguments:
+        func(argument)
+    return round(len(arguments) / (perf_counter() - started))
+
+
+def main():
+    parser = ArgumentParser(description='Encode/decode throughput of the JWT backends')
+    parser.add_argument('--tokens', type=int, default=20000)
+    parser.add_argument('--backends', nargs='*', default=list(JWT_BACKENDS), choices=list(JWT_BACKENDS))
+    args = parser.parse_args()
+    if args.tokens < 1:
+        parser.error('--tokens must be at least 1')
+
+    claims = [{'sub': str(uuid4()), 'exp': datetime.utcnow() + timedelta(minutes=30)} for _ in range(args.tokens)]
+    for name in args.backends:
+        try:
+            backend = JWT_BACKENDS[name]()
+        except ImportError as error:
+            print(f'{name}: not installed ({error})')
+            continue
+
+        encode = throughput(backend.encode, claims)
+        tokens = [backend.encode(claim) for claim in claims]
+        decode = throughput(backend.decode, tokens)
+
+        # Tokens verified by this backend, every call is a cache hit
+        JWT.jwt_backend = backend
+        JWT.verified_tokens.clear()
+        Config.jwt_cache_size = len(tokens)
+        for token in tokens:
+            decode_token(token)
+        cached = throughput(decode_token, tokens)
+
+        print(f'{name}: encode {encode}/s, decode {decode}/s, cached decode {cached}/s '
+              f'(x{cached / decode:.1f})')
+
+
+if __name__ == '__main__':
+    # python -m benchmarks.jwt_backends [--tokens 20000] [--backends jose pyjwt]
+    main()
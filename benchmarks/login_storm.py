@@ -0,0 +1,95 @@
+import asyncio
+from argparse import ArgumentParser
+from statistics import mean, quantiles
+from time import perf_counter
+
+from httpx import AsyncClient, Limits
+
+
+# ================================================================
+# Latency of cheap requests while a running server handles a login storm: with password hashing
+# on the event loop every login stalls the other requests of the worker, with the hashing pool they keep
+# their latency and logins over PASSWORD_HASH_WORKERS wait up to PASSWORD_HASH_QUEUE_TIMEOUT_MS or get 503
+# ================================================================
+
+
+def summary(latencies: list[float]) -> dict:
+    if len(latencies) < 2:
+        return {'requests': len(latencies)}
+    percentiles = quantiles(latencies, n=100, method='inclusive')
+    return {'requests': len(latencies), 'mean ms': round(mean(latencies), 2),
+            'p50 ms': round(percentiles[49], 2), 'p95 ms': round(percentiles[94], 2),
+            'p99 ms': round(percentiles[98], 2), 'max ms': round(max(latencies), 2)}
+
+
+async def probe(client: AsyncClient,
+                path: str,
+                stop: asyncio.Event,
+                interval: float) -> list[float]:
+    """ Latencies of a request that does no hashing, sent one at a time until stop """
+    latencies = []
+    while not stop.is_set():
+        started = perf_counter()
+        await client.get(path)
+        latencies.append((perf_counter() - started) * 1000)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def storm(client: AsyncClient,
+                logins: int,
+                concurrency: int,
+                username: str,
+                password: str) -> tuple[list[float], dict[int, int]]:
+    latencies, statuses = [], {}
+    remaining = iter(range(logins))
+
+    async def run():
+        for _ in remaining:
+            started = perf_counter()
+            response = await client.post('/auth/login', data={'username': username, 'password': password})
+            latencies.append((perf_counter() - started) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    await asyncio.gather(*[run() for _ in range(concurrency)])
+    return latencies, statuses
+
+
+async def main():
+    parser = ArgumentParser(description='Latency of other requests during a login storm against a running server')
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--username', required=True, help='existing user')
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--probe', default='/openapi.json', help='path of a request without hashing')
+    parser.add_argument('--interval', type=float, default=0.01, help='seconds between probe requests')
+    parser.add_argument('--idle-seconds', type=float, default=3)
+    args = parser.parse_args()
+    if args.logins < 1 or args.concurrency < 1:
+        parser.error('--logins and --concurrency must be at least 1')
+
+    limits = Limits(max_connections=args.concurrency + 1, max_keepalive_connections=args.concurrency + 1)
+    async with AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        # Warming up connections and the probed endpoint
+        await client.get(args.probe)
+
+        stop = asyncio.Event()
+        idle = asyncio.create_task(probe(client, args.probe, stop, args.interval))
+        await asyncio.sleep(args.idle_seconds)
+        stop.set()
+        print(f'{args.probe} idle: {summary(await idle)}')
+
+        stop = asyncio.Event()
+        during = asyncio.create_task(probe(client, args.probe, stop, args.interval))
+        started = perf_counter()
+        logins, statuses = await storm(client, args.logins, args.concurrency, args.username, args.password)
+        seconds = perf_counter() - started
+        stop.set()
+        print(f'{args.probe} during the storm: {summary(await during)}')
+        print(f'/auth/login: {summary(logins)}, {round(args.logins / seconds)} logins/s, statuses {statuses}')
+
+
+if __name__ == '__main__':
+    # python -m benchmarks.login_storm --username admin --password secret [--logins 200] [--concurrency 32]
+    asyncio.run(main())
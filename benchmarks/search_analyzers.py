@@ -0,0 +1,139 @@
+import asyncio
+from argparse import ArgumentParser
+from copy import deepcopy
+from random import Random
+from re import findall
+from statistics import mean
+
+from elasticsearch.helpers import async_bulk
+
+from app.elasticsearch.indexes.posts_index import posts_index
+from app.elasticsearch.url import elastic
+from benchmarks.search_hops import measure
+
+
+# ================================================================
+# Search-time analyzer of posts.title: the former mapping split query terms into edge n-grams (custom_analyzer
+# at search time), the current one matches whole query terms against the indexed prefixes (search_analyzer).
+# Both mappings are loaded with the same synthetic corpus in temporary indexes; latency and relevance are
+# measured on the same queries, a hit is relevant when every query word is a prefix of a word of its title
+# ================================================================
+
+OLD_INDEX = 'benchmark_analyzers_old'
+NEW_INDEX = 'benchmark_analyzers_new'
+
+
+def tokenize(text: str) -> list[str]:
+    """ Words of text like the standard tokenizer and lowercase filter """
+    return findall(r'\w+', text.lower())
+
+
+def old_mapping() -> dict:
+    """ posts_index before the search analyzer: n-grams at search time, no original tokens over max_gram """
+    body = deepcopy(posts_index)
+    body['settings']['analysis']['analyzer'].pop('search_analyzer')
+    body['settings']['analysis']['filter']['edge_ngram_filter'].pop('preserve_original')
+    body['mappings']['properties']['title'].pop('search_analyzer')
+    return body
+
+
+def corpus(documents: int,
+           vocabulary: int,
+           seed: int) -> list[str]:
+    """ Titles of 5-12 words, word frequencies follow Zipf's law like in natural text """
+    random = Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = list(dict.fromkeys(''.join(random.choices(letters, k=random.randint(3, 14))) for _ in range(vocabulary)))
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    return [' '.join(random.choices(words, weights=weights, k=random.randint(5, 12))) for _ in range(documents)]
+
+
+def sample_queries(titles: list[str],
+                   count: int,
+                   seed: int) -> list[str]:
+    """ 1-2 words of random titles, the last one cut to a prefix in a third of the queries (typing) """
+    random = Random(seed)
+    queries = []
+    for _ in range(count):
+        words = tokenize(random.choice(titles))
+        picked = random.sample(words, k=random.choice((1, 2)))
+        if random.random() < 0.3:
+            picked[-1] = picked[-1][:max(2, len(picked[-1]) // 2)]
+        queries.append(' '.join(picked))
+    return queries
+
+
+def relevant(title: str,
+             query: str) -> bool:
+    words = tokenize(title)
+    return all(any(word.startswith(term) for word in words) for term in tokenize(query))
+
+
+class Mapping:
+
+    def __init__(self, index: str, analyzer: str | None):
+        self.index = index
+        self.analyzer = analyzer
+
+    async def search(self, index, query, offset, limit):
+        match = {"query": query}
+        if self.analyzer is not None:
+            match["analyzer"] = self.analyzer
+        response = await elastic.search(index=self.index, query={"match": {"title": match}},
+                                        from_=offset, size=limit, track_total_hits=True)
+        return response['hits']
+
+
+async def load(index: str,
+               body: dict,
+               titles: list[str]):
+    await elastic.indices.delete(index=index, ignore_unavailable=True)
+    await elastic.indices.create(index=index, **body)
+    await async_bulk(elastic, ({'_index': index, '_id': number, '_source': {'id': number, 'title': title}}
+                               for number, title in enumerate(titles)), chunk_size=5000)
+    await elastic.indices.refresh(index=index)
+    await elastic.indices.forcemerge(index=index, max_num_segments=1)
+
+
+async def main():
+    parser = ArgumentParser(description='Search latency and relevance of the former and current title analyzers')
+    parser.add_argument('--documents', type=int, default=100_000)
+    parser.add_argument('--vocabulary', type=int, default=20_000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--keep', action='store_true', help='keep the indexes for the next run')
+    args = parser.parse_args()
+    if min(args.documents, args.vocabulary, args.queries, args.limit, args.concurrency) < 1:
+        parser.error('--documents, --vocabulary, --queries, --limit and --concurrency must be at least 1')
+
+    titles = corpus(documents=args.documents, vocabulary=args.vocabulary, seed=args.seed)
+    queries = sample_queries(titles=titles, count=args.queries, seed=args.seed)
+    mappings = {'old (n-grams at search time)': (OLD_INDEX, old_mapping(), Mapping(OLD_INDEX, 'custom_analyzer')),
+                'new (search_analyzer)': (NEW_INDEX, posts_index, Mapping(NEW_INDEX, None))}
+    try:
+        for name, (index, body, mapping) in mappings.items():
+            if not args.keep or not await elastic.indices.exists(index=index):
+                await load(index=index, body=body, titles=titles)
+
+            # Warming up caches and connections
+            await measure(mapping, index, queries[:50], args.limit, 1)
+            stats, results = await measure(mapping, index, queries, args.limit, args.concurrency)
+
+            precision = mean(
+                mean(relevant(hit['_source']['title'], query) for hit in hits['hits']) if hits['hits'] else 1
+                for query, hits in zip(queries, results)
+            )
+            matched = mean(hits['total']['value'] for hits in results)
+            print(f'{name}: {stats}, precision@{args.limit} {precision:.3f}, mean hits {matched:.0f}')
+    finally:
+        if not args.keep:
+            for index in (OLD_INDEX, NEW_INDEX):
+                await elastic.indices.delete(index=index, ignore_unavailable=True)
+        await elastic.close()
+
+
+if __name__ == '__main__':
+    # python -m benchmarks.search_analyzers [--documents 100000] [--queries 1000] [--keep]
+    asyncio.run(main())
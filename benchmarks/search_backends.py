@@ -0,0 +1,98 @@
+import asyncio
+from argparse import ArgumentParser
+from random import Random
+from statistics import mean
+from time import perf_counter
+
+from app.elasticsearch.url import elastic
+from app.search.elastic import ElasticSearchBackend
+from app.search.memory import MemorySearchBackend, tokenize
+from app.search.postgres import PostgresSearchBackend
+from benchmarks.search_hops import measure
+
+
+# ================================================================
+# Search latency of the backends on the same corpus: the memory backend is loaded from postgres,
+# elasticsearch is expected to be in sync with it (python -m app.elasticsearch.reindex)
+# ================================================================
+
+
+def sample_queries(memory: MemorySearchBackend,
+                   index: str,
+                   count: int,
+                   seed: int) -> list[str]:
+    """ Queries of 1-2 words (some cut to a prefix) taken from titles/usernames of the corpus """
+    inverted = memory.indexes[index]
+    texts = [document[inverted.field] for document in inverted.documents if document is not None]
+    if not texts:
+        raise SystemExit(f'No documents in {index}')
+    random = Random(seed)
+    queries = []
+    while len(queries) < count:
+        words = tokenize(random.choice(texts))
+        if not words:
+            continue
+        picked = random.sample(words, k=min(len(words), random.choice((1, 2))))
+        if random.random() < 0.3:
+            picked[-1] = picked[-1][:max(2, len(picked[-1]) // 2)]
+        queries.append(' '.join(picked))
+    return queries
+
+
+def overlap(results: list[list],
+            reference: list[list],
+            key: str) -> float:
+    """ Mean share of the reference top hits also returned by the backend """
+    shares = []
+    for hits, expected in zip(results, reference):
+        expected = {hit[key] for hit in expected}
+        if expected:
+            shares.append(len(expected & {hit[key] for hit in hits}) / len(expected))
+    return round(mean(shares), 3) if shares else 1.0
+
+
+async def main():
+    parser = ArgumentParser(description='Compare search backends on the corpus in postgres')
+    parser.add_argument('--index', choices=('posts', 'users'), default='posts')
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--without', nargs='*', default=[], help='skip backends: elasticsearch postgres')
+    args = parser.parse_args()
+    if args.queries < 1 or args.limit < 1 or args.concurrency < 1:
+        parser.error('--queries, --limit and --concurrency must be at least 1')
+
+    memory = MemorySearchBackend()
+    started = perf_counter()
+    await memory.load()
+    print(f'memory: loaded in {perf_counter() - started:.2f}s')
+
+    backends = {'memory': memory}
+    if 'elasticsearch' not in args.without:
+        backends['elasticsearch'] = ElasticSearchBackend()
+    if 'postgres' not in args.without:
+        backends['postgres'] = PostgresSearchBackend()
+
+    queries = sample_queries(memory=memory, index=args.index, count=args.queries, seed=args.seed)
+    key = 'id' if args.index == 'posts' else 'username'
+    try:
+        measured = {}
+        for name, backend in backends.items():
+            # Warming up caches and connections
+            await measure(backend, args.index, queries[:50], args.limit, 1)
+            stats, results = await measure(backend, args.index, queries, args.limit, args.concurrency)
+            measured[name] = results
+            print(f'{name}: {stats}')
+        if 'elasticsearch' in measured:
+            for name, results in measured.items():
+                if name != 'elasticsearch':
+                    print(f'{name}: top {args.limit} overlap with elasticsearch '
+                          f'{overlap(results, measured["elasticsearch"], key)}')
+    finally:
+        await elastic.close()
+
+
+if __name__ == '__main__':
+    # python -m benchmarks.search_backends [--index posts] [--queries 1000] [--concurrency 1] [--without postgres]
+    asyncio.run(main())
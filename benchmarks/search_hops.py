@@ -0,0 +1,121 @@
+import asyncio
+from argparse import ArgumentParser
+from random import Random
+from statistics import mean, quantiles
+from time import perf_counter
+
+from sqlalchemy import select, func
+
+from app.elasticsearch.crud import search_page
+from app.elasticsearch.url import elastic
+from app.postgres.engine import async_session
+from app.postgres.tables import Post, User
+from app.schemas import posts, users
+from app.search.elastic import ElasticSearchBackend
+
+
+# ================================================================
+# Search result lists: one elasticsearch request returning the list fields from _source, against the former
+# two hops - ids from elasticsearch, then the rows from postgres in relevance order
+# ================================================================
+
+SCHEMAS = {
+    'posts': (Post, Post.id, 'id', posts.ReturnPostWithoutContent),
+    'users': (User, User.username, 'username', users.ReturnUserSearch),
+}
+
+
+class OneHop:
+
+    async def search(self, index, query, offset, limit):
+        hits = await search_page(index=index, query=ElasticSearchBackend.match(index, query),
+                                 offset=offset, limit=limit)
+        schema = SCHEMAS[index][3]
+        return [schema(**hit['_source']) for hit in hits]
+
+
+class TwoHops:
+
+    async def search(self, index, query, offset, limit):
+        table, key, field, schema = SCHEMAS[index]
+        response = await elastic.search(index=index, query=ElasticSearchBackend.match(index, query),
+                                        from_=offset, size=limit, source_includes=[field])
+        keys = [hit['_source'][field] for hit in response['hits']['hits']]
+        db = async_session()
+        try:
+            rows = {getattr(row, field): row for row in await db.scalars(select(table).where(key.in_(keys)))}
+        finally:
+            await db.close()
+        return [schema.model_validate(rows[value], from_attributes=True) for value in keys if value in rows]
+
+
+async def sample_queries(index: str,
+                         count: int,
+                         seed: int) -> list[str]:
+    """ Single words of random titles/usernames """
+    table, _, field, _ = SCHEMAS[index]
+    column = Post.title if index == 'posts' else User.username
+    db = async_session()
+    try:
+        texts = (await db.scalars(select(column).order_by(func.random()).limit(count))).all()
+    finally:
+        await db.close()
+    if not texts:
+        raise SystemExit(f'No rows in {table.__tablename__}')
+    random = Random(seed)
+    queries = []
+    while len(queries) < count:
+        words = random.choice(texts).split()
+        if words:
+            queries.append(random.choice(words))
+    return queries
+
+
+async def measure(backend,
+                  index: str,
+                  queries: list[str],
+                  limit: int,
+                  concurrency: int) -> tuple[dict, list[list]]:
+    latencies, results = [], [None] * len(queries)
+    position = iter(range(len(queries)))
+
+    async def run():
+        for number in position:
+            started = perf_counter()
+            results[number] = await backend.search(index=index, query=queries[number], offset=0, limit=limit)
+            latencies.append((perf_counter() - started) * 1000)
+
+    started = perf_counter()
+    await asyncio.gather(*[run() for _ in range(concurrency)])
+    seconds = perf_counter() - started
+    percentiles = quantiles(latencies, n=100)
+    return {'queries/s': round(len(queries) / seconds), 'mean ms': round(mean(latencies), 2),
+            'p50 ms': round(percentiles[49], 2), 'p95 ms': round(percentiles[94], 2),
+            'p99 ms': round(percentiles[98], 2)}, results
+
+
+async def main():
+    parser = ArgumentParser(description='Search lists from elasticsearch only vs elasticsearch + postgres')
+    parser.add_argument('--index', choices=('posts', 'users'), default='posts')
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if args.queries < 1 or args.limit < 1 or args.concurrency < 1:
+        parser.error('--queries, --limit and --concurrency must be at least 1')
+
+    queries = await sample_queries(index=args.index, count=args.queries, seed=args.seed)
+    try:
+        for name, path in (('two hops', TwoHops()), ('one hop', OneHop())):
+            # Warming up caches and connections
+            await measure(path, args.index, queries[:50], args.limit, 1)
+            stats, _ = await measure(path, args.index, queries, args.limit, args.concurrency)
+            print(f'{name}: {stats}')
+    finally:
+        await elastic.close()
+
+
+if __name__ == '__main__':
+    # python -m benchmarks.search_hops [--index posts] [--queries 1000] [--concurrency 8]
+    asyncio.run(main())
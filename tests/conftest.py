@@ -0,0 +1,84 @@
+from tempfile import mkdtemp
+
+import pytest
+import pytest_asyncio
+from fakeredis import FakeAsyncRedis, FakeServer
+from sqlalchemy import MetaData, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.postgres.engine import async_session
+from app.postgres.tables import Base
+
+
+# ================================================================
+# Postgres: a throwaway server (pip install pgserver) with the schema of app/postgres/tables.py,
+# every crud function runs against it through app.postgres.engine.async_session
+# ================================================================
+
+
+def schema(trigram: bool) -> MetaData:
+    """ Copy of the tables, without the pg_trgm indexes when the extension is not available """
+    metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        table = table.to_metadata(metadata)
+        if not trigram:
+            for index in [index for index in table.indexes if index.name.endswith('_trgm')]:
+                table.indexes.discard(index)
+    return metadata
+
+
+@pytest.fixture(scope='session')
+def postgres_url():
+    pgserver = pytest.importorskip('pgserver')
+    server = pgserver.get_server(mkdtemp(), cleanup_mode='delete')
+    yield server.get_uri().replace('postgresql://', 'postgresql+asyncpg://', 1)
+    server.cleanup()
+
+
+@pytest_asyncio.fixture(scope='session')
+async def engine(postgres_url):
+    engine = create_async_engine(url=postgres_url)
+    async with engine.begin() as connection:
+        trigram = await connection.scalar(
+            text("SELECT EXISTS (SELECT FROM pg_available_extensions WHERE name = 'pg_trgm')")
+        )
+        if trigram:
+            await connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        await connection.run_sync(schema(trigram).create_all)
+
+    async_session.configure(bind=engine)
+    yield engine
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def db(engine):
+    """ Session of a test, tables are emptied after it """
+    session = async_session()
+    try:
+        yield session
+    finally:
+        await session.close()
+        async with engine.begin() as connection:
+            tables = ', '.join(f'"{table.name}"' for table in Base.metadata.sorted_tables)
+            await connection.execute(text(f'TRUNCATE {tables} RESTART IDENTITY CASCADE'))
+
+
+# ================================================================
+# Redis: in-process fake with lua scripting (pip install fakeredis[lua])
+# ================================================================
+
+
+@pytest.fixture
+def redis_server():
+    """ Clients made with this server share data and pub/sub, like clients of one redis """
+    return FakeServer()
+
+
+@pytest_asyncio.fixture
+async def redis(redis_server):
+    redis = FakeAsyncRedis(server=redis_server, decode_responses=True)
+    try:
+        yield redis
+    finally:
+        await redis.aclose()
@@ -0,0 +1,149 @@
+import socket
+
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+from aiosmtplib import SMTP
+
+from app.redis.emails import DEAD, RETRIES, create_group, enqueue_email, read_emails, get_email_queue_depth
+from app.workers.email_sender import send_batch
+
+
+# ================================================================
+# Email worker against a local smtp server (aiosmtpd): recipients starting with the reply code
+# are refused on RCPT with that code, e.g. 550-nobody@example.com
+# ================================================================
+
+
+class Handler:
+    def __init__(self):
+        self.delivered = []
+        self.peers = set()
+        # Connections to drop on MAIL, like a server closing an idle connection
+        self.drops = 0
+
+    async def handle_MAIL(self, server, session, envelope, address, mail_options):
+        if self.drops:
+            self.drops -= 1
+            server.transport.close()
+            return '421 Closing connection'
+        envelope.mail_from = address
+        return '250 OK'
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        code = address.split('-', 1)[0]
+        if code.isdigit():
+            return f'{code} Refused'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        self.delivered.extend(envelope.rcpt_tos)
+        self.peers.add(session.peer)
+        return '250 OK'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def refuse_login(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=False, handled=False)
+
+
+@pytest.fixture
+def handler():
+    return Handler()
+
+
+@pytest.fixture
+def smtp_server(handler):
+    controller = Controller(handler, hostname='127.0.0.1', port=free_port())
+    controller.start()
+    yield controller
+    controller.stop()
+
+
+@pytest.fixture
+async def smtp(smtp_server):
+    smtp = SMTP(hostname=smtp_server.hostname, port=smtp_server.port, start_tls=False, use_tls=False, timeout=5)
+    yield smtp
+    smtp.close()
+
+
+async def send(redis, smtp, *recipients: str) -> dict[str, int]:
+    await create_group(redis=redis)
+    for recipient in recipients:
+        await enqueue_email(redis=redis, recipients=[recipient], subject='Subject', body='<p>Body</p>')
+    batch = await read_emails(redis=redis, consumer='test', count=len(recipients), block_ms=100, claim_idle_ms=60_000)
+    await send_batch(redis=redis, smtp=smtp, batch=batch)
+    return await get_email_queue_depth(redis=redis)
+
+
+async def test_batch_is_sent_over_one_connection(redis, smtp, handler):
+    recipients = [f'user{number}@example.com' for number in range(5)]
+    depth = await send(redis, smtp, *recipients)
+
+    assert handler.delivered == recipients
+    assert len(handler.peers) == 1
+    assert depth == {'outbox': 0, 'retries': 0, 'dead': 0}
+
+
+@pytest.mark.parametrize('code', [550, 553])
+async def test_rejected_recipient_is_dead_lettered(redis, smtp, handler, code):
+    depth = await send(redis, smtp, f'{code}-nobody@example.com', 'user@example.com')
+
+    assert handler.delivered == ['user@example.com']
+    assert depth == {'outbox': 0, 'retries': 0, 'dead': 1}
+
+
+@pytest.mark.parametrize('code', [450, 452, 554])
+async def test_other_refusals_are_retried(redis, smtp, handler, code):
+    depth = await send(redis, smtp, f'{code}-busy@example.com', 'user@example.com')
+
+    assert handler.delivered == ['user@example.com']
+    assert depth == {'outbox': 0, 'retries': 1, 'dead': 0}
+    [message] = await redis.zrange(RETRIES, 0, -1)
+    assert '"attempts": 1' in message
+
+
+async def test_identical_emails_are_retried_separately(redis, smtp, handler):
+    depth = await send(redis, smtp, '450-busy@example.com', '450-busy@example.com')
+
+    assert depth == {'outbox': 0, 'retries': 2, 'dead': 0}
+
+
+async def test_refused_login_is_retried(redis, handler):
+    controller = Controller(handler, hostname='127.0.0.1', port=free_port(),
+                            authenticator=refuse_login, auth_require_tls=False)
+    controller.start()
+    smtp = SMTP(hostname=controller.hostname, port=controller.port, username='user', password='wrong',
+                start_tls=False, use_tls=False, timeout=5)
+    try:
+        depth = await send(redis, smtp, 'user1@example.com', 'user2@example.com')
+    finally:
+        smtp.close()
+        controller.stop()
+
+    assert handler.delivered == []
+    assert depth == {'outbox': 0, 'retries': 2, 'dead': 0}
+
+
+async def test_dropped_connection_is_reopened_without_an_attempt(redis, smtp, handler):
+    await smtp.connect()
+    handler.drops = 1
+    depth = await send(redis, smtp, 'user1@example.com', 'user2@example.com')
+
+    assert handler.delivered == ['user1@example.com', 'user2@example.com']
+    assert depth == {'outbox': 0, 'retries': 0, 'dead': 0}
+
+
+async def test_connection_dropped_again_is_retried(redis, smtp, handler):
+    handler.drops = 2
+    depth = await send(redis, smtp, 'user1@example.com', 'user2@example.com')
+
+    assert handler.delivered == ['user2@example.com']
+    assert depth == {'outbox': 0, 'retries': 1, 'dead': 0}
+    assert not await redis.xlen(DEAD)
@@ -0,0 +1,115 @@
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event, text
+
+from app.postgres import crud
+from app.postgres.tables import User, Post, Like
+from app.services.deletion import delete_post, delete_user
+
+
+# ================================================================
+# Hot queries must be served by the indexes of alembic revision a3c5e91f0d42: the statements run by
+# crud/deletion are captured and explained with sequential scans disabled, so the planner only falls
+# back to one when no index matches the query shape (tables of a test are too small to tell otherwise)
+# ================================================================
+
+
+@asynccontextmanager
+async def captured(engine):
+    statements = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        if not executemany and not statement.lstrip().upper().startswith(('INSERT INTO', 'BEGIN', 'COMMIT')):
+            statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', capture)
+
+
+async def explain(engine, statements) -> list[str]:
+    plans = []
+    async with engine.connect() as connection:
+        await connection.execute(text('SET enable_seqscan = off'))
+        for statement, parameters in statements:
+            result = await connection.exec_driver_sql(f'EXPLAIN {statement}', parameters)
+            plans.append('\n'.join(row[0] for row in result))
+        await connection.rollback()
+    return plans
+
+
+def assert_indexed(plans: list[str], *indexes: str):
+    for plan in plans:
+        assert 'Seq Scan' not in plan, plan
+    for index in indexes:
+        assert any(index in plan for plan in plans), f'{index} is not used:\n' + '\n\n'.join(plans)
+
+
+@pytest.fixture
+async def post(db):
+    user = User(username='author', email='author@example.com', hashed_password='-', likes=0, role='moderator')
+    db.add(user)
+    await db.flush()
+    post = Post(owner_UUID=user.UUID, owner_username=user.username, title='title', content='content',
+                created_at=datetime(2026, 1, 1), likes=0)
+    db.add(post)
+    await db.commit()
+    return post
+
+
+async def test_feed(engine, post):
+    async with captured(engine) as statements:
+        await crud.get_posts_without_search_query(offset=3, limit=10)
+        await crud.get_posts_without_search_query(offset=0, limit=10, after=(5, datetime(2026, 1, 1), 10))
+    assert_indexed(await explain(engine, statements), 'ix_posts_likes_created_at_id')
+
+
+async def test_posts_of_user(engine, post):
+    async with captured(engine) as statements:
+        await crud.get_posts_user(user_id=post.owner_UUID, offset=0, limit=10)
+        await crud.get_posts_user(user_id=post.owner_UUID, offset=0, limit=10,
+                                  after=(5, datetime(2026, 1, 1), 10))
+    assert_indexed(await explain(engine, statements), 'ix_posts_owner_UUID_likes_created_at_id')
+
+    async with captured(engine) as statements:
+        await crud.get_posts_by_username(username=post.owner_username, offset=0, limit=10)
+        await crud.get_posts_by_username(username=post.owner_username, offset=0, limit=10,
+                                         after=(5, datetime(2026, 1, 1), 10))
+    assert_indexed(await explain(engine, statements), 'ix_posts_owner_username_likes_created_at_id')
+
+
+async def test_users_listings(engine, post):
+    async with captured(engine) as statements:
+        await crud.get_users_without_search_query(offset=0, limit=10)
+    assert_indexed(await explain(engine, statements), 'ix_users_likes')
+
+    async with captured(engine) as statements:
+        await crud.get_users_by_role(role='moderator', offset=0, limit=10)
+    assert_indexed(await explain(engine, statements), 'ix_users_role_likes')
+
+
+@pytest.mark.parametrize('toggle, indexes', [(crud.toggle_like, ()),
+                                              (crud.toggle_like_row, ('ix_like_deltas_post_id',))])
+async def test_toggle_like(engine, db, post, toggle, indexes):
+    async with captured(engine) as statements:
+        await toggle(db=db, user_id=post.owner_UUID, post_id=post.id)
+    await db.rollback()
+    assert_indexed(await explain(engine, statements), 'uq_likes_user_UUID_post_id', *indexes)
+
+
+async def test_delete_likes(engine, db, redis, post):
+    db.add(Like(user_UUID=post.owner_UUID, post_id=post.id))
+    await db.commit()
+
+    async with captured(engine) as statements:
+        await delete_post(db=db, redis=redis, post=post)
+    assert_indexed(await explain(engine, statements), 'ix_likes_post_id')
+
+    user = await db.get(User, post.owner_UUID)
+    async with captured(engine) as statements:
+        await delete_user(db=db, redis=redis, user=user)
+    assert_indexed(await explain(engine, statements), 'ix_likes_post_id', 'uq_likes_user_UUID_post_id')
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+from time import time
+
+import pytest
+
+from app.config import Config
+from app.security import JWT
+from app.security.JWT import JWT_BACKENDS, InvalidToken, decode_token
+
+
+# ================================================================
+# JWT backends and the cache of verified tokens
+# ================================================================
+
+
+@pytest.fixture(params=list(JWT_BACKENDS))
+def backend(request, monkeypatch):
+    try:
+        backend = JWT_BACKENDS[request.param]()
+    except ImportError:
+        pytest.skip(f'{request.param} is not installed')
+    monkeypatch.setattr(JWT, 'jwt_backend', backend)
+    monkeypatch.setattr(JWT, 'verified_tokens', type(JWT.verified_tokens)())
+    return backend
+
+
+def token(backend, minutes: int = 30, sub: str = 'user') -> str:
+    return backend.encode({'sub': sub, 'exp': datetime.utcnow() + timedelta(minutes=minutes)})
+
+
+def test_backend_round_trip(backend):
+    assert backend.decode(token(backend))['sub'] == 'user'
+
+    with pytest.raises(InvalidToken):
+        backend.decode(token(backend, minutes=-1))
+    with pytest.raises(InvalidToken):
+        backend.decode(token(backend)[:-2] + 'xx')
+
+
+def test_verified_token_is_cached(backend, monkeypatch):
+    encoded = token(backend)
+    assert decode_token(encoded)['sub'] == 'user'
+
+    # A cache hit does not verify the token again
+    monkeypatch.setattr(backend, 'decode', None)
+    assert decode_token(encoded)['sub'] == 'user'
+    assert len(JWT.verified_tokens) == 1
+
+
+def test_invalid_token_is_not_cached(backend):
+    with pytest.raises(InvalidToken):
+        decode_token(token(backend)[:-2] + 'xx')
+    assert not JWT.verified_tokens
+
+
+def test_cached_token_expires(backend):
+    encoded = token(backend)
+    claims = decode_token(encoded)
+    [digest] = JWT.verified_tokens
+    JWT.verified_tokens[digest] = (time() - 1, claims)
+
+    with pytest.raises(InvalidToken):
+        decode_token(encoded)
+    assert not JWT.verified_tokens
+
+
+def test_least_recently_used_are_evicted(backend, monkeypatch):
+    monkeypatch.setattr(Config, 'jwt_cache_size', 2)
+    first, second, third = [token(backend, sub=sub) for sub in ('first', 'second', 'third')]
+    decode_token(first)
+    decode_token(second)
+    # Using first makes second the least recently used one
+    decode_token(first)
+    decode_token(third)
+
+    assert [claims['sub'] for _, claims in JWT.verified_tokens.values()] == ['first', 'third']
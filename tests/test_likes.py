@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+
+from app.postgres.crud import toggle_like
+from app.postgres.engine import async_session
+from app.postgres.tables import Like, Post, User
+
+
+# ================================================================
+# Like toggling: one statement per like, counters of post and owner never drift from the like rows
+# ================================================================
+
+
+@pytest.fixture
+async def users(db):
+    users = [User(username=f'user{number}', email=f'user{number}@example.com', hashed_password='-', likes=0)
+             for number in range(10)]
+    db.add_all(users)
+    await db.flush()
+    db.add(Post(owner_UUID=users[0].UUID, owner_username=users[0].username, title='title', content='content',
+                likes=0))
+    await db.commit()
+    return users
+
+
+async def toggle(user_id, post_id: int):
+    db = async_session()
+    try:
+        post = await toggle_like(db=db, user_id=user_id, post_id=post_id)
+        await db.commit()
+        return post
+    finally:
+        await db.close()
+
+
+async def counters(db) -> tuple[int, int, int]:
+    rows = await db.scalar(select(func.count()).select_from(Like))
+    post_likes = await db.scalar(select(Post.likes))
+    owner_likes = await db.scalar(select(func.max(User.likes)))
+    return rows, post_likes, owner_likes
+
+
+async def test_like_and_unlike(db, users):
+    post_id = await db.scalar(select(Post.id))
+
+    liked = await toggle(user_id=users[1].UUID, post_id=post_id)
+    assert (liked.delta, liked.likes, liked.owner_likes) == (1, 1, 1)
+    unliked = await toggle(user_id=users[1].UUID, post_id=post_id)
+    assert (unliked.delta, unliked.likes, unliked.owner_likes) == (-1, 0, 0)
+    assert await counters(db) == (0, 0, 0)
+
+
+async def test_missing_post(db, users):
+    assert await toggle(user_id=users[1].UUID, post_id=1000) is None
+    assert await counters(db) == (0, 0, 0)
+
+
+async def test_concurrent_toggles_keep_counters(db, users):
+    post_id = await db.scalar(select(Post.id))
+
+    # Requests of one user race with each other too, so which likes are left is not known
+    await asyncio.gather(*[toggle(user_id=user.UUID, post_id=post_id) for user in users * 3])
+
+    rows, post_likes, owner_likes = await counters(db)
+    assert rows == post_likes == owner_likes
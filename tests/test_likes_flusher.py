@@ -0,0 +1,152 @@
+import asyncio
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import func, select
+
+from app.config import Config
+from app.main import app
+from app.postgres import crud
+from app.postgres.crud import toggle_like_row
+from app.postgres.engine import async_session
+from app.postgres.tables import Like, LikeDelta, Post, SearchOutbox, User
+from app.redis.engine import get_redis
+from app.routers import posts as posts_router
+from app.security.JWT import create_access_token
+from app.workers import likes_flusher
+from app.workers.likes_flusher import flush
+
+
+# ================================================================
+# Write-behind likes: deltas are recorded in postgres with the like rows and applied to post and owner
+# likes in batches exactly once, a failure on either side leaves them pending
+# ================================================================
+
+
+@pytest.fixture
+async def post(db):
+    user = User(username='author', email='author@example.com', hashed_password='-', likes=5)
+    db.add(user)
+    await db.flush()
+    post = Post(owner_UUID=user.UUID, owner_username=user.username, title='title', content='content', likes=3)
+    db.add(post)
+    await db.commit()
+    return post
+
+
+@pytest.fixture
+async def likers(db):
+    users = [User(username=f'liker{number}', email=f'liker{number}@example.com', hashed_password='-', likes=0)
+             for number in range(5)]
+    db.add_all(users)
+    await db.commit()
+    return [user.UUID for user in users]
+
+
+async def toggle(user_id, post_id: int):
+    db = async_session()
+    try:
+        post = await toggle_like_row(db=db, user_id=user_id, post_id=post_id)
+        await db.commit()
+        return post
+    finally:
+        await db.close()
+
+
+async def likes(db, post_id: int) -> tuple[int, int]:
+    db.expire_all()
+    post = await db.get(Post, post_id)
+    return post.likes, (await db.get(User, post.owner_UUID)).likes
+
+
+async def pending(db) -> int:
+    return await db.scalar(select(func.count()).select_from(LikeDelta))
+
+
+async def test_flush_applies_aggregated_deltas(db, redis, post, likers):
+    post_id = post.id
+    for user_id in likers[:3]:
+        await toggle(user_id=user_id, post_id=post_id)
+    unliked = await toggle(user_id=likers[0], post_id=post_id)
+    # Likes of the response include the deltas not flushed yet
+    assert (unliked.delta, unliked.likes, unliked.pending) == (-1, 3, 2)
+
+    await flush(redis=redis)
+
+    assert await likes(db, post_id) == (5, 7)
+    assert await pending(db) == 0
+    # Likes of the documents are synced through the search outbox
+    outbox = await db.scalars(select(SearchOutbox))
+    assert {(row.index_name, row.payload['fields']['likes']) for row in outbox} == {('posts', 5), ('users', 7)}
+
+    # Nothing left to flush
+    await flush(redis=redis)
+    assert await likes(db, post_id) == (5, 7)
+
+
+async def test_failure_after_commit_converges(db, redis, post, likers, monkeypatch):
+    post_id = post.id
+    monkeypatch.setattr(Config, 'likes_write_behind', True)
+
+    async def fail(**kwargs):
+        raise ConnectionError('redis is down')
+
+    # Request fails after the like row and its delta were committed
+    monkeypatch.setattr(posts_router, 'incr_post_likes', fail)
+    app.dependency_overrides[get_redis] = lambda: redis
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url='http://test') as client:
+            client.cookies.set('Access', await create_access_token(user_uuid=likers[0]))
+            with pytest.raises(ConnectionError):
+                await client.put(f'/posts/{post_id}/like')
+    finally:
+        app.dependency_overrides.clear()
+
+    await flush(redis=redis)
+
+    rows = await db.scalar(select(func.count()).select_from(Like))
+    assert rows == 1
+    assert await likes(db, post_id) == (3 + rows, 5 + rows)
+
+
+async def test_failed_flush_leaves_deltas_pending(db, redis, post, likers, monkeypatch):
+    post_id = post.id
+    await toggle(user_id=likers[0], post_id=post_id)
+
+    def fail(**kwargs):
+        raise ConnectionError('postgres is down')
+
+    monkeypatch.setattr(crud, 'enqueue_update', fail)
+    with pytest.raises(ConnectionError):
+        await flush(redis=redis)
+    assert await likes(db, post_id) == (3, 5)
+    assert await pending(db) == 1
+
+    monkeypatch.undo()
+    await flush(redis=redis)
+    assert await likes(db, post_id) == (4, 6)
+    assert await pending(db) == 0
+
+
+async def test_concurrent_flushes_apply_deltas_once(db, redis, post, likers):
+    post_id = post.id
+    for user_id in likers:
+        await toggle(user_id=user_id, post_id=post_id)
+
+    await asyncio.gather(*[flush(redis=redis) for _ in range(3)])
+    await flush(redis=redis)
+
+    assert await likes(db, post_id) == (8, 10)
+    assert await pending(db) == 0
+
+
+async def test_flush_takes_deltas_in_batches(db, redis, post, likers, monkeypatch):
+    post_id = post.id
+    monkeypatch.setattr(likes_flusher, 'BATCH_SIZE', 2)
+    for user_id in likers:
+        await toggle(user_id=user_id, post_id=post_id)
+
+    await flush(redis=redis)
+
+    assert await likes(db, post_id) == (8, 10)
+    assert await pending(db) == 0
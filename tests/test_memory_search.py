@@ -0,0 +1,111 @@
+import pytest
+from fastapi import HTTPException
+
+from app.postgres.tables import Post, User
+from app.search.memory import MAX_GRAM, InvertedIndex, MemorySearchBackend, analyze
+
+
+# ================================================================
+# In-memory search backend: analysis like custom_analyzer, BM25 ranking, pagination and suggestions
+# ================================================================
+
+
+def post(number: int, title: str, likes: int = 0) -> tuple[str, dict]:
+    return str(number), {'id': number, 'owner_UUID': 'owner', 'owner_username': 'owner', 'title': title,
+                         'created_at': '2026-01-01T00:00:00', 'likes': likes}
+
+
+@pytest.fixture
+def backend():
+    backend = MemorySearchBackend()
+    backend.apply([('index', 'posts', *post(1, 'Python async tips')),
+                   ('index', 'posts', *post(2, 'Python python tips')),
+                   ('index', 'posts', *post(3, 'Gardening for beginners')),
+                   ('index', 'posts', *post(4, 'Pythonic code tips')),
+                   ('index', 'users', 'uuid-1', {'username': 'alice', 'about_me': None, 'likes': 1}),
+                   ('index', 'users', 'uuid-2', {'username': 'alina', 'about_me': None, 'likes': 2}),
+                   ('index', 'users', 'uuid-3', {'username': 'bob', 'about_me': None, 'likes': 3})])
+    return backend
+
+
+def test_analyze_like_edge_ngram_analyzer():
+    assert analyze('Hello, World') == ['he', 'hel', 'hell', 'hello', 'wo', 'wor', 'worl', 'world']
+    # Original token is kept when it is longer than MAX_GRAM or shorter than the first gram
+    long = 'a' * (MAX_GRAM + 2)
+    assert analyze(f'x {long}') == ['x', *[long[:size] for size in range(2, MAX_GRAM + 1)], long]
+
+
+async def test_search_ranks_by_score(backend):
+    found = await backend.search(index='posts', query='python', offset=0, limit=10)
+
+    # Title with the term twice first, then the shorter title, prefix matches of longer words included
+    assert [result['id'] for result in found] == [2, 1, 4]
+    assert found[0] == post(2, 'Python python tips')[1]
+    assert await backend.search(index='posts', query='python', offset=1, limit=1) == [found[1]]
+    assert await backend.search(index='posts', query='rust', offset=0, limit=10) == []
+
+
+async def test_updates_and_deletes(backend):
+    backend.apply([('update', 'posts', '3', {'title': 'Python for gardeners'}),
+                   ('update', 'posts', '1', {'likes': 10}),
+                   ('delete', 'posts', '2', None),
+                   ('update', 'posts', '100', {'likes': 1})])
+
+    found = await backend.search(index='posts', query='python', offset=0, limit=10)
+    assert sorted(result['id'] for result in found) == [1, 3, 4]
+    assert next(result['likes'] for result in found if result['id'] == 1) == 10
+    assert await backend.search(index='posts', query='gardening', offset=0, limit=10) == []
+
+
+def test_compact_keeps_live_documents():
+    index = InvertedIndex(field='title', key='id', key_type=int)
+    for number in range(3000):
+        index.put(*post(number, f'title {number}'))
+    for number in range(2900):
+        index.delete(str(number))
+
+    # Tombstones outnumbered live documents, so the index was rebuilt
+    assert index.live == 100
+    assert len(index.documents) < 2000
+    assert set(index.scores('title')) == {index.numbers[str(number)] for number in range(2900, 3000)}
+
+
+async def test_search_after_pages_every_result_once(backend):
+    pages, cursor = [], []
+    while cursor is not None:
+        found, cursor = await backend.search_after(index='posts', query='python async', limit=1, cursor=cursor)
+        pages.extend(result['id'] for result in found)
+
+    everything = await backend.search(index='posts', query='python async', offset=0, limit=10)
+    assert pages == [result['id'] for result in everything]
+
+
+@pytest.mark.parametrize('cursor', [['elasticsearch', 1.0, 1], ['memory', 'score', 1], ['memory']])
+async def test_invalid_cursor(backend, cursor):
+    with pytest.raises(HTTPException) as error:
+        await backend.search_after(index='posts', query='python', limit=1, cursor=cursor)
+    assert error.value.status_code == 400
+
+
+async def test_suggest(backend):
+    assert await backend.suggest(index='users', prefix='Ali', limit=10) == [('uuid-1', 'alice'), ('uuid-2', 'alina')]
+    assert await backend.suggest(index='users', prefix='alin', limit=10) == [('uuid-2', 'alina')]
+    assert await backend.suggest(index='posts', prefix='Async py', limit=10) == [('1', 'Python async tips')]
+
+
+async def test_load_from_postgres(db):
+    user = User(username='author', email='author@example.com', hashed_password='-', likes=4)
+    db.add(user)
+    await db.flush()
+    db.add(Post(owner_UUID=user.UUID, owner_username=user.username, title='Loaded from postgres',
+                content='content', likes=2))
+    await db.commit()
+
+    backend = MemorySearchBackend()
+    await backend.load()
+
+    [found] = await backend.search(index='posts', query='postgres', offset=0, limit=10)
+    assert (found['title'], found['owner_UUID'], found['likes']) == ('Loaded from postgres', str(user.UUID), 2)
+    assert await backend.search(index='users', query='author', offset=0, limit=10) == [
+        {'username': 'author', 'about_me': None, 'likes': 4}
+    ]
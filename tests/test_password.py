@@ -0,0 +1,68 @@
+import asyncio
+from time import perf_counter, sleep
+
+import pytest
+from fastapi import HTTPException
+from httpx import ASGITransport, AsyncClient
+
+from app.config import Config
+from app.main import app
+from app.postgres.tables import User
+from app.security.password import hash_slots, run_hashing
+
+
+# ================================================================
+# Hashing pool: calls run in threads next to the event loop, over its capacity they wait
+# at most PASSWORD_HASH_QUEUE_TIMEOUT_MS and are rejected with 503
+# ================================================================
+
+
+@pytest.fixture
+def queue_timeout(monkeypatch):
+    monkeypatch.setattr(Config, 'password_hash_queue_timeout_ms', 50)
+
+
+async def test_hashing_does_not_block_event_loop():
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker = asyncio.create_task(tick())
+    started = perf_counter()
+    await asyncio.gather(*[run_hashing(sleep, 0.2) for _ in range(Config.password_hash_workers)])
+    elapsed = perf_counter() - started
+    ticker.cancel()
+
+    # Calls ran in parallel and the loop kept ticking meanwhile
+    assert elapsed < 0.4
+    assert ticks >= 10
+
+
+async def test_calls_over_capacity_are_rejected(queue_timeout):
+    results = await asyncio.gather(*[run_hashing(sleep, 0.2) for _ in range(Config.password_hash_workers + 2)],
+                                   return_exceptions=True)
+
+    rejected = [result for result in results if isinstance(result, HTTPException)]
+    assert len(rejected) == 2
+    assert all(error.status_code == 503 and error.headers == {'Retry-After': '1'} for error in rejected)
+
+
+async def test_login_returns_503_when_pool_is_full(db, queue_timeout):
+    db.add(User(username='user', email='user@example.com', hashed_password='$2b$04$' + 'a' * 53))
+    await db.commit()
+
+    for _ in range(Config.password_hash_workers):
+        await hash_slots.acquire()
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url='http://test') as client:
+            response = await client.post('/auth/login', data={'username': 'user', 'password': 'password'})
+    finally:
+        for _ in range(Config.password_hash_workers):
+            hash_slots.release()
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
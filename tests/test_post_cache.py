@@ -0,0 +1,61 @@
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import update
+
+from app.main import app
+from app.postgres.tables import Post, User
+from app.redis.cache import get_post_page, invalidate_posts, post_key, set_post_page
+from app.redis.engine import get_redis
+
+
+# ================================================================
+# Cached full posts: invalidated after commit, reads that started before the change never refill them
+# ================================================================
+
+
+@pytest.fixture
+async def post(db):
+    user = User(username='author', email='author@example.com', hashed_password='-', likes=0)
+    db.add(user)
+    await db.flush()
+    post = Post(owner_UUID=user.UUID, owner_username=user.username, title='title', content='content', likes=0)
+    db.add(post)
+    await db.commit()
+    return post
+
+
+@pytest.fixture
+async def client(redis):
+    app.dependency_overrides[get_redis] = lambda: redis
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url='http://test') as client:
+            yield client
+    finally:
+        app.dependency_overrides.clear()
+
+
+async def test_read_started_before_invalidation_is_not_cached(redis):
+    await invalidate_posts(redis=redis, post_ids=[1])
+    await set_post_page(redis=redis, post_id=1, content='stale', etag='"stale"', time=60)
+
+    assert await get_post_page(redis=redis, post_id=1) == {}
+
+
+async def test_open_post_after_change(db, redis, client, post):
+    post_id = post.id
+    response = await client.get(f'/posts/{post_id}')
+    assert response.json()['title'] == 'title'
+    assert (await get_post_page(redis=redis, post_id=post_id))['etag'] == response.headers['ETag']
+
+    await db.execute(update(Post).where(Post.id == post_id).values(title='changed'))
+    await db.commit()
+    await invalidate_posts(redis=redis, post_ids=[post_id])
+
+    # Served from postgres while the tombstone lasts, cached again after it expires
+    response = await client.get(f'/posts/{post_id}')
+    assert response.json()['title'] == 'changed'
+    assert await get_post_page(redis=redis, post_id=post_id) == {}
+
+    await redis.delete(post_key(post_id))
+    await client.get(f'/posts/{post_id}')
+    assert (await get_post_page(redis=redis, post_id=post_id))['etag'] == response.headers['ETag']
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from app.postgres.crud import toggle_like_row
+from app.postgres.tables import Post, User
+from app.redis import ranking
+from app.redis.ranking import RANKING, REBUILDING, rebuild_ranking
+
+
+# ================================================================
+# Ranking rebuild: posts are ranked with the likes not flushed yet, the marker of a long rebuild
+# is kept alive and a rebuild that lost it never swaps its ranking in
+# ================================================================
+
+
+@pytest.fixture
+async def posts(db):
+    user = User(username='author', email='author@example.com', hashed_password='-', likes=0)
+    db.add(user)
+    await db.flush()
+    posts = [Post(owner_UUID=user.UUID, owner_username=user.username, title=f'title {number}',
+                  content=f'content {number}', likes=number) for number in range(3)]
+    db.add_all(posts)
+    await db.commit()
+    return [(post.id, user.UUID) for post in posts]
+
+
+def slowed(seconds: float):
+    rank_posts = ranking.rank_posts
+
+    async def slow(**kwargs):
+        await asyncio.sleep(seconds)
+        return await rank_posts(**kwargs)
+    return slow
+
+
+async def scores(redis) -> list[tuple[int, int]]:
+    return [(ranking.ranking_post_id(member), int(score))
+            for member, score in await redis.zrevrange(RANKING, 0, -1, withscores=True)]
+
+
+async def test_rebuild_includes_pending_likes(db, redis, posts):
+    (first, owner), (second, _), (third, _) = posts
+    # Write-behind like of the first post, not flushed yet
+    await toggle_like_row(db=db, user_id=owner, post_id=first)
+    await db.commit()
+
+    assert await rebuild_ranking(redis=redis, batch_size=1) == 3
+    assert await scores(redis) == [(third, 2), (second, 1), (first, 1)]
+    assert not await redis.exists(REBUILDING)
+
+
+async def test_long_rebuild_keeps_its_marker(redis, posts, monkeypatch):
+    monkeypatch.setattr(ranking, 'REBUILD_TTL_SECONDS', 1)
+    monkeypatch.setattr(ranking, 'rank_posts', slowed(0.4))
+
+    # Longer than the TTL of the marker, one batch per post
+    assert await rebuild_ranking(redis=redis, batch_size=1) == 3
+    assert len(await scores(redis)) == 3
+
+
+async def test_rebuild_that_lost_its_marker_is_aborted(redis, posts, monkeypatch):
+    rank_posts = ranking.rank_posts
+
+    async def expire(**kwargs):
+        await redis.delete(REBUILDING)
+        return await rank_posts(**kwargs)
+
+    monkeypatch.setattr(ranking, 'rank_posts', expire)
+    with pytest.raises(RuntimeError):
+        await rebuild_ranking(redis=redis, batch_size=1)
+    assert await redis.keys('ranking:*') == []
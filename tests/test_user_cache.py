@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import event, update
+from fakeredis import FakeAsyncRedis
+
+from app.main import app
+from app.postgres.tables import User
+from app.redis.cache import invalidate_users
+from app.redis.engine import get_redis
+from app.schemas import users
+from app.security import user_cache
+from app.security.JWT import create_access_token
+from app.security.user_cache import get_user_identity_cached, local_users, run_user_cache_invalidation
+
+
+# ================================================================
+# Identity of authenticated users: process cache, then redis, then postgres; invalidated in every process
+# ================================================================
+
+
+@pytest.fixture(autouse=True)
+def clear_local_users():
+    local_users.clear()
+    yield
+    local_users.clear()
+
+
+@pytest.fixture
+async def user(db):
+    user = User(username='user', email='user@example.com', hashed_password='-', role='user')
+    db.add(user)
+    await db.commit()
+    return user
+
+
+@pytest.fixture
+async def client(redis):
+    app.dependency_overrides[get_redis] = lambda: redis
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url='http://test') as client:
+            yield client
+    finally:
+        app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def queries(engine):
+    """ Number of statements sent to postgres so far """
+    count = [0]
+
+    def counter(*args):
+        count[0] += 1
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', counter)
+    yield lambda: count[0]
+    event.remove(engine.sync_engine, 'before_cursor_execute', counter)
+
+
+async def test_queries_per_authenticated_request(client, user, queries):
+    access_token = await create_access_token(user_uuid=user.UUID)
+
+    counts = []
+    for _ in range(3):
+        # Logout drops the cookie of the client
+        client.cookies.set('Access', access_token)
+        before = queries()
+        response = await client.post('/auth/logout')
+        assert response.status_code == 200
+        counts.append(queries() - before)
+    # Only the first request of the user reads postgres
+    assert counts == [1, 0, 0]
+
+    # Another process (empty process cache) finds the identity in redis
+    local_users.clear()
+    client.cookies.set('Access', access_token)
+    before = queries()
+    await client.post('/auth/logout')
+    assert queries() - before == 0
+
+
+async def test_invalidation_reaches_every_process(db, redis, redis_server, user, monkeypatch):
+    monkeypatch.setattr(user_cache, 'create_redis', lambda: FakeAsyncRedis(server=redis_server, decode_responses=True))
+    listener = asyncio.create_task(run_user_cache_invalidation())
+    try:
+        await asyncio.sleep(0.1)
+        identity = await get_user_identity_cached(redis=redis, user_uuid=str(user.UUID))
+        assert identity.role == 'user'
+
+        await db.execute(update(User).where(User.UUID == user.UUID).values(role='moderator'))
+        await db.commit()
+        await invalidate_users(redis=redis, user_uuids=[user.UUID])
+        for _ in range(50):
+            if local_users.get(str(user.UUID)) is None:
+                break
+            await asyncio.sleep(0.01)
+
+        identity = await get_user_identity_cached(redis=redis, user_uuid=str(user.UUID))
+        assert identity.role == 'moderator'
+    finally:
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+
+
+def test_read_started_before_invalidation_is_not_cached(user):
+    identity = users.UserIdentity(UUID=user.UUID, username='old name', role='user')
+    generation = local_users.generation
+    local_users.invalidate(user_uuids=[str(user.UUID)])
+
+    local_users.set(user_uuid=str(user.UUID), identity=identity, generation=generation)
+    assert local_users.get(str(user.UUID)) is None